@@ -0,0 +1,87 @@
+import dataclasses
+import hashlib
+import json
+import os.path
+
+import commits_periodical.data
+import commits_periodical.model
+import commits_periodical.utils
+
+
+@dataclasses.dataclass
+class ReportAggregate:
+    """The small facts about a report which are needed by the index page and
+    the announcement, without loading the report or its commits.
+    """
+
+    # sha256 of the report's TOML file when this was computed
+    digest: str
+    total_commits: int
+    # Number of entries in each category
+    categories: dict[str, int]
+    highlighted: list[str]
+    stats: dict
+    # utils.file_stamp() of the report's TOML file when this was computed;
+    # the digest is only checked if the file's stamp has changed
+    stamp: list[int] = dataclasses.field(default_factory=list)
+
+    @classmethod
+    def from_model(cls, model, digest=""):
+        highlight = model.get_section("highlight")
+        highlighted = []
+        if highlight:
+            highlighted = [item.summary for item in highlight.items]
+        return cls(
+            digest=digest,
+            total_commits=model.total_commits,
+            categories={
+                section.cat: section.num
+                for section in model.sections
+                if section.cat != "highlight"
+            },
+            highlighted=highlighted,
+            stats=dataclasses.asdict(model.stats),
+        )
+
+
+def get_filename(report_filename):
+    return report_filename.replace(".toml", ".aggregate.json")
+
+
+def get_digest(report_filename):
+    with open(report_filename, "rb") as fp:
+        return hashlib.sha256(fp.read()).hexdigest()
+
+
+def load(report_filename):
+    """Get the report's aggregate, or None if it's missing or out of date."""
+    filename = get_filename(report_filename)
+    if not os.path.exists(report_filename) or not os.path.exists(filename):
+        return None
+    with open(filename, encoding="utf8") as fp:
+        aggregate = ReportAggregate(**json.load(fp))
+    stamp = list(commits_periodical.utils.file_stamp(report_filename))
+    if aggregate.stamp == stamp:
+        return aggregate
+    if aggregate.digest != get_digest(report_filename):
+        return None
+    return aggregate
+
+
+def update_aggregate(repo, report_filename, project, index_entry, name):
+    """Write the aggregate for a (just saved) report."""
+    # Re-read the report, to see exactly what was saved
+    doc = commits_periodical.data.Report(report_filename)
+    model = commits_periodical.model.build_model(
+        repo, doc, project, index_entry, name, None, False
+    )
+    # If the file changes after this, the stamp won't match and the digest
+    # won't either
+    stamp = list(commits_periodical.utils.file_stamp(report_filename))
+    aggregate = ReportAggregate.from_model(model, get_digest(report_filename))
+    aggregate.stamp = stamp
+    with commits_periodical.utils.atomic_write(
+        get_filename(report_filename)
+    ) as fp:
+        json.dump(dataclasses.asdict(aggregate), fp, indent=1, sort_keys=True)
+        fp.write("\n")
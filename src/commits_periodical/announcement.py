@@ -1,15 +1,13 @@
+import commits_periodical.aggregate
 import commits_periodical.html_templates
+import commits_periodical.utils
 
 
-def announcement(repo, doc, index_entry):
-    templates = commits_periodical.html_templates.HtmlTemplates()
+def announcement(index_entry, aggregate, templates=None):
+    if templates is None:
+        templates = commits_periodical.html_templates.HtmlTemplates()
 
-    highlighted_entries = [
-        e for _, e in doc.get_entries() if e.is_highlighted()
-    ]
-    highlighted_lines = [
-        f"- {repo.get_commit(e.githash).summary}" for e in highlighted_entries
-    ]
+    highlighted_lines = [f"- {summary}" for summary in aggregate.highlighted]
     if highlighted_lines:
         highlighted_text = "Highlighted commits:\n\n"
         highlighted_text += "\n".join(highlighted_lines)
@@ -24,10 +22,17 @@ def announcement(repo, doc, index_entry):
         index_entry["display_date_start"],
         index_entry["display_date_end"],
         index_entry.get_display_name(),
-        len(doc.entries),
+        aggregate.total_commits,
         highlighted_text,
     )
 
     filename = f"out/announce-{index_entry.get_display_name()}.txt"
-    with open(filename, "wt", encoding="utf8") as fp:
-        fp.write(text)
+    commits_periodical.utils.write_text(filename, text)
+
+
+def emit_announcement(model, filename_base, templates, fragments, options):
+    """Write the email announcement; this always goes in out/announce-*.txt
+    rather than next to the other formats.
+    """
+    aggregate = commits_periodical.aggregate.ReportAggregate.from_model(model)
+    announcement(model.index_entry, aggregate, templates)
@@ -0,0 +1,108 @@
+import bisect
+import dataclasses
+import os.path
+import pickle
+import re
+
+import commits_periodical.utils
+
+ARCHIVE_FILENAME = "archive.gitindex"
+
+# These match the '00-reverts' classifier and find_fixes().
+RE_REVERTS = re.compile(r"This reverts commit \b([0-9a-fA-F]{40})\b")
+RE_FIXES = re.compile(r"^Fixes:\s*([a-fA-F0-9]+)", re.MULTILINE)
+
+
+@dataclasses.dataclass
+class ArchiveEntry:
+    report: str | None = None
+    reverts: list[str] = dataclasses.field(default_factory=list)
+    fixes: list[str] = dataclasses.field(default_factory=list)
+    reverted_by: list[str] = dataclasses.field(default_factory=list)
+    fixed_by: list[str] = dataclasses.field(default_factory=list)
+
+
+class ArchiveIndex:
+    """Reverse index of every commit in every report: which report contains
+    it, and which commits revert or fix it.
+    """
+
+    def __init__(self, project_dirname):
+        self.filename = os.path.join(project_dirname, ARCHIVE_FILENAME)
+        self.entries = {}
+        self._sorted_githashes = None
+        if os.path.exists(self.filename):
+            with open(self.filename, "rb") as fp:
+                self.entries = pickle.load(fp)
+
+    def clear(self):
+        self.entries = {}
+        self._sorted_githashes = None
+
+    def save(self):
+        with commits_periodical.utils.atomic_write(self.filename, "wb") as fp:
+            pickle.dump(self.entries, fp)
+
+    def get(self, githash):
+        return self.entries.get(githash)
+
+    def get_report(self, githash):
+        entry = self.entries.get(githash)
+        if entry is None:
+            return None
+        return entry.report
+
+    def resolve(self, githash):
+        """Return the full hash indicated by githash (which may be a short
+        form), or None if no commit (or more than one) has that prefix.
+        """
+        if githash in self.entries:
+            return githash
+        if self._sorted_githashes is None:
+            self._sorted_githashes = sorted(self.entries)
+        sorted_githashes = self._sorted_githashes
+        i = bisect.bisect_left(sorted_githashes, githash)
+        matches = [
+            h for h in sorted_githashes[i : i + 2] if h.startswith(githash)
+        ]
+        # An ambiguous prefix doesn't indicate any one commit
+        if len(matches) != 1:
+            return None
+        return matches[0]
+
+    def _get_or_add(self, githash):
+        if githash not in self.entries:
+            self.entries[githash] = ArchiveEntry()
+            self._sorted_githashes = None
+        return self.entries[githash]
+
+    def add_commits(self, report_name, gitcommits):
+        """Record the report containing each commit, and link any reverts
+        and fixes back to their targets.
+        """
+        num_added = 0
+        for gitcommit in gitcommits:
+            githash = gitcommit.githash
+            entry = self._get_or_add(githash)
+            if entry.report != report_name:
+                entry.report = report_name
+                num_added += 1
+
+            for target in RE_REVERTS.findall(gitcommit.message):
+                if target not in entry.reverts:
+                    entry.reverts.append(target)
+                target_entry = self._get_or_add(target)
+                if githash not in target_entry.reverted_by:
+                    target_entry.reverted_by.append(githash)
+
+            for short in RE_FIXES.findall(gitcommit.message):
+                target = self.resolve(short)
+                # Skip commits from before the archive began
+                if target is None:
+                    continue
+                if target not in entry.fixes:
+                    entry.fixes.append(target)
+                target_entry = self.entries[target]
+                if githash not in target_entry.fixed_by:
+                    target_entry.fixed_by.append(githash)
+        return num_added
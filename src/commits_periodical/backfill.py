@@ -0,0 +1,96 @@
+import concurrent.futures
+import sys
+
+import commits_periodical.gitlayer
+import commits_periodical.metrics
+import commits_periodical.update
+
+# Number of commits read from git by each worker at a time
+CHUNK_SIZE = 200
+
+
+def split_reports(index, githashes):
+    """Split the first-parent history into the commits of each report,
+    using the report boundaries in the index.  Returns a dict of report
+    name -> hashes (oldest first), or None if a boundary isn't in the
+    history.
+    """
+    names = index.sorted_main_names
+    oldest = index.get_index_entry(names[0])["start_after"]
+    # Hash -> position in the history; the oldest start_after is just
+    # before the first commit
+    positions = {h: i for i, h in enumerate(githashes)}
+    positions[oldest] = -1
+
+    split = {}
+    for name in names:
+        index_entry = index.get_index_entry(name)
+        for key in ("start_after", "end_including"):
+            if index_entry[key] not in positions:
+                print(f"{name}: {key} is not in the first-parent history")
+                return None
+        start = positions[index_entry["start_after"]] + 1
+        end = positions[index_entry["end_including"]] + 1
+        split[name] = githashes[start:end]
+    return split
+
+
+def read_all_commits(git_dirname, githashes, jobs):
+    """Read the commits from git in chunks, using up to jobs git processes
+    at once.  Returns the commits in the same order as the hashes.
+    """
+    chunks = [
+        githashes[i : i + CHUNK_SIZE]
+        for i in range(0, len(githashes), CHUNK_SIZE)
+    ]
+    gitcommits = []
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        results = executor.map(
+            commits_periodical.gitlayer.read_commits,
+            [git_dirname] * len(chunks),
+            chunks,
+        )
+        for chunk, chunk_gitcommits in zip(chunks, results):
+            # Reading the modified files runs 'git diff' for each commit
+            commits_periodical.metrics.count("git_commands", len(chunk))
+            gitcommits.extend(chunk_gitcommits)
+            print(f"Read {len(gitcommits)} of {len(githashes)} commits")
+    return gitcommits
+
+
+def backfill(index, git_dirname, archive, jobs):
+    """Rebuild the cache of every report from a single walk of the
+    first-parent history, instead of one walk per report.  Existing caches
+    are replaced.
+    """
+    names = index.sorted_main_names
+    start_after = index.get_index_entry(names[0])["start_after"]
+    end_including = index.get_index_entry(names[-1])["end_including"]
+    githashes = commits_periodical.gitlayer.get_first_parent_githashes(
+        git_dirname, start_after, end_including
+    )
+    print(f"Found {len(githashes)} commits for {len(names)} reports")
+
+    split = split_reports(index, githashes)
+    if split is None:
+        sys.exit(1)
+
+    gitcommits = read_all_commits(git_dirname, githashes, jobs or 1)
+    gitcommits = dict(zip(githashes, gitcommits))
+
+    for name in names:
+        index_entry = index.get_index_entry(name)
+        filename = index.get_filename(name)
+        repo = commits_periodical.gitlayer.CachedRepo(
+            git_dirname, filename.replace(".toml", ".gitcache")
+        )
+        repo.replace_cache(
+            [gitcommits[h] for h in split[name]],
+            index_entry["start_after"],
+            index_entry["end_including"],
+        )
+        repo.save()
+    print(f"Rebuilt the caches of {len(names)} reports")
+
+    # The archive index may have been lost along with the caches
+    commits_periodical.update.rebuild_archive(index, archive)
@@ -1,12 +1,21 @@
 import collections
+import dataclasses
 import re
+import time
 
+import commits_periodical.data
+import commits_periodical.gitlayer
+import commits_periodical.metrics
 import commits_periodical.utils
 import commits_periodical.project_data
+import commits_periodical.regex_cost
 
 GROUP_AT_LEAST = 3
 
-DEFAULT_RE_FUNC = "match"
+RE_FIXES = re.compile(r"^Fixes:\s*([a-fA-F0-9]+)", re.MULTILINE)
+
+# If set, a RegexProfile which records the time spent on each pattern
+regex_profile = None
 
 
 def re_func(pattern, string, flags, selector):
@@ -15,49 +24,65 @@ def re_func(pattern, string, flags, selector):
         use_func = selector
     else:
         assert isinstance(selector, commits_periodical.project_data.Classifier)
-        use_func = selector.get_metadata("_re_func", DEFAULT_RE_FUNC)
+        use_func = selector.get_metadata(
+            "_re_func", commits_periodical.project_data.DEFAULT_RE_FUNC
+        )
 
     # Apply the desired function
     if use_func == "match":
-        return re.match(pattern, string, flags)
-    if use_func == "search":
-        return re.search(pattern, string, flags)
-    raise ValueError(f"re_func() does not support {use_func}")
+        func = re.match
+    elif use_func == "search":
+        func = re.search
+    else:
+        raise ValueError(f"re_func() does not support {use_func}")
 
+    if regex_profile is None:
+        return func(pattern, string, flags)
+    start = time.perf_counter()
+    match = func(pattern, string, flags)
+    regex_profile.record(pattern, time.perf_counter() - start)
+    return match
 
-def find_highlighted(repo, doc):
-    num_changed = 0
-    for githash, entry in doc.get_entries():
-        if entry.is_revert():
-            continue
-        if entry.is_highlighted():
-            continue
-        gitcommit = repo.get_commit(githash)
-        if "UPDATING" in gitcommit.modified_files:
-            entry.set_highlighted()
-            num_changed += 1
-            continue
-        if gitcommit.summary.startswith("RELNOTES"):
-            entry.set_highlighted()
-            num_changed += 1
-            continue
-        # 'search' because it's part of a multiline string
-        if re_func("^Relnotes:", gitcommit.message, re.MULTILINE, "search"):
-            entry.set_highlighted()
-            num_changed += 1
-            continue
-    if num_changed > 0:
-        print(f"Copied {num_changed} commits into 'highlighted'")
 
+def get_rule_test(rule):
+    """Get the function which tests whether the classifier rule matches a
+    string (recording the time taken, if we're profiling).
+    """
+    if regex_profile is None:
+        return rule.test
+
+    def profiled_test(string):
+        start = time.perf_counter()
+        match = rule.test(string)
+        regex_profile.record(rule.pattern, time.perf_counter() - start)
+        return match
 
-def apply_revert(repo, doc, classifier_name, classifier, githash, examine):
+    return profiled_test
+
+
+def is_highlight_candidate(gitcommit):
+    """Should this commit be highlighted (unless it's a revert)?"""
+    if "UPDATING" in gitcommit.modified_files:
+        return True
+    if gitcommit.summary.startswith("RELNOTES"):
+        return True
+    # 'search' because it's part of a multiline string
+    if re_func("^Relnotes:", gitcommit.message, re.MULTILINE, "search"):
+        return True
+    return False
+
+
+def apply_revert(
+    repo, doc, classifier_name, classifier, githash, examine, pipeline
+):
     num_changed = 0
-    for cat, patterns in classifier.items():
+    for cat, rules in classifier.compiled.items():
         assert cat == "reverts"
-        for pattern in patterns:
-            match = re_func(pattern, examine, 0, classifier)
+        for rule in rules:
+            match = get_rule_test(rule)(examine)
             if not match:
                 continue
+            pattern = rule.pattern
 
             prevhash = match.group(1)
             prevcommit = repo.get_commit(prevhash)
@@ -68,6 +93,9 @@ def apply_revert(repo, doc, classifier_name, classifier, githash, examine):
                 for thishash in hashes:
                     entry = doc.entries[thishash]
                     if not entry.is_revert():
+                        # The earlier commit may already have been classified
+                        # by a later section; reverts take priority.
+                        pipeline.unclassify(thishash)
                         entry.set_auto_cat("reverts", classifier_name, pattern)
                         num_changed += 1
                     if entry.is_highlighted():
@@ -89,21 +117,255 @@ def apply_revert(repo, doc, classifier_name, classifier, githash, examine):
     return num_changed
 
 
-def find_fixes(repo, doc):
+def get_print_patterns(patterns):
+    """Get the pattern(s) to record for a filenames match."""
+    if len(patterns) == 1:
+        return patterns.pop()
+    return sorted(patterns)
+
+
+def apply_filenames(entry, classifier_name, classifier, examine):
     num_changed = 0
-    for githash in doc.get_hashes():
-        gitcommit = repo.get_commit(githash)
+    if len(examine) == 0:
+        return num_changed
+
+    # In a single pass over the files, find whether each file can be
+    # omitted, and the first pattern in each category which matches it.
+    omit_tests = [get_rule_test(rule) for rule in classifier.omit_rules]
+    cat_tests = [
+        (cat, [(rule.pattern, get_rule_test(rule)) for rule in rules])
+        for cat, rules in classifier.compiled.items()
+    ]
+    omittable = []
+    first_patterns = {cat: [] for cat, _ in cat_tests}
+    # A category can't match (with or without omitting files) if there's a
+    # file which it doesn't match and which can't be omitted.
+    possible = set(first_patterns)
+    for f in examine:
+        omit = any(test(f) for test in omit_tests)
+        omittable.append(omit)
+        for cat, tests in cat_tests:
+            if cat not in possible:
+                continue
+            first = None
+            for pattern, test in tests:
+                if test(f):
+                    first = pattern
+                    break
+            if first is None and not omit:
+                possible.discard(cat)
+            first_patterns[cat].append(first)
+
+    # Every file must be matched by the category
+    for cat in first_patterns:
+        if cat not in possible or None in first_patterns[cat]:
+            continue
+        print_patterns = get_print_patterns(set(first_patterns[cat]))
+        entry.set_auto_cat(cat, classifier_name, print_patterns)
+        num_changed += 1
+    if entry.has_auto_cat():
+        return num_changed
+
+    # Try omitting the specified files
+    kept = [i for i, omit in enumerate(omittable) if not omit]
+    if len(kept) == 0:
+        return num_changed
+    if len(kept) == len(examine):
+        return num_changed
+
+    for cat in first_patterns:
+        if cat not in possible:
+            continue
+        patterns = [first_patterns[cat][i] for i in kept]
+        if None in patterns:
+            continue
+        print_patterns = get_print_patterns(set(patterns))
+        entry.set_auto_cat(cat, classifier_name, print_patterns)
+        num_changed += 1
+
+    return num_changed
 
-        found = re.findall(
-            r"^Fixes:\s*([a-fA-F0-9]+)", gitcommit.message, re.MULTILINE
+
+def apply_text(entry, classifier_name, classifier, examine):
+    """Handle texts (summary or message)."""
+    num_changed = 0
+    if regex_profile is None:
+        rules = classifier.find_matching_rules(examine)
+    else:
+        # Test every rule individually, to time them
+        rules = [
+            rule
+            for cat_rules in classifier.compiled.values()
+            for rule in cat_rules
+            if get_rule_test(rule)(examine)
+        ]
+    for rule in rules:
+        entry.set_auto_cat(rule.cat, classifier_name, rule.pattern)
+        num_changed += 1
+    return num_changed
+
+
+def get_examine(gitcommit, examine_part):
+    if examine_part == "message":
+        return gitcommit.message
+    if examine_part == "summary":
+        return gitcommit.summary
+    if examine_part == "filenames":
+        return gitcommit.modified_files
+    raise NotImplementedError
+
+
+@dataclasses.dataclass
+class CommitInfo:
+    """Per-commit facts needed by the cross-commit stages."""
+
+    githash: str
+    entry: commits_periodical.data.ReportEntry
+    gitcommit: commits_periodical.gitlayer.CachedCommit
+    prefix: str
+    author: str
+    fixes: list[str]
+    highlight: bool
+
+
+def get_known_cats(doc):
+    """Get githash -> (category, section, pattern) for each commit with an
+    automatic category.
+    """
+    known = {}
+    for githash, entry in doc.get_entries():
+        if not entry.has_auto_cat():
+            continue
+        section, pattern = entry.get_auto_reasons()
+        if isinstance(pattern, list):
+            pattern = [str(p) for p in pattern]
+        else:
+            pattern = str(pattern)
+        known[githash] = (str(entry.get_auto_cat()), str(section), pattern)
+    return known
+
+
+class ClassifyPipeline:
+    """Classify commits in a single pass.  Each commit is visited once for the
+    per-commit stages: the classifier sections (in priority order), highlight
+    detection, and extracting the info needed for grouping and fixes.  The
+    cross-commit stages then run over that extracted info.
+
+    Commits in 'known' (from get_known_cats(), with the same classifiers)
+    get their previous category instead of being matched against every
+    section.
+    """
+
+    def __init__(self, repo, doc, project, known=None):
+        self.repo = repo
+        self.doc = doc
+        self.project = project
+        self.known = known or {}
+        self.num_changed = collections.Counter()
+        # githash -> (section, number of changes counted in that section)
+        self.classified_by = {}
+        self.infos = []
+
+    def unclassify(self, githash):
+        """Remove an automatic category which was set by a later section."""
+        if githash not in self.classified_by:
+            return
+        section, num = self.classified_by.pop(githash)
+        self.num_changed[section] -= num
+        self.doc.get_entry(githash).clear_automatic_annotation()
+
+    def add(self, githash):
+        """Apply the per-commit stages to a single commit."""
+        entry = self.doc.get_entry(githash)
+        gitcommit = self.repo.get_commit(githash)
+
+        for name, classifier in self.project.classifiers.items():
+            # Skip if we already have an automatic class
+            if entry.has_auto_cat():
+                break
+
+            # Reverts depend on other commits, so they're always checked
+            if name != "00-reverts" and githash in self.known:
+                cat, section, pattern = self.known[githash]
+                entry.set_auto_cat(cat, section, pattern)
+                # Not counted, since it hasn't changed
+                self.classified_by[githash] = (section, 0)
+                break
+
+            examine_part = classifier.get_metadata("_acts_on")
+            examine = get_examine(gitcommit, examine_part)
+
+            # Special-case
+            if name == "00-reverts":
+                num = apply_revert(
+                    self.repo,
+                    self.doc,
+                    name,
+                    classifier,
+                    githash,
+                    examine,
+                    self,
+                )
+            elif examine_part == "filenames":
+                num = apply_filenames(entry, name, classifier, examine)
+            else:
+                num = apply_text(entry, name, classifier, examine)
+            self.num_changed[name] += num
+            if num and name != "00-reverts":
+                self.classified_by[githash] = (name, num)
+
+        self.infos.append(
+            CommitInfo(
+                githash=githash,
+                entry=entry,
+                gitcommit=gitcommit,
+                prefix=commits_periodical.utils.get_summary_prefix(gitcommit),
+                author=str(gitcommit.author).replace(" ", "_"),
+                fixes=RE_FIXES.findall(gitcommit.message),
+                highlight=is_highlight_candidate(gitcommit),
+            )
         )
-        if not found:
+
+    def print_classified(self):
+        for name in self.project.classifiers:
+            num = self.num_changed[name]
+            if num > 0:
+                print(f"Classified {num} commits due to {name}")
+
+    def finish(self):
+        """Apply the cross-commit stages."""
+        for name, num in self.num_changed.items():
+            commits_periodical.metrics.count_section(name, num)
+        group_commits(self.doc, self.infos)
+        find_fixes(self.repo, self.doc, self.infos)
+        find_highlighted(self.infos)
+
+
+def find_highlighted(infos):
+    num_changed = 0
+    for info in infos:
+        if not info.highlight:
             continue
+        if info.entry.is_revert():
+            continue
+        if info.entry.is_highlighted():
+            continue
+        info.entry.set_highlighted()
+        num_changed += 1
+    if num_changed > 0:
+        print(f"Copied {num_changed} commits into 'highlighted'")
 
-        entry = doc.get_entry(githash)
+
+def find_fixes(repo, doc, infos):
+    num_changed = 0
+    for info in infos:
+        githash = info.githash
+        entry = info.entry
+        if not info.fixes:
+            continue
 
         prevhashes = []
-        for prevhash in found:
+        for prevhash in info.fixes:
             prevcommit = repo.get_commit(prevhash, allow_partial=True)
             # Hack for a missing git repo commit
             if prevcommit:
@@ -128,121 +390,14 @@ def find_fixes(repo, doc):
 
         name = prevcommit_keep.summary
         hashes = prevhashes + [githash]
-        for githash in hashes:
-            if not doc.entries[githash].has_group():
+        for thishash in hashes:
+            if not doc.entries[thishash].has_group():
                 doc.set_group(hashes, name, groupname)
 
     if num_changed > 0:
         print(f"Grouped {num_changed} commits as 'fixes' pairs")
 
 
-def apply_classifier(repo, doc, classifier_name, classifier, meta):
-    num_changed = 0
-
-    examine_part = classifier.get_metadata("_acts_on")
-
-    for githash in doc.get_hashes():
-        entry = doc.get_entry(githash)
-        # Skip if we already have an automatic class
-        if entry.has_auto_cat():
-            continue
-
-        gitcommit = repo.get_commit(githash)
-
-        if examine_part == "message":
-            examine = gitcommit.message
-        elif examine_part == "summary":
-            examine = gitcommit.summary
-        elif examine_part == "filenames":
-            examine = gitcommit.modified_files
-        else:
-            raise NotImplementedError
-
-        # Special-case
-        if classifier_name == "00-reverts":
-            num_changed += apply_revert(
-                repo, doc, classifier_name, classifier, githash, examine
-            )
-            continue
-
-        # Handle filenames differently
-        if examine_part == "filenames":
-            if len(examine) == 0:
-                continue
-            for cat, patterns in classifier.items():
-                keep_patterns = set()
-                matches_cat = list(examine)
-                for pattern in patterns:
-                    for f in list(matches_cat):
-                        if re_func(pattern, f, 0, classifier):
-                            matches_cat.remove(f)
-                            keep_patterns.add(pattern)
-                # If there's any files left, it isn't a complete match
-                if matches_cat:
-                    continue
-                if len(keep_patterns) == 1:
-                    print_patterns = keep_patterns.pop()
-                else:
-                    print_patterns = sorted(keep_patterns)
-                entry.set_auto_cat(cat, classifier_name, print_patterns)
-                num_changed += 1
-            if entry.has_auto_cat():
-                continue
-
-            # Try omitting the specified files
-            possible_omit = meta["_filenames_try_omit"]
-            # Override global setting, if applicable
-            if "_filenames_try_omit" in classifier.metadata:
-                possible_omit = classifier.metadata["_filenames_try_omit"]
-            new_examine = [
-                f
-                for f in examine
-                if not any(
-                    re_func(omit_pattern, f, 0, classifier)
-                    for omit_pattern in possible_omit
-                )
-            ]
-            if len(new_examine) == 0:
-                continue
-            if new_examine == examine:
-                continue
-
-            for cat, patterns in classifier.items():
-                keep_patterns = set()
-                matches_cat = list(new_examine)
-                for pattern in patterns:
-                    for f in list(matches_cat):
-                        if re_func(pattern, f, 0, classifier):
-                            matches_cat.remove(f)
-                            keep_patterns.add(pattern)
-                # If there's any files left, it isn't a complete match
-                if matches_cat:
-                    continue
-                if len(keep_patterns) == 1:
-                    print_patterns = keep_patterns.pop()
-                else:
-                    print_patterns = sorted(keep_patterns)
-                entry.set_auto_cat(cat, classifier_name, print_patterns)
-                num_changed += 1
-            if entry.has_auto_cat():
-                continue
-
-            continue
-
-        # Handle texts (summary or message)
-        for cat, patterns in classifier.items():
-            for pattern in patterns:
-                match = re_func(pattern, examine, 0, classifier)
-                if not match:
-                    continue
-
-                entry.set_auto_cat(cat, classifier_name, pattern)
-                num_changed += 1
-
-    if num_changed > 0:
-        print(f"Classified {num_changed} commits due to {classifier_name}")
-
-
 def check_auto_changes(repo, doc):
     for githash in doc.get_hashes():
         entry = doc.get_entry(githash)
@@ -272,32 +427,30 @@ def check_auto_changes(repo, doc):
             entry.clear_backup_auto()
 
 
-def group_commits(repo, doc):
+def group_commits(doc, infos):
     """Find and group consecutive commits with the same author, category, and
     commit summary prefix.
     """
     # Look for commits that we can group together:
     adjacents = [[None, 0, None, None]]
-    for githash, entry in doc.get_entries():
-        gitcommit = repo.get_commit(githash)
+    for info in infos:
+        entry = info.entry
         # Extract relevant info
-        prefix = commits_periodical.utils.get_summary_prefix(gitcommit)
         cat = entry.cat
-        author = str(gitcommit.author).replace(" ", "_")
         if entry.has_group():
             groupname = entry.groupname()
         else:
             groupname = None
 
         # Combine info
-        combo = (author, cat, prefix, groupname)
+        combo = (info.author, cat, info.prefix, groupname)
         prev = adjacents[-1]
         if prev[0] == combo:
             prev[1] += 1
-            prev[2].append(githash)
-            prev[3].append(gitcommit)
+            prev[2].append(info.githash)
+            prev[3].append(info)
         else:
-            adjacents.append([combo, 1, [githash], [gitcommit]])
+            adjacents.append([combo, 1, [info.githash], [info]])
     # Remove the "None" first item
     adjacents.pop(0)
 
@@ -308,11 +461,10 @@ def group_commits(repo, doc):
             continue
 
         adjcombos = collections.defaultdict(list)
-        for githash, gitcommit in zip(adj[2], adj[3]):
+        for githash, info in zip(adj[2], adj[3]):
             author = adj[0]
-            prefix = commits_periodical.utils.get_summary_prefix(gitcommit)
-            combo = (prefix, author)
-            adjcombos[combo].append((githash, gitcommit))
+            combo = (info.prefix, author)
+            adjcombos[combo].append((githash, info))
 
         for key, value in adjcombos.items():
             if len(value) < GROUP_AT_LEAST:
@@ -337,22 +489,34 @@ def group_commits(repo, doc):
             doc.set_group(githashes, prefix)
 
 
-def classify_period(repo, doc, project, debug):
+def classify_period(
+    repo, doc, project, debug, profile_regex=False, incremental=False
+):
+    """Classify the report.  If incremental is set, the report was last
+    classified with the same classifiers, so only commits without an
+    automatic category are matched against them.
+    """
+    global regex_profile
     print(f"Classifying {doc.filename}")
+    if profile_regex:
+        regex_profile = commits_periodical.regex_cost.RegexProfile()
+    known = get_known_cats(doc) if incremental else None
     doc.backup_auto()
     doc.clear_automatic_annotations()
 
-    for name, classifier in project.classifiers.items():
-        apply_classifier(repo, doc, name, classifier, project.meta)
+    pipeline = ClassifyPipeline(repo, doc, project, known)
+    for githash in doc.get_hashes():
+        pipeline.add(githash)
+    pipeline.print_classified()
     if debug:
         check_auto_changes(repo, doc)
 
-    # group
-    group_commits(repo, doc)
-    find_fixes(repo, doc)
-
-    # highlighted
-    find_highlighted(repo, doc)
+    # group and highlighted
+    pipeline.finish()
 
     doc.clear_backup_auto()
     doc.save()
+
+    if regex_profile is not None:
+        regex_profile.print_profile()
+        regex_profile = None
@@ -1,17 +1,18 @@
 #!/usr/bin/env python3
 
 import argparse
+import concurrent.futures
+import contextlib
+import io
 import os
 import sys
+import traceback
 
-import commits_periodical.announcement
-import commits_periodical.classify
-import commits_periodical.generate
-import commits_periodical.investigate
-import commits_periodical.project_data
-import commits_periodical.sanity_check
-import commits_periodical.update
+import commits_periodical.metrics
+import commits_periodical.project
+import commits_periodical.shards
 import commits_periodical.utils
+import commits_periodical.watch
 
 
 def parse_args():
@@ -25,6 +26,13 @@ def parse_args():
         action="store_true",
         help="Print debugging info to console and in HTML",
     )
+    parser.add_argument(
+        "-p",
+        "--project",
+        type=str,
+        default="",
+        help="Name of the project to act on (if several are configured)",
+    )
     parser.add_argument(
         "-r",
         "--report",
@@ -32,6 +40,14 @@ def parse_args():
         default="",
         help="Name of the report to act on",
     )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        default="",
+        metavar="FILE",
+        help="Write durations and counts for this run to FILE, as JSON or "
+        "(if FILE ends with .prom) in the Prometheus textfile format",
+    )
     parser.add_argument(
         "--reproducible",
         action="store_true",
@@ -41,24 +57,135 @@ def parse_args():
 
     # Add commands
     subparsers = parser.add_subparsers(dest="command", required=True)
-    subparsers.add_parser("sanity", help="Sanity check")
+    sanity = subparsers.add_parser("sanity", help="Sanity check")
     investigate = subparsers.add_parser(
         "investigate", help="Investigate some stats and aspects of the commits"
     )
     subparsers.add_parser("update", help="Update the final ref and commits")
     subparsers.add_parser("update-commits", help="Update the commits only")
-    subparsers.add_parser("annotate", help="Annotate a week's git commits")
-    subparsers.add_parser("generate", help="Generate html for a week")
+    backfill = subparsers.add_parser(
+        "backfill",
+        help="Rebuild the cached commits of every report from a single walk "
+        "of the git history",
+    )
+    subparsers.add_parser(
+        "rebuild-archive",
+        help="Rebuild the archive index (which report contains each commit, "
+        "and which commits revert or fix it) from the cached commits",
+    )
+    annotate = subparsers.add_parser(
+        "annotate", help="Annotate a week's git commits"
+    )
+    subparsers.add_parser(
+        "refresh",
+        help="Update the final ref and commits, and annotate them as they "
+        "are read from git",
+    )
+    generate = subparsers.add_parser(
+        "generate", help="Generate html for a week"
+    )
     subparsers.add_parser("email", help="Make the email announcement")
+    watch = subparsers.add_parser(
+        "watch",
+        help="Keep running, and update, annotate, and generate debug HTML "
+        "for the ongoing report whenever git's HEAD changes",
+    )
+    export = subparsers.add_parser(
+        "export",
+        help="Export every commit in the archive, with its classification",
+    )
+    replay = subparsers.add_parser(
+        "replay",
+        help="Replay classification and HTML generation over the archive, "
+        "without git",
+    )
+    run_all = subparsers.add_parser(
+        "all",
+        help="Update, annotate, and generate a report for every project "
+        "(debug HTML, if the report is ongoing)",
+    )
     new_report = subparsers.add_parser(
         "new-report", help="End one report and begin another"
     )
 
     # Add command-specific arguments
+    sanity.add_argument(
+        "--coverage",
+        action="store_true",
+        default=False,
+        help="Report how often each classifier pattern is used in the archive",
+    )
     investigate.add_argument(
-        "funcs", nargs=argparse.REMAINDER, help="Functions to run"
+        "funcs",
+        nargs=argparse.REMAINDER,
+        help="Functions to run (disputed), 'session' for an interactive "
+        "session, 'trends' (optionally followed by window:N), or 'query' "
+        "followed by terms: "
+        "author:NAME path:PREFIX cat:CATEGORY since:YYYY-MM-DD "
+        "until:YYYY-MM-DD unclassified grep:REGEX",
+    )
+    annotate.add_argument(
+        "--profile-regex",
+        action="store_true",
+        default=False,
+        help="Print the time spent matching each classifier pattern",
+    )
+    watch.add_argument(
+        "--interval",
+        type=int,
+        default=commits_periodical.watch.DEFAULT_INTERVAL,
+        help="Seconds between checks of git's HEAD (default: %(default)s)",
+    )
+    export.add_argument(
+        "dirname",
+        help="Directory for commits.jsonl and fields/ (one JSON Lines file "
+        "per field)",
+    )
+    export.add_argument(
+        "--jobs",
+        type=int,
+        default=0,
+        help="Number of reports to export at once (default: number of CPUs)",
+    )
+    backfill.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of git processes reading commits at once (default: 1)",
+    )
+    replay.add_argument(
+        "action",
+        choices=["record", "check"],
+        help="'record' the archive's reports, commits and output, or 'check' "
+        "that the output hasn't changed",
+    )
+    replay.add_argument(
+        "dirname", help="Directory for the recorded reports and output"
     )
     new_report.add_argument("githash", nargs=1, help="Git hash for start_after")
+    for subparser in [generate, run_all]:
+        subparser.add_argument(
+            "--formats",
+            type=str,
+            default="html",
+            help="Comma-separated output formats: html, json, atom, email",
+        )
+        subparser.add_argument(
+            "--shard-size",
+            type=int,
+            nargs="?",
+            default=0,
+            const=commits_periodical.shards.DEFAULT_SHARD_SIZE,
+            help="Write commit bodies to separate files of this many commits "
+            "(default if no number is given: %(const)s), loaded on demand",
+        )
+    run_all.add_argument(
+        "--concurrency",
+        type=int,
+        default=0,
+        help="Maximum number of projects to work on at once (default: the "
+        "'concurrency' config setting, or the number of CPUs)",
+    )
 
     # Do the actual parsing
     args = parser.parse_args()
@@ -85,103 +212,167 @@ def get_config():
     return config
 
 
+def get_projects(config):
+    """Get a dict of project name -> (project_dirname, git_dirname).  The
+    config either has a [projects.NAME] table for each project, or a single
+    project_dir and git_dir.
+    """
+    if "projects" in config:
+        tables = config["projects"]
+    else:
+        name = os.path.basename(os.path.normpath(config["project_dir"]))
+        tables = {name: config}
+
+    projects = {}
+    for name, table in tables.items():
+        project_dirname = os.path.expanduser(table["project_dir"])
+        projects[name] = (project_dirname, table["git_dir"])
+    return projects
+
+
+def get_project(projects, project_name):
+    """Get the (project_dirname, git_dirname) for the named project, or the
+    only project if no name was given.
+    """
+    if project_name:
+        if project_name not in projects:
+            print(f"Project not in the config: {project_name}")
+            sys.exit(1)
+        return projects[project_name]
+    if len(projects) > 1:
+        names = ", ".join(projects)
+        print(f"Several projects configured, please use --project: {names}")
+        sys.exit(1)
+    return next(iter(projects.values()))
+
+
+def run_project(args, name, project_dirname, git_dirname):
+    """Update, annotate, and generate the report (debug HTML if it's
+    ongoing), and return the output (or the error) and the metrics.
+    """
+    commits_periodical.metrics.reset(project=name, command=args.command)
+    project = commits_periodical.project.Project(project_dirname, git_dirname)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            project.update(args.report)
+            project.annotate([args.report], args.debug)
+            # There's only debug HTML for an ongoing report
+            index = project.get_index()
+            index_entry = index.get_index_entry(
+                project.get_name(index, args.report)
+            )
+            project.render(
+                [args.report],
+                args.formats.split(","),
+                args.debug or bool(index_entry.get("ongoing")),
+                args.reproducible,
+                args.shard_size,
+            )
+            ok = True
+        except SystemExit as err:
+            # Commands exit early if there's nothing for them to do
+            ok = not err.code
+        except Exception:
+            print(traceback.format_exc(), end="")
+            ok = False
+    record = commits_periodical.metrics.current.get_record()
+    return ok, output.getvalue(), record
+
+
+def run_all(args, config, projects):
+    """Run the projects in parallel, and print each one's output when it's
+    finished.
+    """
+    concurrency = args.concurrency or config.get("concurrency", 0)
+    if not concurrency:
+        concurrency = min(len(projects), os.cpu_count() or 1)
+
+    failed = []
+    records = []
+    with concurrent.futures.ProcessPoolExecutor(concurrency) as executor:
+        futures = {
+            executor.submit(run_project, args, name, *dirnames): name
+            for name, dirnames in projects.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            ok, output, record = future.result()
+            records.append(record)
+            print(f"==> {name} <==")
+            print(output, end="")
+            if not ok:
+                failed.append(name)
+
+    if args.metrics:
+        commits_periodical.metrics.save(args.metrics, records)
+
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
 def main():
     """FreeBSD weekly commit summaries."""
     args = parse_args()
 
     config = get_config()
-    project_dirname = os.path.expanduser(config["project_dir"])
-    if args.command in ["update", "new-report"]:
-        index = commits_periodical.data.Index(project_dirname, read_only=False)
-    else:
-        index = commits_periodical.data.Index(project_dirname)
-
-    # Get the relevant time period
-    if not args.report:
-        # Default setting: use the most recent time period
-        index_entry_name = index.get_latest_name()
-        entries_filename = index.get_filename(index_entry_name)
-    elif args.report == "prev":
-        # Work on the previous time period
-        index_entry_name = index.get_prev_name()
-        entries_filename = index.get_filename(index_entry_name)
-    else:
-        index_entry_name = args.report
-        entries_filename = os.path.join(
-            project_dirname, f"{index_entry_name}.toml"
-        )
+    projects = get_projects(config)
+    if args.command == "all":
+        run_all(args, config, projects)
+        return
+
+    project_dirname, git_dirname = get_project(projects, args.project)
+    name = args.project or next(iter(projects))
+    commits_periodical.metrics.reset(project=name, command=args.command)
+    project = commits_periodical.project.Project(project_dirname, git_dirname)
+    try:
+        run_command(args, project)
+    finally:
+        # Also record runs which exit early
+        if args.metrics:
+            record = commits_periodical.metrics.current.get_record()
+            commits_periodical.metrics.save(args.metrics, [record])
 
-    index_entry = index.get_index_entry(index_entry_name)
-    cache_filename = entries_filename.replace(".toml", ".gitcache")
-    repo = commits_periodical.gitlayer.CachedRepo(
-        config["git_dir"], cache_filename
-    )
-    if index_entry.is_derived():
-        doc = commits_periodical.data.Report(None)
-        assert "include_spans" in index_entry
-        num = len(index_entry["include_spans"])
-        for i, span in enumerate(index_entry["include_spans"]):
-            span_filename = os.path.join(project_dirname, f"{span}.toml")
-            cache_filename = span_filename.replace(".toml", ".gitcache")
-            if i == 0:
-                start_after = index_entry["start_after"]
-            else:
-                start_after = False
-            if i == num - 1:
-                end_including = index_entry["end_including"]
-            else:
-                end_including = False
-            doc.load(span_filename, start_after, end_including)
-            repo.add_cache(cache_filename)
-    else:
-        if args.command in ["update", "annotate"]:
-            doc = commits_periodical.data.Report(
-                entries_filename, read_only=False
-            )
-        else:
-            doc = commits_periodical.data.Report(entries_filename)
-    project = commits_periodical.project_data.ProjectData(project_dirname)
 
-    # Run the relevant command
+def run_command(args, project):
+    """Run the command on a report in the project."""
     match args.command:
         case "sanity":
-            commits_periodical.sanity_check.check(project)
+            project.sanity(args.coverage)
         case "investigate":
-            commits_periodical.investigate.investigate(repo, doc, args.funcs)
+            project.investigate(args.funcs, args.report)
+        case "export":
+            project.export(args.dirname, args.jobs)
+        case "replay":
+            project.replay(args.action, args.dirname)
         case "new-report":
             assert len(args.githash) == 1
-            githash = args.githash[0]
-            commits_periodical.update.new_report(
-                index, index_entry, githash
-            )
+            project.new_report(args.githash[0], args.report)
         case "update":
-            if index_entry.get("ongoing"):
-                commits_periodical.update.update_ref(repo, index, index_entry)
-            commits_periodical.update.update_period(repo, index_entry, doc)
+            project.update(args.report)
         case "update-commits":
-            commits_periodical.update.update_period(repo, index_entry, doc)
+            project.update(args.report, commits_only=True)
+        case "backfill":
+            project.backfill(args.jobs)
+        case "rebuild-archive":
+            project.rebuild_archive()
         case "annotate":
-            if not index_entry.is_derived():
-                commits_periodical.classify.classify_period(
-                    repo,
-                    doc,
-                    project,
-                    args.debug,
-                )
+            project.annotate([args.report], args.debug, args.profile_regex)
+        case "refresh":
+            project.refresh(args.report, args.debug)
         case "generate":
-            commits_periodical.generate.generate_index(project_dirname, index)
-            commits_periodical.generate.generate_period(
-                repo,
-                doc,
-                project,
-                index_entry,
+            project.render(
+                [args.report],
+                args.formats.split(","),
                 args.debug,
-                project_dirname,
                 args.reproducible,
-                index_entry_name,
+                args.shard_size,
             )
         case "email":
-            commits_periodical.announcement.announcement(repo, doc, index_entry)
+            project.email(args.report)
+        case "watch":
+            project.watch(args.interval)
         case _:
             print(f"Command not recognized: {args.command}")
 
@@ -5,6 +5,9 @@ import pathlib
 import toml
 import tomlkit
 
+import commits_periodical.gitlayer
+import commits_periodical.utils
+
 RESERVED_REPORT_NAMES = ["prev", "all"]
 
 
@@ -147,7 +150,7 @@ class Index:
     def save(self):
         assert self.read_only is False
         out = tomlkit.dumps(self.doc)
-        with open(self.filename, "w", encoding="utf8") as fp:
+        with commits_periodical.utils.atomic_write(self.filename) as fp:
             fp.write(out)
 
 
@@ -348,7 +351,7 @@ class Report:
         """Save the document to disk."""
         assert self.read_only is False
         out = tomlkit.dumps(self.doc)
-        with open(self.filename, "w", encoding="utf8") as fp:
+        with commits_periodical.utils.atomic_write(self.filename) as fp:
             fp.write(out)
 
     def get_entries(self):
@@ -385,7 +388,7 @@ class Report:
     def set_group(self, githashes, basename, groupname=None):
         if not groupname:
             groupname = self._get_groupname(basename)
-        self.groups[groupname] = githashes
+        self.groups[groupname] = [self.entries[h] for h in githashes]
 
         for githash in githashes:
             self.entries[githash].set_group(groupname)
@@ -408,3 +411,28 @@ class Report:
     def clear_backup_auto(self):
         for githash in self.get_hashes():
             self.entries[githash].clear_backup_auto()
+
+
+def load_report(index, name, git_dirname=None):
+    """Load the (read-only) report, and the cached commits it needs."""
+    index_entry = index.get_index_entry(name)
+    if not index_entry.is_derived():
+        filename = index.get_filename(name)
+        cache_filename = filename.replace(".toml", ".gitcache")
+        repo = commits_periodical.gitlayer.CachedRepo(
+            git_dirname, cache_filename
+        )
+        return repo, Report(filename)
+
+    repo = commits_periodical.gitlayer.CachedRepo(git_dirname, None)
+    doc = Report(None)
+    spans = index_entry["include_spans"]
+    for i, span in enumerate(spans):
+        start_after = index_entry["start_after"] if i == 0 else False
+        end_including = False
+        if i == len(spans) - 1:
+            end_including = index_entry["end_including"]
+        span_filename = index.get_filename(span)
+        doc.load(span_filename, start_after, end_including)
+        repo.add_cache(span_filename.replace(".toml", ".gitcache"))
+    return repo, doc
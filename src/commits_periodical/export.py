@@ -0,0 +1,146 @@
+import concurrent.futures
+import contextlib
+import json
+import os
+import os.path
+import pickle
+import shutil
+
+import commits_periodical.data
+import commits_periodical.utils
+
+JSONL_FILENAME = "commits.jsonl"
+FIELDS_DIRNAME = "fields"
+PARTS_DIRNAME = ".parts"
+
+# Every exported commit has these fields, in this order
+FIELDS = (
+    "githash",
+    "report",
+    "category",
+    "automatic_category",
+    "manual_category",
+    "fixed_category",
+    "section",
+    "pattern",
+    "group",
+    "highlighted",
+    "author",
+    "authored_date",
+    "summary",
+    "modified_files",
+)
+
+
+def get_record(name, entry, gitcommit):
+    """Get the exported fields of a commit, in the order of FIELDS."""
+    section, pattern = None, None
+    if entry.has_auto_cat():
+        section, pattern = entry.get_auto_reasons()
+    return (
+        entry.githash,
+        name,
+        entry.cat,
+        entry.get_auto_cat() if entry.has_auto_cat() else None,
+        entry.manual_cat if entry.has_manual_cat() else None,
+        entry.get_fixed_cat() if entry.has_fixed_cat() else None,
+        section,
+        pattern,
+        entry.groupname() if entry.has_group() else None,
+        entry.is_highlighted(),
+        gitcommit.author,
+        gitcommit.authored_date,
+        gitcommit.summary,
+        gitcommit.modified_files,
+    )
+
+
+def export_report(report_filename, name, parts_dirname):
+    """Write one report's commits to its own part files, and return the
+    number of commits.
+    """
+    cache_filename = report_filename.replace(".toml", ".gitcache")
+    if not os.path.exists(cache_filename):
+        return 0
+    doc = commits_periodical.data.Report(report_filename)
+    with open(cache_filename, "rb") as fp:
+        gitcommits = pickle.load(fp)
+
+    dirname = os.path.join(parts_dirname, name)
+    os.makedirs(dirname)
+    num = 0
+    with contextlib.ExitStack() as stack:
+        jsonl = stack.enter_context(
+            open(os.path.join(dirname, JSONL_FILENAME), "w", encoding="utf8")
+        )
+        fields = []
+        for field in FIELDS:
+            filename = os.path.join(dirname, f"{field}.jsonl")
+            fields.append(
+                stack.enter_context(open(filename, "w", encoding="utf8"))
+            )
+        for githash, entry in doc.get_entries():
+            gitcommit = gitcommits.get(githash)
+            if gitcommit is None:
+                continue
+            record = get_record(name, entry, gitcommit)
+            jsonl.write(json.dumps(dict(zip(FIELDS, record))) + "\n")
+            for fp, value in zip(fields, record):
+                fp.write(json.dumps(value) + "\n")
+            num += 1
+    return num
+
+
+def export(project_dirname, index, out_dirname, jobs):
+    """Export every commit in the archive as JSON Lines (one object per
+    commit), and as one JSON Lines file per field (one value per commit, in
+    the same order as the objects).  Reports are exported in parallel, and
+    only one report per worker is held in memory.
+    """
+    parts_dirname = os.path.join(out_dirname, PARTS_DIRNAME)
+    fields_dirname = os.path.join(out_dirname, FIELDS_DIRNAME)
+    shutil.rmtree(parts_dirname, ignore_errors=True)
+    os.makedirs(parts_dirname)
+    os.makedirs(fields_dirname, exist_ok=True)
+
+    names = index.sorted_main_names
+    filenames = [index.get_filename(name) for name in names]
+    num_commits = 0
+    with contextlib.ExitStack() as stack:
+        jsonl = stack.enter_context(
+            commits_periodical.utils.atomic_write(
+                os.path.join(out_dirname, JSONL_FILENAME)
+            )
+        )
+        fields = [
+            stack.enter_context(
+                commits_periodical.utils.atomic_write(
+                    os.path.join(fields_dirname, f"{field}.jsonl")
+                )
+            )
+            for field in FIELDS
+        ]
+        executor = stack.enter_context(
+            concurrent.futures.ProcessPoolExecutor(jobs or None)
+        )
+
+        # Append each report's parts as soon as it (and every earlier report)
+        # is finished
+        results = executor.map(
+            export_report, filenames, names, [parts_dirname] * len(names)
+        )
+        for name, num in zip(names, results):
+            dirname = os.path.join(parts_dirname, name)
+            if num:
+                filename = os.path.join(dirname, JSONL_FILENAME)
+                with open(filename, encoding="utf8") as fp:
+                    shutil.copyfileobj(fp, jsonl)
+                for field, out_fp in zip(FIELDS, fields):
+                    filename = os.path.join(dirname, f"{field}.jsonl")
+                    with open(filename, encoding="utf8") as fp:
+                        shutil.copyfileobj(fp, out_fp)
+            shutil.rmtree(dirname, ignore_errors=True)
+            num_commits += num
+
+    os.rmdir(parts_dirname)
+    print(f"Exported {num_commits} commits from {len(names)} reports")
@@ -0,0 +1,136 @@
+import dataclasses
+import datetime
+import html
+import json
+import os.path
+
+import commits_periodical.fragments
+import commits_periodical.utils
+
+
+def _isodate(timestamp):
+    dt = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+    return dt.isoformat()
+
+
+def commit_data(commit, debug):
+    gitcommit = commit.gitcommit
+    entry = commit.entry
+    data = {
+        "author": gitcommit.author,
+        "authored_date": gitcommit.authored_date,
+        "summary": gitcommit.summary,
+        "message": gitcommit.message,
+        "modified_files": gitcommit.modified_files,
+        "category": entry.cat,
+        "highlighted": entry.is_highlighted(),
+    }
+    if entry.has_group():
+        data["group"] = entry.groupname()
+    if commit.crossrefs:
+        data["crossrefs"] = [list(c) for c in commit.crossrefs]
+    if debug:
+        if entry.has_auto_cat():
+            section, pattern = entry.get_auto_reasons()
+            data["auto_cat"] = entry.get_auto_cat()
+            data["auto_section"] = section
+            data["auto_pattern"] = pattern
+        if entry.has_manual_cat():
+            data["manual_cat"] = entry.manual_cat
+    return data
+
+
+def emit_json(model, filename_base, templates, fragments, options):
+    """Write the report as a JSON data file."""
+    filename_out = f"{filename_base}.json"
+    print(f"Generating JSON for {model.name} in {filename_out}")
+
+    index_entry = model.index_entry
+    sections = []
+    commits = {}
+    for section in model.sections:
+        if not section.is_shown():
+            continue
+        items = []
+        for item in section.items:
+            items.append(
+                {
+                    "summary": item.summary,
+                    "is_group": item.is_group,
+                    "commits": [c.githash for c in item.commits],
+                }
+            )
+            for commit in item.commits:
+                if commit.githash not in commits:
+                    commits[commit.githash] = commit_data(commit, model.debug)
+        sections.append(
+            {
+                "category": section.cat,
+                "title": section.title,
+                "num": section.num,
+                "items": items,
+            }
+        )
+
+    data = {
+        "name": model.name,
+        "display_name": str(index_entry.get_display_name()),
+        "display_date_start": str(index_entry["display_date_start"]),
+        "display_date_end": str(index_entry["display_date_end"]),
+        "ongoing": bool(index_entry.get("ongoing", False)),
+        "total_commits": model.total_commits,
+        "sections": sections,
+        "commits": commits,
+    }
+    if model.debug:
+        data["stats"] = dataclasses.asdict(model.stats)
+
+    text = json.dumps(data, indent=1) + "\n"
+    commits_periodical.utils.write_text(filename_out, text)
+
+
+def emit_atom(model, filename_base, templates, fragments, options):
+    """Write the report as an Atom feed, with one entry per commit."""
+    filename_out = f"{filename_base}.atom"
+    print(f"Generating Atom for {model.name} in {filename_out}")
+
+    page = os.path.basename(filename_base)
+    entries = ""
+    updated = 0
+    for commit in model.get_commits():
+        gitcommit = commit.gitcommit
+        _, text = commits_periodical.fragments.get_commit_long(
+            templates, commit.githash, gitcommit, fragments=fragments
+        )
+        entries += templates.ATOM_ENTRY % (
+            html.escape(gitcommit.summary),
+            commit.githash,
+            commit.githash,
+            _isodate(gitcommit.authored_date),
+            html.escape(gitcommit.author),
+            commit.entry.cat,
+            html.escape(text),
+        )
+        updated = max(updated, gitcommit.authored_date)
+
+    date_start = model.index_entry["display_date_start"]
+    date_end = model.index_entry["display_date_end"]
+    if not updated:
+        # Without any commits, the feed was last updated when the period
+        # ended (rather than at the epoch)
+        dt = datetime.datetime.combine(
+            datetime.date.fromisoformat(str(date_end)),
+            datetime.time(),
+            datetime.timezone.utc,
+        )
+        updated = dt.timestamp()
+    out = templates.ATOM_BEGIN % (
+        html.escape(f"{date_start} to {date_end}"),
+        page,
+        page,
+        _isodate(updated),
+    )
+    out += entries
+    out += templates.ATOM_END
+
+    commits_periodical.utils.write_text(filename_out, out)
@@ -0,0 +1,140 @@
+import collections
+import datetime
+import html
+import os.path
+import pickle
+import re
+
+import commits_periodical.utils
+
+FRAGMENTS_FILENAME = "fragments.htmlcache"
+
+# Evict the least-recently-used fragments beyond this total size
+MAX_BYTES = 64 * 1024 * 1024
+
+split_into_words = re.compile(r"(\s+)")
+
+# Part of the key of cached commit HTML.  Increase this whenever the HTML
+# of a commit changes without a change of templates: linkify(),
+# utils.commit_text_display(), or the tagline in get_commit_long().
+FRAGMENT_FORMAT = 1
+
+
+def linkify(text):
+    words = split_into_words.split(text)
+    for i, word in enumerate(words):
+        if word.startswith("https://"):
+            # Special-case for an "example" URL: we can't have <> in a link
+            # (even if it's escaped), so tidy5 would complain about this.
+            if any(s in word for s in ("&lt;", "&gt;")):
+                continue
+            words[i] = f'<a href="{word}">{word}</a>'
+    text = "".join(words)
+    return text
+
+
+def get_commit_long(
+    templates, githash, gitcommit, nostrip=False, fragments=None
+):
+    """Get HTML for a commit."""
+    if fragments is not None:
+        key = (githash, templates.digest, FRAGMENT_FORMAT, nostrip)
+        cached = fragments.get(key)
+        if cached is not None:
+            return cached
+
+    long = gitcommit.message
+    author = gitcommit.author
+    authordate = datetime.datetime.utcfromtimestamp(gitcommit.authored_date)
+
+    text = commits_periodical.utils.commit_text_display(long, nostrip)
+
+    url = templates.HTML_COMMIT_TAGLINE % (githash, githash, author, authordate)
+
+    # We don't want to end with a \n
+    text = html.escape(text).rstrip()
+    text = linkify(text)
+    if text:
+        text = f"<pre>{text}</pre>"
+
+    if fragments is not None:
+        fragments.put(key, (url, text))
+    return url, text
+
+
+class FragmentCache:
+    """Cache of rendered commit HTML, keyed by (githash, template digest,
+    FRAGMENT_FORMAT, nostrip), and shared by every report and variant.
+    Fragments are evicted least-recently-used first, but the cache is only
+    rewritten if a fragment was added or evicted; the order in which
+    fragments were used is saved along with that.
+    """
+
+    def __init__(self, project_dirname, max_bytes=MAX_BYTES):
+        self.filename = os.path.join(project_dirname, FRAGMENTS_FILENAME)
+        self.max_bytes = max_bytes
+        self.fragments = self._load()
+        self.num_bytes = sum(_size(v) for v in self.fragments.values())
+        # The fragments used (or added) by this command, least recent first
+        self.used = collections.OrderedDict()
+        self.modified = False
+        self.hits = 0
+        self.misses = 0
+        self._evict()
+
+    def _load(self):
+        if not os.path.exists(self.filename):
+            return collections.OrderedDict()
+        with open(self.filename, "rb") as fp:
+            return pickle.load(fp)
+
+    def _use(self, key, value):
+        self.used[key] = value
+        self.used.move_to_end(key)
+
+    def get(self, key):
+        value = self.fragments.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.fragments.move_to_end(key)
+        self._use(key, value)
+        return value
+
+    def put(self, key, value):
+        if key in self.fragments:
+            self.num_bytes -= _size(self.fragments[key])
+        self.fragments[key] = value
+        self.num_bytes += _size(value)
+        self._use(key, value)
+        self.modified = True
+        self._evict()
+
+    def _evict(self):
+        while self.num_bytes > self.max_bytes and self.fragments:
+            key, value = self.fragments.popitem(last=False)
+            self.num_bytes -= _size(value)
+            self.used.pop(key, None)
+            self.modified = True
+
+    def save(self):
+        if not self.modified:
+            return
+        with commits_periodical.utils.lock_cache(self.filename):
+            # Another command may have saved the cache since it was loaded
+            self.fragments = self._load()
+            for key, value in self.used.items():
+                self.fragments[key] = value
+                self.fragments.move_to_end(key)
+            self.num_bytes = sum(_size(v) for v in self.fragments.values())
+            self._evict()
+            with commits_periodical.utils.atomic_write(
+                self.filename, "wb"
+            ) as fp:
+                pickle.dump(self.fragments, fp)
+        self.modified = False
+
+
+def _size(value):
+    return sum(len(s) for s in value)
@@ -1,51 +1,21 @@
-import collections
+import dataclasses
 import datetime
 import html
 import os.path
-import re
 import sys
 
 import commits_periodical
-import commits_periodical.data
-import commits_periodical.gitlayer
+import commits_periodical.aggregate
+import commits_periodical.announcement
+import commits_periodical.feeds
+import commits_periodical.fragments
 import commits_periodical.html_templates
+import commits_periodical.metrics
+import commits_periodical.model
+import commits_periodical.shards
 import commits_periodical.utils
 
 
-split_into_words = re.compile(r"(\s+)")
-
-
-def linkify(text):
-    words = split_into_words.split(text)
-    for i, word in enumerate(words):
-        if word.startswith("https://"):
-            # Special-case for an "example" URL: we can't have <> in a link
-            # (even if it's escaped), so tidy5 would complain about this.
-            if any(s in word for s in ("&lt;", "&gt;")):
-                continue
-            words[i] = f'<a href="{word}">{word}</a>'
-    text = "".join(words)
-    return text
-
-
-def get_commit_long(templates, githash, gitcommit, nostrip=False):
-    """Get HTML for a commit."""
-    long = gitcommit.message
-    author = gitcommit.author
-    authordate = datetime.datetime.utcfromtimestamp(gitcommit.authored_date)
-
-    text = commits_periodical.utils.commit_text_display(long, nostrip)
-
-    url = templates.HTML_COMMIT_TAGLINE % (githash, githash, author, authordate)
-
-    # We don't want to end with a \n
-    text = html.escape(text).rstrip()
-    text = linkify(text)
-    if text:
-        text = f"<pre>{text}</pre>"
-    return url, text
-
-
 def commit_debug_info(entry):
     text = ""
     if entry.has_auto_cat():
@@ -65,19 +35,48 @@ def commit_debug_info(entry):
     return text
 
 
-def commit_text(templates, repo, report, item, is_high, debug):
-    """Get a commit message, formatted as HTML."""
-    name, entry = item
-    if entry.has_group() and not is_high:
-        return commit_group_text(templates, repo, report, item, debug)
-    githash = name
+def crossref_links(templates, commit, debug):
+    """Get HTML for reverts and fixes of this commit which are in other
+    reports.
+    """
+    text = ""
+    for description, other, other_report in commit.crossrefs:
+        page = f"{other_report}-debug" if debug else other_report
+        text += templates.HTML_CROSSREF % (
+            description,
+            other,
+            other[:12],
+            page,
+            other_report,
+        )
+    return text
 
-    gitcommit = repo.get_commit(githash)
-    short = gitcommit.summary
 
-    url, text = get_commit_long(templates, githash, gitcommit)
+def add_anchor(out, item):
+    """Give the item an id, if highlighted copies need to link to it."""
+    if not any(commit.entry.is_highlighted() for commit in item.commits):
+        return out
+    githash = item.commits[0].githash
+    return out.replace("<details", f'<details id="c-{githash}"', 1)
+
+
+def commit_text(templates, item, debug, fragments):
+    """Get a commit message, formatted as HTML."""
+    if item.link_to:
+        summary = html.escape(item.summary)
+        return templates.HTML_HIGHLIGHT_LINK % (item.link_to, summary)
+    if item.is_group:
+        out = commit_group_text(templates, item, debug, fragments)
+        return add_anchor(out, item)
+    commit = item.commits[0]
+    entry = commit.entry
+
+    url, text = commits_periodical.fragments.get_commit_long(
+        templates, commit.githash, commit.gitcommit, fragments=fragments
+    )
     inner = templates.HTML_DETAILS_INNER % (text, url)
-    out = templates.HTML_DETAILS_OUTER % (html.escape(short), inner)
+    inner += crossref_links(templates, commit, debug)
+    out = templates.HTML_DETAILS_OUTER % (html.escape(item.summary), inner)
 
     if debug:
         text = commit_debug_info(entry)
@@ -87,41 +86,25 @@ def commit_text(templates, repo, report, item, is_high, debug):
         if entry.is_cat_disputed():
             out = out.replace("<details>", '<details class="debug">')
 
-    return out
+    return add_anchor(out, item)
 
 
-def commit_group_text(templates, repo, report, item, debug):
+def commit_group_text(templates, item, debug, fragments):
     """Generate HTML for a commit group."""
-    name, entry = item
-    owns = report.groups[entry.groupname()]
-
-    if owns[0] in commit_group_text.seen:
-        return ""
-
-    if owns[0].cat == "reverts" and len(owns) == 2:
-        assert owns[1].cat == "reverts"
-
-        gitcommit1 = repo.get_commit(owns[0].githash)
-        summary = f"Commit & revert pair: {gitcommit1.summary}"
-    else:
-        # Strip the number from the groupname
-        name = owns[0].groupname()[:-3]
-        summary = f"Commit group #{commit_group_text.num_generic}: {name}"
-        commit_group_text.num_generic += 1
-
     inner = ""
-    for i, entry in enumerate(owns):
-        gitcommit = repo.get_commit(entry.githash)
-        url, text = get_commit_long(
-            templates, entry.githash, gitcommit, nostrip=True
+    for i, commit in enumerate(item.commits):
+        entry = commit.entry
+        url, text = commits_periodical.fragments.get_commit_long(
+            templates, commit.githash, commit.gitcommit, True, fragments
         )
         if i > 0:
             inner += "<hr>"
         inner += templates.HTML_DETAILS_INNER % (text, url)
+        inner += crossref_links(templates, commit, debug)
 
         if debug:
             inner += commit_debug_info(entry)
-    out = templates.HTML_DETAILS_OUTER % (html.escape(summary), inner)
+    out = templates.HTML_DETAILS_OUTER % (html.escape(item.summary), inner)
 
     if debug and entry.has_fixed_cat():
         fc = entry.get_fixed_cat()
@@ -133,71 +116,10 @@ def commit_group_text(templates, repo, report, item, debug):
         text += f"<code>{fc}</code> because '<code>{reason}</code>'</p>"
         out = out.replace("</details>", f"{text}</details>")
 
-    # record that we've handled these already
-    commit_group_text.seen.extend(owns)
     return out
 
 
-# FIXME: hack
-commit_group_text.seen = []
-commit_group_text.num_generic = 0
-
-
-def split_into_categories(doc, only_show):
-    """Get a dict containing per-category entries."""
-    cats = collections.defaultdict(list)
-    for item in doc.get_entries():
-        _, entry = item
-        if not only_show or (only_show and entry.cat in only_show):
-            cats[entry.cat].append(item)
-
-    # Make extra copies of "highlighted" commits
-    if not only_show or "highlight" in only_show:
-        for item in doc.get_entries():
-            _, entry = item
-            if entry.is_highlighted():
-                cats["highlight"].append(item)
-
-    return cats
-
-
-def make_table_classification(cats, total_commits):
-    num_in_groups = 0
-    num_manual = 0  # this is for totally manual, i.e. not disputed
-    reason_totals = collections.defaultdict(int)
-    disputed_totals = collections.defaultdict(int)
-    num_group_consecutive = 0
-    num_group_reverts = 0
-    num_group_fixes = 0
-
-    # Count mis-classified and un-classified
-    for cat, entries in cats.items():
-        # Don't count highlighted commits (they're copies)
-        if cat == "highlight":
-            continue
-
-        for _, entry in entries:
-            if entry.has_auto_cat():
-                ac_section, _ = entry.get_auto_reasons()
-                reason_totals[ac_section] += 1
-
-                if entry.is_cat_disputed():
-                    disputed_totals[ac_section] += 1
-            elif entry.has_manual_cat():
-                num_manual += 1
-
-            if entry.has_group():
-                num_in_groups += 1
-                if entry.groupname().startswith("revert-pair"):
-                    num_group_reverts += 1
-                elif entry.has_fixed_cat():
-                    num_group_fixes += 1
-                else:
-                    num_group_consecutive += 1
-
-    # for s in sorted(reason_totals.keys()):
-    #    print("%s\t%i\t%i" % (s, reason_totals[s], disputed_totals[s]))
-
+def make_table_classification(stats, total_commits):
     def table_row(num, total_commits, text, disputed=None):
         if total_commits == 0:
             perc = 0
@@ -209,9 +131,6 @@ def make_table_classification(cats, total_commits):
         out += f"<td>{text}</td></tr>"
         return out
 
-    num_unknown = total_commits - sum(reason_totals.values()) - num_manual
-    num_misclassified = sum(disputed_totals.values())
-
     # Display that data
     section = '<div class="debug">'
     section += "<p>debug: info about the automatic classification</p>"
@@ -219,17 +138,19 @@ def make_table_classification(cats, total_commits):
     section += (
         "<tr><th>num</th><th>%</th><th>num changed</th><th>stage</th></tr>"
     )
-    for reason in sorted(reason_totals.keys()):
+    for reason in sorted(stats.reason_totals.keys()):
         section += table_row(
-            reason_totals[reason],
+            stats.reason_totals[reason],
             total_commits,
             reason,
-            disputed_totals[reason],
+            stats.disputed_totals.get(reason, 0),
         )
     section += table_row(
-        num_manual, total_commits, "Manually-classified commits", 0
+        stats.num_manual, total_commits, "Manually-classified commits", 0
+    )
+    section += table_row(
+        stats.num_unknown, total_commits, "Unclassified commits", 0
     )
-    section += table_row(num_unknown, total_commits, "Unclassified commits", 0)
     section += "</table>"
 
     section += "<p>debug: more stats</p>"
@@ -237,54 +158,48 @@ def make_table_classification(cats, total_commits):
     section += "<table>"
     section += "<tr><th>num</th><th>%</th><th>stage</th></tr>"
     section += table_row(
-        num_misclassified, total_commits, "Misclassified commits"
+        stats.num_misclassified, total_commits, "Misclassified commits"
     )
     section += table_row(
-        total_commits - num_misclassified - num_manual - num_unknown,
+        total_commits
+        - stats.num_misclassified
+        - stats.num_manual
+        - stats.num_unknown,
         total_commits,
         "Classified commits, no corrections",
     )
     section += "</table>"
     section += "<p>debug: groups</p>"
     section += "<table>"
-    section += table_row(num_group_reverts, total_commits, "num in revert")
-    section += table_row(num_group_fixes, total_commits, "num in fixes")
     section += table_row(
-        num_group_consecutive, total_commits, "num in consecutive"
+        stats.num_group_reverts, total_commits, "num in revert"
+    )
+    section += table_row(stats.num_group_fixes, total_commits, "num in fixes")
+    section += table_row(
+        stats.num_group_consecutive, total_commits, "num in consecutive"
+    )
+    section += table_row(
+        stats.num_in_groups, total_commits, "Commits in groups"
     )
-    section += table_row(num_in_groups, total_commits, "Commits in groups")
     section += "</table>"
     section += "</div>"
     return section
 
 
-def make_preamble(project, cats, debug, only_show):
+def make_preamble(model):
     """Generate the 'preamble' section."""
     section = "<section>"
     section += "<p>Table of contents and commits per category:</p>"
     section += "<table>"
-    total_commits = 0
-    for cat, entries in cats.items():
-        # Don't count highlighted commits (they're copies)
-        if cat == "highlight":
-            continue
-        total_commits += len(entries)
+    total_commits = model.total_commits
 
-    # Special case: override the above if we only have "highlight".
-    if len(cats.keys()) == 1 and "highlight" in cats:
-        total_commits = len(cats["highlight"])
-
-    for cat, catinfo in project.categories.items():
-        if only_show:
-            if cat not in only_show:
-                continue
-
-        section_name, _ = catinfo
+    for report_section in model.sections:
+        cat = report_section.cat
+        section_name = report_section.title
         if not section_name:
             continue
 
-        relevant = cats[cat]
-        num = len(relevant)
+        num = report_section.num
         if total_commits == 0:
             perc = 0
         else:
@@ -311,62 +226,46 @@ def make_preamble(project, cats, debug, only_show):
     """
     section += "</table>\n"
 
-    if debug:
-        section += make_table_classification(cats, total_commits)
+    if model.debug:
+        section += make_table_classification(model.stats, total_commits)
 
     section += "</section>"
     return section
 
 
-def make_section(
-    templates, repo, report, cats, cat, section_title, intro_text, debug
-):
+def make_section(templates, report_section, debug, fragments, shards):
     """Generate HTML for a normal section."""
-    if cat == "quit":
-        return None
-    if section_title is None:
+    if not report_section.is_shown():
         return None
-    is_high = cat == "highlight"
+    cat = report_section.cat
     section = f"<section id='{cat}'>"
-    section += templates.HTML_SECTION % (section_title, cat, cat)
-    if intro_text:
-        section += f"<p>{intro_text}</p>"
-    relevant = cats[cat]
-    for item in relevant:
-        section += commit_text(templates, repo, report, item, is_high, debug)
-    if len(relevant) == 0:
+    section += templates.HTML_SECTION % (report_section.title, cat, cat)
+    if report_section.intro:
+        section += f"<p>{report_section.intro}</p>"
+    for num, item in enumerate(report_section.items):
+        details = commit_text(templates, item, debug, fragments)
+        if shards and not item.link_to:
+            details = shards.add(cat, num, details)
+        section += details
+    if report_section.num == 0:
         section += "<p>-- no commits in this category this week --</p>"
     section += "</section>"
     return section
 
 
-def generate_period(
-    repo,
-    doc,
-    project,
-    index_entry,
-    debug,
-    project_dirname,
-    reproducible,
-    index_entry_name,
-):
-    """Generate HTML for the latest report."""
-    if index_entry.get("ongoing") and not debug:
-        print("Refusing to generate 'release' HTML for ongoing")
-        sys.exit(0)
-
-    templates = commits_periodical.html_templates.HtmlTemplates()
+def emit_html(model, filename_base, templates, fragments, options):
+    """Write the report as an HTML page."""
+    filename_out = f"{filename_base}.html"
+    print(f"Generating HTML for {model.name} in {filename_out}")
 
-    filename_out = os.path.join(
-        project_dirname.replace("projects/", "out/"), f"{index_entry_name}.html"
-    )
-    if debug:
-        filename_out = filename_out.replace(".html", "-debug.html")
-    print(f"Generating HTML for {doc.filename} in {filename_out}")
+    shards = None
+    if options.shard_size:
+        shards = commits_periodical.shards.Shards(
+            filename_base, options.shard_size
+        )
 
-    # Split into categories
-    only_show = index_entry.get("only_show", False)
-    cats = split_into_categories(doc, only_show)
+    index_entry = model.index_entry
+    debug = model.debug
 
     # Add preamble
     sections = []
@@ -381,17 +280,13 @@ def generate_period(
         intro = intro.replace("</section>", f"{text}</section>")
 
     sections.append(intro)
-    section = make_preamble(project, cats, debug, only_show)
+    section = make_preamble(model)
     sections.append(section)
 
     # Handle each category
-    for cat, catinfo in project.categories.items():
-        if only_show:
-            if cat not in only_show:
-                continue
-        section_title, intro_text = catinfo
+    for report_section in model.sections:
         section = make_section(
-            templates, repo, doc, cats, cat, section_title, intro_text, debug
+            templates, report_section, debug, fragments, shards
         )
         if section:
             sections.append(section)
@@ -416,23 +311,93 @@ def generate_period(
         alternate_version += " (contains info about the classification)"
     version = commits_periodical.__version__
     now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
-    if reproducible:
+    if options.reproducible:
         now = "(time removed for reproducibility)"
     out += templates.RELEASE_DEBUG % (version, now, alternate_version)
 
+    if shards:
+        out += templates.HTML_SHARDS_SCRIPT
     out += templates.HTML_END
 
-    with open(filename_out, "w", encoding="utf8") as fp:
-        fp.write(out)
+    commits_periodical.utils.write_text(filename_out, out)
+
+    if shards:
+        shards.save()
+
+
+@dataclasses.dataclass
+class EmitOptions:
+    reproducible: bool = False
+    # If non-zero, write commit bodies to shards of this many items
+    shard_size: int = 0
+
+
+EMITTERS = {
+    "html": emit_html,
+    "json": commits_periodical.feeds.emit_json,
+    "atom": commits_periodical.feeds.emit_atom,
+    "email": commits_periodical.announcement.emit_announcement,
+}
+
+
+def generate_period(
+    repo,
+    doc,
+    project,
+    index_entry,
+    debug,
+    project_dirname,
+    reproducible,
+    index_entry_name,
+    archive,
+    formats=("html",),
+    shard_size=0,
+):
+    """Generate HTML (and any other formats) for the latest report."""
+    if index_entry.get("ongoing") and not debug:
+        print("Refusing to generate 'release' HTML for ongoing")
+        sys.exit(0)
+
+    for fmt in formats:
+        if fmt not in EMITTERS:
+            print(f"Output format not recognized: {fmt}")
+            sys.exit(1)
+
+    templates = commits_periodical.html_templates.HtmlTemplates()
+    fragments = commits_periodical.fragments.FragmentCache(project_dirname)
+
+    filename_base = os.path.join(
+        project_dirname.replace("projects/", "out/"), index_entry_name
+    )
+    if debug:
+        filename_base += "-debug"
+
+    # Sort the commits into sections, once for every output format
+    with commits_periodical.metrics.phase("build_model"):
+        model = commits_periodical.model.build_model(
+            repo, doc, project, index_entry, index_entry_name, archive, debug
+        )
+    options = EmitOptions(reproducible=reproducible, shard_size=shard_size)
+    for fmt in formats:
+        with commits_periodical.metrics.phase(f"emit_{fmt}"):
+            EMITTERS[fmt](model, filename_base, templates, fragments, options)
+
+    fragments.save()
+    commits_periodical.metrics.count("fragment_cache_hits", fragments.hits)
+    commits_periodical.metrics.count("fragment_cache_misses", fragments.misses)
 
 
 def index_table(index, start_dates):
     out = "<table>"
     out += "<tr><th>Report</th>"
-    out += "<th>Report with extra info about classification</th></tr>"
+    out += "<th>Report with extra info about classification</th>"
+    out += "<th>Commits</th><th>Highlighted</th></tr>"
     for start_date in start_dates:
         index_entry = index.get_index_entry(start_date)
         display_name = index_entry.get_display_name()
+        aggregate = commits_periodical.aggregate.load(
+            index.get_filename(start_date)
+        )
         out += "<tr>"
         out += "<td>"
         if not index_entry.get("ongoing"):
@@ -443,6 +408,17 @@ def index_table(index, start_dates):
         out += "<td>"
         out += f'<a href="{start_date}-debug.html">{display_name} (debug)</a>'
         out += "</td>"
+        # Counts are only known for reports which have been annotated
+        if aggregate is not None:
+            cats = ", ".join(
+                f"{cat}: {num}"
+                for cat, num in aggregate.categories.items()
+                if num
+            )
+            out += f'<td title="{cats}">{aggregate.total_commits}</td>'
+            out += f"<td>{len(aggregate.highlighted)}</td>"
+        else:
+            out += "<td></td><td></td>"
         out += "</tr>"
     out += "</table>"
     return out
@@ -471,5 +447,4 @@ def generate_index(project_dirname, index):
 
     out = templates.index % (regular_reports, alternates)
 
-    with open(filename_out, "w", encoding="utf8") as fp:
-        fp.write(out)
+    commits_periodical.utils.write_text(filename_out, out)
@@ -1,9 +1,14 @@
+import bisect
 import dataclasses
+import json
 import os.path
 import pickle
 
 import git
 
+import commits_periodical.metrics
+import commits_periodical.utils
+
 
 @dataclasses.dataclass
 class CachedCommit:
@@ -26,13 +31,86 @@ class CachedCommit:
         )
 
 
+def read_packed_ref(git_dirname, ref):
+    """Get the hash of the ref from the packed-refs file, or None."""
+    filename = os.path.join(git_dirname, "packed-refs")
+    if not os.path.exists(filename):
+        return None
+    with open(filename, encoding="utf8") as fp:
+        for line in fp:
+            if line.startswith(("#", "^")):
+                continue
+            githash, _, name = line.strip().partition(" ")
+            if name == ref:
+                return githash
+    return None
+
+
+def read_ref(git_dirname, ref="HEAD"):
+    """Get the hash of the ref by reading the files in the .git directory,
+    which is much cheaper than starting git.  Returns None if the ref can't
+    be read this way.
+    """
+    dot_git = os.path.join(git_dirname, ".git")
+    if os.path.isdir(dot_git):
+        git_dirname = dot_git
+    elif os.path.exists(dot_git):
+        # Worktrees keep some refs elsewhere; let git handle them
+        return None
+
+    # Follow symbolic refs, such as HEAD -> refs/heads/main
+    for _ in range(5):
+        filename = os.path.join(git_dirname, ref)
+        if os.path.isfile(filename):
+            with open(filename, encoding="utf8") as fp:
+                value = fp.read().strip()
+        else:
+            value = read_packed_ref(git_dirname, ref)
+        if value is None:
+            return None
+        if not value.startswith("ref: "):
+            break
+        ref = value.removeprefix("ref: ")
+
+    if len(value) != 40:
+        return None
+    return value
+
+
+def get_first_parent_githashes(
+    git_dirname: str, start_after: str, end_including: str
+):
+    """Get the hashes of the first-parent history in the range, oldest
+    first, from a single 'git rev-list'.
+    """
+    repo = git.Repo(git_dirname)
+    if repo.is_dirty():
+        raise SystemError("Repo is dirty; resolve")
+    commits_periodical.metrics.count("git_commands", 2)
+    githashes = repo.git.rev_list(
+        f"{start_after}..{end_including}", reverse=True, first_parent=True
+    )
+    return githashes.splitlines()
+
+
+def read_commits(git_dirname: str, githashes: list[str]):
+    """Read the commits from git with a repo of their own, so that this can
+    run in a separate process.
+    """
+    repo = git.Repo(git_dirname)
+    return [CachedCommit.from_gitcommit(repo.commit(h)) for h in githashes]
+
+
 class CachedRepo:
     def __init__(self, git_dirname: str, cache_filename: str) -> None:
         self.git_dirname = git_dirname
         self.cache_filename = cache_filename
         self.repo = None
         self.gitcommits = None
+        self.sorted_githashes = None
         self.trust_cache = False
+        # The (start_after, end_including) range whose commits are all cached
+        self.cached_range = None
 
     def add_cache(self, filename):
         if self.gitcommits is None:
@@ -40,6 +118,7 @@ class CachedRepo:
         with open(filename, "rb") as fp:
             cache_gitcommits = pickle.load(fp)
             self.gitcommits.update(cache_gitcommits)
+        self.sorted_githashes = None
         self.trust_cache = True
 
     def _setup_gitcommits(self):
@@ -47,6 +126,7 @@ class CachedRepo:
             with open(self.cache_filename, "rb") as fp:
                 self.gitcommits = pickle.load(fp)
             self.trust_cache = True
+            self._load_cached_range()
         else:
             # We can't trust a cache that doesn't exist
             self.trust_cache = False
@@ -58,16 +138,44 @@ class CachedRepo:
     def _load_actual_repo(self):
         # Load the git repo and ensure that it's clean
         self.repo = git.Repo(self.git_dirname)
+        commits_periodical.metrics.count("git_commands")
         if self.repo.is_dirty():
             raise SystemError("Repo is dirty; resolve")
 
+    def get_range_filename(self):
+        return self.cache_filename.replace(".gitcache", ".gitrange")
+
+    def _load_cached_range(self):
+        filename = self.get_range_filename()
+        if not os.path.exists(filename):
+            return
+        with open(filename, encoding="utf8") as fp:
+            data = json.load(fp)
+        self.cached_range = (data["start_after"], data["end_including"])
+
     def save(self):
-        with open(self.cache_filename, "wb") as fp:
+        with commits_periodical.utils.atomic_write(
+            self.cache_filename, "wb"
+        ) as fp:
             pickle.dump(self.gitcommits, fp)
 
+        # Written after the cache, so that it never claims more than the
+        # cache holds
+        if self.cached_range is not None:
+            start_after, end_including = self.cached_range
+            data = {"start_after": start_after, "end_including": end_including}
+            with commits_periodical.utils.atomic_write(
+                self.get_range_filename()
+            ) as fp:
+                json.dump(data, fp, indent=2)
+
     def get_head_hash(self):
+        githash = read_ref(self.git_dirname)
+        if githash is not None:
+            return githash
         if self.repo is None:
             self._load_actual_repo()
+        commits_periodical.metrics.count("git_commands")
         return self.repo.head.commit.hexsha
 
     def get_githashes(self):
@@ -76,25 +184,81 @@ class CachedRepo:
     def ensure_cached(self, start_after: str, end_including: str):
         if self.gitcommits is None:
             self._setup_gitcommits()
+        if self.cached_range == (start_after, end_including):
+            commits_periodical.metrics.count("gitcache_hits")
+            return
         if start_after in self.gitcommits and end_including in self.gitcommits:
+            commits_periodical.metrics.count("gitcache_hits")
             return
+        commits_periodical.metrics.count("gitcache_misses")
+
+        for githash in self.get_uncached_githashes(start_after, end_including):
+            self.add_commit(self.read_commit(githash))
+
+        self.set_cached_range(start_after, end_including)
+        self.save()
 
+    def get_uncached_githashes(self, start_after: str, end_including: str):
+        """Get the hashes in the range which aren't in the cache, oldest
+        first.  If the cache holds an earlier part of the range, only the
+        commits since then are listed.
+        """
+        if self.gitcommits is None:
+            self._setup_gitcommits()
+        if self.cached_range == (start_after, end_including):
+            return []
         if self.repo is None:
             self._load_actual_repo()
 
+        rev_start = start_after
+        if self.cached_range is not None:
+            cached_start, cached_end = self.cached_range
+            if cached_start == start_after and self._is_ancestor(
+                cached_end, end_including
+            ):
+                rev_start = cached_end
+
+        commits_periodical.metrics.count("git_commands")
         githashes = self.repo.git.rev_list(
-            f"{start_after}..{end_including}", reverse=True, first_parent=True
+            f"{rev_start}..{end_including}", reverse=True, first_parent=True
         )
+        return [h for h in githashes.splitlines() if h not in self.gitcommits]
 
-        modified = False
-        for githash in githashes.splitlines():
-            if githash not in self.gitcommits:
-                commit = CachedCommit.from_gitcommit(self.repo.commit(githash))
-                self.gitcommits[githash] = commit
-                modified = True
+    def _is_ancestor(self, ancestor: str, githash: str):
+        commits_periodical.metrics.count("git_commands")
+        try:
+            return self.repo.is_ancestor(ancestor, githash)
+        except git.GitCommandError:
+            # e.g. the ancestor is no longer in the repo
+            return False
+
+    def set_cached_range(self, start_after: str, end_including: str):
+        """Record that every commit in the range is in the cache."""
+        self.cached_range = (start_after, end_including)
+
+    def replace_cache(self, gitcommits, start_after: str, end_including: str):
+        """Replace the cache with these commits, which are every commit in
+        the range.
+        """
+        self.gitcommits = {}
+        self.sorted_githashes = None
+        self.trust_cache = True
+        for gitcommit in gitcommits:
+            self.add_commit(gitcommit)
+        self.set_cached_range(start_after, end_including)
+
+    def read_commit(self, githash: str) -> CachedCommit:
+        """Read a commit from git (without adding it to the cache)."""
+        if self.repo is None:
+            self._load_actual_repo()
+        # Reading the modified files runs 'git diff'
+        commits_periodical.metrics.count("git_commands")
+        return CachedCommit.from_gitcommit(self.repo.commit(githash))
 
-        if modified:
-            self.save()
+    def add_commit(self, gitcommit: CachedCommit):
+        self.gitcommits[gitcommit.githash] = gitcommit
+        self.sorted_githashes = None
+        commits_periodical.metrics.count("commits_ingested")
 
     def get_commit(
         self, githash: str, allow_partial: bool = False
@@ -121,9 +285,16 @@ class CachedRepo:
 
         # Handle partial hashes
         assert allow_partial is True
-        matches = [
-            v for k, v in self.gitcommits.items() if k.startswith(githash)
-        ]
+        if self.sorted_githashes is None:
+            self.sorted_githashes = sorted(self.gitcommits)
+        sorted_githashes = self.sorted_githashes
+        i = bisect.bisect_left(sorted_githashes, githash)
+        matches = []
+        while i < len(sorted_githashes) and sorted_githashes[i].startswith(
+            githash
+        ):
+            matches.append(self.gitcommits[sorted_githashes[i]])
+            i += 1
         if not matches:
             return None
         if len(matches) > 1:
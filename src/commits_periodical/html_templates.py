@@ -1,7 +1,10 @@
 import dataclasses
+import hashlib
 import importlib.resources
 import tomllib
 
+import commits_periodical
+
 
 @dataclasses.dataclass
 class HtmlTemplates:
@@ -10,7 +13,13 @@ class HtmlTemplates:
             "html_templates.toml"
         )
         with data_path.open("rb") as fp:
-            self.doc = tomllib.load(fp)
+            data = fp.read()
+        self.doc = tomllib.loads(data.decode("utf8"))
+
+        # Identifies the templates (and the code using them) for caches
+        digest = hashlib.sha256(data)
+        digest.update(commits_periodical.__version__.encode("utf8"))
+        self.digest = digest.hexdigest()
 
         # Promote all those templates to object attributes
         for key, value in self.doc.items():
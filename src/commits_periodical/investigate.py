@@ -1,3 +1,9 @@
+import re
+
+import commits_periodical.query
+import commits_periodical.trends
+
+
 def check_disputed(repo, doc):
     num_disputed = 0
     print("Disputed entries:")
@@ -14,7 +20,37 @@ def check_disputed(repo, doc):
         print("  (No disputed entries in this report)")
 
 
-def investigate(repo, doc, funcs):
+def print_query(query_index, terms):
+    """Print the commits matching the query terms; raises ValueError or
+    re.error if the terms aren't valid.
+    """
+    githashes = query_index.query(terms)
+    for githash in githashes:
+        record = query_index.records[githash]
+        cat = record.category
+        print(f"{record.report}  {githash[:12]}  {cat:14}  {record.summary}")
+    print(f"{len(githashes)} matching commits in the archive")
+
+
+def query_archive(project_dirname, index, terms):
+    query_index = commits_periodical.query.QueryIndex(project_dirname)
+    query_index.update(index)
+    try:
+        print_query(query_index, terms)
+    except (ValueError, re.error) as err:
+        print(err)
+        exit(1)
+
+
+def investigate(repo, doc, funcs, project_dirname, index):
+    # Queries are over the whole archive, not just this report
+    if funcs and funcs[0] == "query":
+        query_archive(project_dirname, index, funcs[1:])
+        return
+    if funcs and funcs[0] == "trends":
+        commits_periodical.trends.trends(project_dirname, index, funcs[1:])
+        return
+
     print(f"Investigating {len(doc.entries)} commits")
 
     for func in funcs:
@@ -0,0 +1,168 @@
+import collections
+import contextlib
+import json
+import resource
+import sys
+import time
+
+import commits_periodical.utils
+
+# Prefix for the names of metrics in the Prometheus textfile
+PROMETHEUS_PREFIX = "commits_periodical"
+
+# Descriptions of the counters; others are written without a description
+COUNTER_HELP = {
+    "commits_ingested": "Commits read from git and added to a cache",
+    "git_commands": "git commands run (each starts at least one process)",
+    "gitcache_hits": "Reports whose cached commits covered the range",
+    "gitcache_misses": "Reports which needed commits from git",
+    "fragment_cache_hits": "Commits whose rendered HTML was cached",
+    "fragment_cache_misses": "Commits whose HTML needed rendering",
+    "bytes_written": "Bytes written to reports, caches, and output files",
+}
+
+
+class Metrics:
+    """Durations and counts for a single run, for schedulers to track."""
+
+    def __init__(self):
+        self.start = time.time()
+        self.labels = {}
+        self.phases = collections.Counter()
+        self.counters = collections.Counter()
+        # Classifier section -> number of commits it classified
+        self.sections = collections.Counter()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - start
+
+    def get_record(self):
+        return {
+            "labels": self.labels,
+            "timestamp": int(self.start),
+            "duration_seconds": time.time() - self.start,
+            "phases": dict(self.phases),
+            "counters": dict(self.counters),
+            "sections": dict(self.sections),
+            "peak_rss_bytes": get_peak_rss(),
+        }
+
+
+def get_peak_rss():
+    """Get the peak resident set size of this process or any (finished)
+    child process, in bytes.
+    """
+    peak = 0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        peak = max(peak, resource.getrusage(who).ru_maxrss)
+    # macOS reports bytes; everything else reports kilobytes
+    if sys.platform != "darwin":
+        peak *= 1024
+    return peak
+
+
+current = Metrics()
+
+
+def reset(**labels):
+    """Start recording a new run."""
+    global current
+    current = Metrics()
+    current.labels.update(labels)
+
+
+def phase(name):
+    """Context manager which adds the time spent to the named phase."""
+    return current.phase(name)
+
+
+def count(name, num=1):
+    current.counters[name] += num
+
+
+def count_section(name, num):
+    current.sections[name] += num
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    inner = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+    return "{" + inner + "}"
+
+
+def to_prometheus(records):
+    """Format the records in the Prometheus textfile format."""
+    # metric name -> (help, type, list of (labels, value))
+    metrics = {}
+
+    def add(name, help_text, labels, value, metric_type="gauge"):
+        name = f"{PROMETHEUS_PREFIX}_{name}"
+        if name not in metrics:
+            metrics[name] = (help_text, metric_type, [])
+        metrics[name][2].append((labels, value))
+
+    for record in records:
+        labels = record["labels"]
+        add(
+            "last_run_timestamp_seconds",
+            "When the run started",
+            labels,
+            record["timestamp"],
+        )
+        add(
+            "run_duration_seconds",
+            "Duration of the whole run",
+            labels,
+            record["duration_seconds"],
+        )
+        for name, seconds in record["phases"].items():
+            add(
+                "phase_duration_seconds",
+                "Duration of each phase of the run",
+                {**labels, "phase": name},
+                seconds,
+            )
+        for name, value in record["counters"].items():
+            add(name, COUNTER_HELP.get(name, name), labels, value)
+        for name, value in record["sections"].items():
+            add(
+                "classified_commits",
+                "Commits classified by each classifier section",
+                {**labels, "section": name},
+                value,
+            )
+        add(
+            "peak_rss_bytes",
+            "Peak resident set size",
+            labels,
+            record["peak_rss_bytes"],
+        )
+
+    out = ""
+    for name, (help_text, metric_type, samples) in metrics.items():
+        out += f"# HELP {name} {help_text}\n"
+        out += f"# TYPE {name} {metric_type}\n"
+        for labels, value in samples:
+            out += f"{name}{_format_labels(labels)} {value}\n"
+    return out
+
+
+def save(filename, records):
+    """Write the records as JSON, or in the Prometheus textfile format if
+    the filename ends with .prom.
+    """
+    if filename.endswith(".prom"):
+        text = to_prometheus(records)
+    else:
+        text = json.dumps({"runs": records}, indent=2) + "\n"
+    # Write atomically, since a collector may read it at any time
+    with commits_periodical.utils.atomic_write(filename) as fp:
+        fp.write(text)
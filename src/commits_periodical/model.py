@@ -0,0 +1,299 @@
+import collections
+import dataclasses
+
+import commits_periodical.data
+import commits_periodical.gitlayer
+
+# Attributes of an ArchiveEntry, and how to describe them
+ARCHIVE_LINKS = (
+    ("reverts", "Reverts"),
+    ("fixes", "Fixes"),
+    ("reverted_by", "Reverted by"),
+    ("fixed_by", "Fixed by"),
+)
+
+
+@dataclasses.dataclass
+class CommitModel:
+    githash: str
+    entry: commits_periodical.data.ReportEntry
+    gitcommit: commits_periodical.gitlayer.CachedCommit
+    # (description, githash, report name) for commits in other reports
+    crossrefs: list[tuple[str, str, str]]
+
+
+@dataclasses.dataclass
+class ItemModel:
+    """A single commit, or a group of commits, within a section."""
+
+    summary: str
+    commits: list[CommitModel]
+    is_group: bool
+    # For highlighted copies: the githash which identifies the item holding
+    # the full commit in its own category, or "" if that isn't shown
+    link_to: str = ""
+
+
+@dataclasses.dataclass
+class SectionModel:
+    cat: str
+    title: str
+    intro: str
+    # Number of entries in this category (including grouped commits)
+    num: int
+    items: list[ItemModel]
+
+    def is_shown(self):
+        return self.cat != "quit" and self.title is not None
+
+
+@dataclasses.dataclass
+class ClassificationStats:
+    reason_totals: dict[str, int]
+    disputed_totals: dict[str, int]
+    num_manual: int
+    num_unknown: int
+    num_misclassified: int
+    num_in_groups: int
+    num_group_consecutive: int
+    num_group_reverts: int
+    num_group_fixes: int
+
+
+@dataclasses.dataclass
+class ReportModel:
+    """Everything needed to write a report in any output format."""
+
+    name: str
+    index_entry: commits_periodical.data.IndexEntry
+    debug: bool
+    total_commits: int
+    sections: list[SectionModel]
+    stats: ClassificationStats
+
+    def get_section(self, cat):
+        for section in self.sections:
+            if section.cat == cat:
+                return section
+        return None
+
+    def get_commits(self):
+        """Generator to return each commit once (i.e. not the highlighted
+        copies).
+        """
+        for section in self.sections:
+            if section.cat == "highlight":
+                continue
+            for item in section.items:
+                yield from item.commits
+
+
+def split_into_categories(doc, only_show):
+    """Get a dict containing per-category entries."""
+    cats = collections.defaultdict(list)
+    for item in doc.get_entries():
+        _, entry = item
+        if not only_show or (only_show and entry.cat in only_show):
+            cats[entry.cat].append(item)
+
+    # Make extra copies of "highlighted" commits
+    if not only_show or "highlight" in only_show:
+        for item in doc.get_entries():
+            _, entry = item
+            if entry.is_highlighted():
+                cats["highlight"].append(item)
+
+    return cats
+
+
+def classification_stats(cats, total_commits):
+    num_in_groups = 0
+    num_manual = 0  # this is for totally manual, i.e. not disputed
+    reason_totals = collections.defaultdict(int)
+    disputed_totals = collections.defaultdict(int)
+    num_group_consecutive = 0
+    num_group_reverts = 0
+    num_group_fixes = 0
+
+    # Count mis-classified and un-classified
+    for cat, entries in cats.items():
+        # Don't count highlighted commits (they're copies)
+        if cat == "highlight":
+            continue
+
+        for _, entry in entries:
+            if entry.has_auto_cat():
+                ac_section, _ = entry.get_auto_reasons()
+                reason_totals[ac_section] += 1
+
+                if entry.is_cat_disputed():
+                    disputed_totals[ac_section] += 1
+            elif entry.has_manual_cat():
+                num_manual += 1
+
+            if entry.has_group():
+                num_in_groups += 1
+                if entry.groupname().startswith("revert-pair"):
+                    num_group_reverts += 1
+                elif entry.has_fixed_cat():
+                    num_group_fixes += 1
+                else:
+                    num_group_consecutive += 1
+
+    num_unknown = total_commits - sum(reason_totals.values()) - num_manual
+    num_misclassified = sum(disputed_totals.values())
+
+    return ClassificationStats(
+        reason_totals=dict(reason_totals),
+        disputed_totals=dict(disputed_totals),
+        num_manual=num_manual,
+        num_unknown=num_unknown,
+        num_misclassified=num_misclassified,
+        num_in_groups=num_in_groups,
+        num_group_consecutive=num_group_consecutive,
+        num_group_reverts=num_group_reverts,
+        num_group_fixes=num_group_fixes,
+    )
+
+
+def get_crossrefs(archive, doc, githash):
+    """Get reverts and fixes of this commit which are in other reports."""
+    if archive is None:
+        return []
+    archive_entry = archive.get(githash)
+    if archive_entry is None:
+        return []
+
+    crossrefs = []
+    for attr, description in ARCHIVE_LINKS:
+        for other in getattr(archive_entry, attr):
+            # Skip commits which are already on this page
+            if other in doc.entries:
+                continue
+            other_report = archive.get_report(other)
+            if other_report is None:
+                continue
+            crossrefs.append((description, other, other_report))
+    return crossrefs
+
+
+def link_highlighted(sections):
+    """Point each highlighted copy at the full commit in its own category,
+    so that it doesn't need to be rendered twice.
+    """
+    anchors = {}
+    for section in sections:
+        if section.cat == "highlight" or not section.is_shown():
+            continue
+        for item in section.items:
+            for commit in item.commits:
+                anchors[commit.githash] = item.commits[0].githash
+
+    for section in sections:
+        if section.cat != "highlight":
+            continue
+        for item in section.items:
+            item.link_to = anchors.get(item.commits[0].githash, "")
+
+
+def build_model(repo, doc, project, index_entry, name, archive, debug):
+    """Sort the report's entries into sections, groups, and highlighted
+    copies, looking up each commit once.
+    """
+    only_show = index_entry.get("only_show", False)
+    cats = split_into_categories(doc, only_show)
+
+    total_commits = 0
+    for cat, entries in cats.items():
+        # Don't count highlighted commits (they're copies)
+        if cat == "highlight":
+            continue
+        total_commits += len(entries)
+
+    # Special case: override the above if we only have "highlight".
+    if len(cats.keys()) == 1 and "highlight" in cats:
+        total_commits = len(cats["highlight"])
+
+    stats = classification_stats(cats, total_commits)
+
+    commits = {}
+
+    def get_commit_model(entry):
+        githash = entry.githash
+        if githash not in commits:
+            commits[githash] = CommitModel(
+                githash=githash,
+                entry=entry,
+                gitcommit=repo.get_commit(githash),
+                crossrefs=get_crossrefs(archive, doc, githash),
+            )
+        return commits[githash]
+
+    sections = []
+    seen = set()
+    num_generic = 0
+    for cat, catinfo in project.categories.items():
+        if only_show:
+            if cat not in only_show:
+                continue
+        section_title, intro_text = catinfo
+        section = SectionModel(
+            cat=cat,
+            title=section_title,
+            intro=intro_text,
+            num=len(cats[cat]),
+            items=[],
+        )
+        sections.append(section)
+        if not section.is_shown():
+            continue
+
+        is_high = cat == "highlight"
+        for _, entry in cats[cat]:
+            if not entry.has_group() or is_high:
+                commit = get_commit_model(entry)
+                section.items.append(
+                    ItemModel(
+                        summary=commit.gitcommit.summary,
+                        commits=[commit],
+                        is_group=False,
+                    )
+                )
+                continue
+
+            owns = doc.groups[entry.groupname()]
+            if owns[0].githash in seen:
+                continue
+
+            if owns[0].cat == "reverts" and len(owns) == 2:
+                assert owns[1].cat == "reverts"
+
+                gitcommit1 = repo.get_commit(owns[0].githash)
+                summary = f"Commit & revert pair: {gitcommit1.summary}"
+            else:
+                # Strip the number from the groupname
+                groupname = owns[0].groupname()[:-3]
+                summary = f"Commit group #{num_generic}: {groupname}"
+                num_generic += 1
+
+            section.items.append(
+                ItemModel(
+                    summary=summary,
+                    commits=[get_commit_model(e) for e in owns],
+                    is_group=True,
+                )
+            )
+
+            # record that we've handled these already
+            seen.update(e.githash for e in owns)
+
+    link_highlighted(sections)
+
+    return ReportModel(
+        name=name,
+        index_entry=index_entry,
+        debug=debug,
+        total_commits=total_commits,
+        sections=sections,
+        stats=stats,
+    )
@@ -0,0 +1,489 @@
+import contextlib
+import os.path
+
+import commits_periodical.aggregate
+import commits_periodical.announcement
+import commits_periodical.archive
+import commits_periodical.backfill
+import commits_periodical.classify
+import commits_periodical.data
+import commits_periodical.export
+import commits_periodical.generate
+import commits_periodical.gitlayer
+import commits_periodical.investigate
+import commits_periodical.metrics
+import commits_periodical.model
+import commits_periodical.project_data
+import commits_periodical.query
+import commits_periodical.refresh
+import commits_periodical.replay
+import commits_periodical.rule_coverage
+import commits_periodical.sanity_check
+import commits_periodical.search
+import commits_periodical.session
+import commits_periodical.update
+import commits_periodical.utils
+import commits_periodical.watch
+
+# Commands which need exclusive access to the project.  Other commands may
+# run at the same time; any caches which they update (fragments.htmlcache,
+# and the search and query indexes) have their own locks.
+MODIFYING_COMMANDS = [
+    "update",
+    "update-commits",
+    "backfill",
+    "rebuild-archive",
+    "annotate",
+    "refresh",
+    "new-report",
+]
+
+
+def get_stamps(filenames):
+    """Get the stamps of the files, with None for any which don't exist."""
+    return tuple(
+        commits_periodical.utils.file_stamp(filename)
+        if os.path.exists(filename)
+        else None
+        for filename in filenames
+    )
+
+
+class Project:
+    """A project's index, classifiers, archive, and reports, loaded when
+    they're first needed and kept between calls.  Anything which has changed
+    on disk (including changes made by other processes) is loaded again.
+
+    Report names are as in the index; "" means the latest report, and
+    "prev" the one before it.
+    """
+
+    def __init__(self, project_dirname, git_dirname=None):
+        self.project_dirname = project_dirname
+        self.git_dirname = git_dirname
+        # key -> (stamps of the files it was loaded from, value)
+        self._cache = {}
+        self._query_index = None
+        # Report name -> the ProjectData it was last classified with here
+        self._classified_with = {}
+
+    # Loading
+
+    def _get_cached(self, key, filenames, load):
+        stamps = get_stamps(filenames)
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == stamps:
+            return cached[1]
+        value = load()
+        self._cache[key] = (stamps, value)
+        return value
+
+    def _get_filename(self, basename):
+        return os.path.join(self.project_dirname, basename)
+
+    def get_index(self):
+        """Get the (read-only) index of reports."""
+        return self._get_cached(
+            "index",
+            [self._get_filename("index.toml")],
+            lambda: commits_periodical.data.Index(self.project_dirname),
+        )
+
+    def get_project_data(self):
+        """Get the categories and classifiers."""
+        filenames = [
+            self._get_filename("categories.toml"),
+            self._get_filename("classify.toml"),
+        ]
+        return self._get_cached(
+            "project_data",
+            filenames,
+            lambda: commits_periodical.project_data.ProjectData(
+                self.project_dirname
+            ),
+        )
+
+    def get_archive(self):
+        """Get the archive index."""
+        filename = self._get_filename(
+            commits_periodical.archive.ARCHIVE_FILENAME
+        )
+        return self._get_cached(
+            "archive",
+            [filename],
+            lambda: commits_periodical.archive.ArchiveIndex(
+                self.project_dirname
+            ),
+        )
+
+    def get_name(self, index, report=""):
+        """Get the name of the report in the index."""
+        if not report:
+            return index.get_latest_name()
+        if report == "prev":
+            return index.get_prev_name()
+        return report
+
+    def get_names(self, index, reports=None):
+        if reports is None:
+            reports = [""]
+        return [self.get_name(index, report) for report in reports]
+
+    def get_repo(self, index, name):
+        """Get the cached commits of a (non-derived) report."""
+        cache_filename = index.get_filename(name).replace(".toml", ".gitcache")
+        filenames = [
+            cache_filename,
+            cache_filename.replace(".gitcache", ".gitrange"),
+        ]
+        return self._get_cached(
+            ("repo", name),
+            filenames,
+            lambda: commits_periodical.gitlayer.CachedRepo(
+                self.git_dirname, cache_filename
+            ),
+        )
+
+    def get_report(self, index, name):
+        """Get the (read-only) report, and the cached commits it needs."""
+        index_entry = index.get_index_entry(name)
+        if index_entry.is_derived():
+            # Derived reports depend on the index and every span
+            filenames = [self._get_filename("index.toml")]
+            for span in index_entry["include_spans"]:
+                filename = index.get_filename(span)
+                filenames += [filename, filename.replace(".toml", ".gitcache")]
+            return self._get_cached(
+                ("report", name),
+                filenames,
+                lambda: commits_periodical.data.load_report(
+                    index, name, self.git_dirname
+                ),
+            )
+
+        filename = index.get_filename(name)
+        doc = self._get_cached(
+            ("doc", name),
+            [filename],
+            lambda: commits_periodical.data.Report(filename),
+        )
+        return self.get_repo(index, name), doc
+
+    @contextlib.contextmanager
+    def _locked(self, command):
+        """Hold the lock on the project while running the command."""
+        exclusive = command in MODIFYING_COMMANDS
+        with commits_periodical.metrics.phase("lock"):
+            lock = commits_periodical.utils.lock_project(
+                self.project_dirname, exclusive
+            )
+        try:
+            yield
+        except BaseException:
+            # Something may have been changed in memory but not saved
+            if exclusive:
+                self._cache.clear()
+                self._classified_with.clear()
+            raise
+        finally:
+            lock.close()
+
+    # Commands
+
+    def update(self, report="", commits_only=False):
+        """Add any new commits to the report (and its cache), and to the
+        archive index.  Unless commits_only is set, an ongoing report is
+        first extended to git's HEAD.
+        """
+        command = "update-commits" if commits_only else "update"
+        with self._locked(command):
+            with commits_periodical.metrics.phase("load"):
+                index = commits_periodical.data.Index(
+                    self.project_dirname, read_only=commits_only
+                )
+                name = self.get_name(index, report)
+                index_entry = index.get_index_entry(name)
+                if index_entry.is_derived():
+                    return
+                repo = self.get_repo(index, name)
+                doc = commits_periodical.data.Report(
+                    index.get_filename(name), read_only=False
+                )
+                archive = self.get_archive()
+
+            with commits_periodical.metrics.phase(command):
+                if not commits_only and index_entry.get("ongoing"):
+                    commits_periodical.update.update_ref(
+                        repo, index, index_entry
+                    )
+                commits_periodical.update.update_period(repo, index_entry, doc)
+                commits_periodical.update.update_archive(
+                    repo, doc, archive, name
+                )
+
+    def refresh(self, report="", debug=False):
+        """Update and classify the report, while the new commits are still
+        being read from git.
+        """
+        with self._locked("refresh"):
+            with commits_periodical.metrics.phase("load"):
+                index = commits_periodical.data.Index(
+                    self.project_dirname, read_only=False
+                )
+                name = self.get_name(index, report)
+                index_entry = index.get_index_entry(name)
+                if index_entry.is_derived():
+                    return
+                repo = self.get_repo(index, name)
+                filename = index.get_filename(name)
+                doc = commits_periodical.data.Report(filename, read_only=False)
+                project = self.get_project_data()
+                archive = self.get_archive()
+
+            with commits_periodical.metrics.phase("refresh"):
+                commits_periodical.refresh.refresh_period(
+                    repo, index, index_entry, doc, project, debug
+                )
+                commits_periodical.update.update_archive(
+                    repo, doc, archive, name
+                )
+                commits_periodical.aggregate.update_aggregate(
+                    repo, filename, project, index_entry, name
+                )
+
+    def annotate(self, reports=None, debug=False, profile_regex=False):
+        """Classify the commits in each report (by default, the latest).
+        If this Project last classified a report with the same classifiers,
+        only its new commits are matched against them.
+        """
+        with self._locked("annotate"):
+            with commits_periodical.metrics.phase("load"):
+                index = self.get_index()
+                project = self.get_project_data()
+
+            for name in self.get_names(index, reports):
+                index_entry = index.get_index_entry(name)
+                if index_entry.is_derived():
+                    continue
+                with commits_periodical.metrics.phase("load"):
+                    repo = self.get_repo(index, name)
+                    filename = index.get_filename(name)
+                    doc = commits_periodical.data.Report(
+                        filename, read_only=False
+                    )
+                incremental = self._classified_with.get(name) is project
+                with commits_periodical.metrics.phase("annotate"):
+                    commits_periodical.classify.classify_period(
+                        repo, doc, project, debug, profile_regex, incremental
+                    )
+                    self._classified_with[name] = project
+                    commits_periodical.aggregate.update_aggregate(
+                        repo, filename, project, index_entry, name
+                    )
+
+    def render(
+        self,
+        reports=None,
+        formats=("html",),
+        debug=False,
+        reproducible=False,
+        shard_size=0,
+    ):
+        """Generate the index and search pages, and the output of each report
+        (by default, the latest) in each format.  Ongoing reports only have
+        debug output.
+        """
+        with self._locked("generate"):
+            with commits_periodical.metrics.phase("load"):
+                index = self.get_index()
+                project = self.get_project_data()
+                archive = self.get_archive()
+
+            with commits_periodical.metrics.phase("generate"):
+                commits_periodical.generate.generate_index(
+                    self.project_dirname, index
+                )
+                commits_periodical.search.generate_search(
+                    self.project_dirname, index
+                )
+
+            for name in self.get_names(index, reports):
+                index_entry = index.get_index_entry(name)
+                if index_entry.get("ongoing") and not debug:
+                    print("Refusing to generate 'release' HTML for ongoing")
+                    continue
+                with commits_periodical.metrics.phase("load"):
+                    repo, doc = self.get_report(index, name)
+                with commits_periodical.metrics.phase("generate"):
+                    commits_periodical.generate.generate_period(
+                        repo,
+                        doc,
+                        project,
+                        index_entry,
+                        debug,
+                        self.project_dirname,
+                        reproducible,
+                        name,
+                        archive,
+                        formats,
+                        shard_size,
+                    )
+
+    def email(self, report=""):
+        """Print the email announcement of the report."""
+        with self._locked("email"):
+            with commits_periodical.metrics.phase("load"):
+                index = self.get_index()
+                name = self.get_name(index, report)
+                index_entry = index.get_index_entry(name)
+
+            with commits_periodical.metrics.phase("email"):
+                # Only the report's aggregate is needed, if it's current
+                aggregate = commits_periodical.aggregate.load(
+                    index.get_filename(name)
+                )
+                if aggregate is None:
+                    repo, doc = self.get_report(index, name)
+                    model = commits_periodical.model.build_model(
+                        repo,
+                        doc,
+                        self.get_project_data(),
+                        index_entry,
+                        name,
+                        None,
+                        False,
+                    )
+                    aggregate = (
+                        commits_periodical.aggregate.ReportAggregate.from_model(
+                            model
+                        )
+                    )
+                commits_periodical.announcement.announcement(
+                    index_entry, aggregate
+                )
+
+    def query(self, terms):
+        """Get (githash, record) for each commit in the archive which
+        matches all of the terms (as for 'investigate query'), in report
+        order.  Raises ValueError or re.error if the terms aren't valid.
+        """
+        with self._locked("query"):
+            index = self.get_index()
+            if self._query_index is None:
+                self._query_index = commits_periodical.query.QueryIndex(
+                    self.project_dirname
+                )
+            with commits_periodical.metrics.phase("query"):
+                self._query_index.update(index)
+                githashes = self._query_index.query(terms)
+            return [(h, self._query_index.records[h]) for h in githashes]
+
+    def investigate(self, funcs, report=""):
+        """Run the investigate functions on the report, or start an
+        interactive session (if funcs is ["session"]).
+        """
+        if funcs == ["session"]:
+            # The session takes the lock for each of its commands, rather
+            # than for as long as it runs
+            with self._locked("session"):
+                index = self.get_index()
+                name = self.get_name(index, report)
+                repo, doc = self.get_report(index, name)
+            commits_periodical.session.run_session(
+                self.project_dirname, index, name, repo, doc
+            )
+            return
+
+        with self._locked("investigate"):
+            with commits_periodical.metrics.phase("load"):
+                index = self.get_index()
+                # Queries and trends are over the whole archive, so they
+                # don't need the report
+                repo, doc = None, None
+                if funcs[:1] not in (["query"], ["trends"]):
+                    name = self.get_name(index, report)
+                    repo, doc = self.get_report(index, name)
+            with commits_periodical.metrics.phase("investigate"):
+                commits_periodical.investigate.investigate(
+                    repo, doc, funcs, self.project_dirname, index
+                )
+
+    def sanity(self, coverage=False):
+        """Check the classifiers, and optionally how often each pattern is
+        used in the archive.
+        """
+        with self._locked("sanity"):
+            with commits_periodical.metrics.phase("load"):
+                index = self.get_index()
+                project = self.get_project_data()
+            with commits_periodical.metrics.phase("sanity"):
+                if coverage:
+                    commits_periodical.rule_coverage.check_coverage(
+                        project, index
+                    )
+                commits_periodical.sanity_check.check(project)
+
+    def new_report(self, githash, report=""):
+        """End the report at githash, and begin a new (ongoing) report."""
+        with self._locked("new-report"):
+            with commits_periodical.metrics.phase("load"):
+                index = commits_periodical.data.Index(
+                    self.project_dirname, read_only=False
+                )
+                index_entry = index.get_index_entry(
+                    self.get_name(index, report)
+                )
+            with commits_periodical.metrics.phase("new-report"):
+                commits_periodical.update.new_report(
+                    index, index_entry, githash
+                )
+
+    def backfill(self, jobs=1):
+        """Rebuild the cached commits of every report."""
+        with self._locked("backfill"):
+            with commits_periodical.metrics.phase("load"):
+                index = self.get_index()
+                archive = self.get_archive()
+            with commits_periodical.metrics.phase("backfill"):
+                commits_periodical.backfill.backfill(
+                    index, self.git_dirname, archive, jobs
+                )
+
+    def rebuild_archive(self):
+        """Rebuild the archive index from the cached commits of every
+        report.
+        """
+        with self._locked("rebuild-archive"):
+            with commits_periodical.metrics.phase("load"):
+                index = self.get_index()
+                archive = self.get_archive()
+            with commits_periodical.metrics.phase("rebuild-archive"):
+                commits_periodical.update.rebuild_archive(index, archive)
+
+    def watch(self, interval=commits_periodical.watch.DEFAULT_INTERVAL):
+        """Keep the ongoing report (and its debug HTML) up to date, until
+        interrupted.
+        """
+        commits_periodical.watch.watch(self, interval)
+
+    def export(self, dirname, jobs=0):
+        """Export every commit in the archive, with its classification."""
+        with self._locked("export"):
+            with commits_periodical.metrics.phase("load"):
+                index = self.get_index()
+            with commits_periodical.metrics.phase("export"):
+                commits_periodical.export.export(
+                    self.project_dirname, index, dirname, jobs
+                )
+
+    def replay(self, action, dirname):
+        """Record the archive ('record'), or check that replaying it gives
+        the recorded output ('check').
+        """
+        with self._locked("replay"):
+            with commits_periodical.metrics.phase("load"):
+                index = self.get_index()
+            with commits_periodical.metrics.phase("replay"):
+                commits_periodical.replay.replay(
+                    action, dirname, self.project_dirname, index
+                )
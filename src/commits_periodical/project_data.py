@@ -1,12 +1,151 @@
+import dataclasses
 import os.path
+import re
+import typing
 
 import commits_periodical.utils
 
+DEFAULT_RE_FUNC = "match"
+
+# Characters which have a special meaning in a regex (outside of a class)
+RE_SPECIAL = set(".^$*+?{}[]|()\\")
+
+
+def parse_literal(text):
+    """Get the strings matched by the text, if it's a literal (possibly with
+    escaped punctuation, and at most one character class such as '[sS]').
+    Otherwise, return None.
+    """
+    alternatives = [""]
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if c == "\\":
+            # Only punctuation is a plain escape; '\b', '\d' etc. are not
+            if i + 1 == len(text) or text[i + 1].isalnum():
+                return None
+            chars = [text[i + 1]]
+            i += 2
+        elif c == "[":
+            end = text.find("]", i)
+            if len(alternatives) > 1 or end == -1:
+                return None
+            chars = list(text[i + 1 : end])
+            if not chars:
+                return None
+            if any(ch in RE_SPECIAL or ch == "-" for ch in chars):
+                return None
+            i = end + 1
+        elif c in RE_SPECIAL:
+            return None
+        else:
+            chars = [c]
+            i += 1
+        alternatives = [alt + ch for alt in alternatives for ch in chars]
+    return alternatives
+
+
+@dataclasses.dataclass
+class Rule:
+    """A single pattern from a classifier.  Where the pattern's meaning is
+    that of a plain string (given how it's applied), it's checked with string
+    methods instead of a regex.
+    """
+
+    cat: str
+    # The pattern as written in classify.toml
+    pattern: str
+    # Position in the classifier; text classifiers apply rules in this order
+    order: int
+    # "prefix", "substring", or "regex"
+    kind: str
+    literals: tuple[str, ...]
+    regex: re.Pattern | None
+    test: typing.Callable = dataclasses.field(repr=False)
+
+    @classmethod
+    def compile(cls, cat, pattern, order, use_func, multiline):
+        kind, literals = lower_pattern(pattern, use_func, multiline)
+        regex = None
+        if kind == "prefix":
+            test = _make_prefix_test(literals)
+        elif kind == "substring":
+            test = _make_substring_test(literals)
+        else:
+            regex = re.compile(pattern)
+            if use_func == "match":
+                test = _make_match_test(regex, get_literal_head(pattern))
+            elif use_func == "search":
+                test = regex.search
+            else:
+                raise ValueError(f"Classifier does not support {use_func}")
+        return cls(cat, pattern, order, kind, literals, regex, test)
+
+
+def get_literal_head(pattern):
+    """Get the literal text which any match of the pattern must begin with."""
+    # Alternatives could begin with anything
+    if "|" in pattern:
+        return ""
+    end = 0
+    while end < len(pattern) and pattern[end] not in RE_SPECIAL:
+        end += 1
+    # A quantifier applies to the previous character
+    if end < len(pattern) and pattern[end] in "*+?{":
+        end = max(end - 1, 0)
+    return pattern[:end]
+
+
+def _make_match_test(regex, head):
+    # Most strings can be rejected without the regex
+    if not head:
+        return regex.match
+    return lambda string: string.startswith(head) and regex.match(string)
+
+
+def _make_prefix_test(literals):
+    return lambda string: string.startswith(literals)
+
+
+def _make_substring_test(literals):
+    if len(literals) == 1:
+        literal = literals[0]
+        return lambda string: literal in string
+    return lambda string: any(literal in string for literal in literals)
+
+
+def lower_pattern(pattern, use_func, multiline):
+    """Find out whether the pattern can be checked with string methods.
+    'multiline' is whether the examined strings can contain newlines.
+    """
+    text = pattern
+    leading_any = text.startswith(".*")
+    if leading_any:
+        text = text[2:]
+    # A trailing '.*' always matches (the empty string), so it has no effect
+    if text.endswith(".*") and not text.endswith("\\.*"):
+        text = text[:-2]
+
+    literals = parse_literal(text)
+    if not literals or "" in literals:
+        return "regex", ()
+    literals = tuple(literals)
+
+    if use_func == "search":
+        return "substring", literals
+    # With 'match', a leading '.*' can't cross a newline
+    if leading_any:
+        if multiline:
+            return "regex", ()
+        return "substring", literals
+    return "prefix", literals
+
 
 class Classifier:
     def __init__(self, orig):
         self.metadata = {k: v for k, v in orig.items() if k.startswith("_")}
         self.rules = {k: v for k, v in orig.items() if not k.startswith("_")}
+        self._compile()
 
     def get_metadata(self, key, default=None):
         return self.metadata.get(key, default)
@@ -14,6 +153,60 @@ class Classifier:
     def items(self):
         return self.rules.items()
 
+    def _compile(self):
+        use_func = self.get_metadata("_re_func", DEFAULT_RE_FUNC)
+        self.multiline = self.get_metadata("_acts_on") == "message"
+
+        # cat -> list of Rule, in the same order as the patterns
+        self.compiled = {}
+        # Rules which only match summaries beginning with "prefix:", looked
+        # up by that prefix.
+        self.prefix_lookup = {}
+        self.other_rules = []
+        order = 0
+        for cat, patterns in self.rules.items():
+            self.compiled[cat] = []
+            for pattern in patterns:
+                rule = Rule.compile(
+                    cat, pattern, order, use_func, self.multiline
+                )
+                order += 1
+                self.compiled[cat].append(rule)
+
+                if rule.kind == "prefix" and len(rule.literals) == 1:
+                    head, sep, tail = rule.literals[0].partition(":")
+                    if sep and not tail:
+                        self.prefix_lookup.setdefault(head, []).append(rule)
+                        continue
+                self.other_rules.append(rule)
+
+        self.omit_rules = []
+
+    def set_omit_patterns(self, patterns):
+        """Set the filenames to omit if the first classification fails."""
+        use_func = self.get_metadata("_re_func", DEFAULT_RE_FUNC)
+        # Per-classifier settings override the global settings
+        patterns = self.get_metadata("_filenames_try_omit", patterns)
+        self.omit_rules = [
+            Rule.compile(None, pattern, i, use_func, self.multiline)
+            for i, pattern in enumerate(patterns)
+        ]
+
+    def find_matching_rules(self, text):
+        """Get each rule which matches the text, in order."""
+        matches = []
+        if self.prefix_lookup:
+            head, sep, _ = text.partition(":")
+            if sep:
+                matches.extend(self.prefix_lookup.get(head, ()))
+        other_matches = [rule for rule in self.other_rules if rule.test(text)]
+        if not matches:
+            return other_matches
+        if other_matches:
+            matches.extend(other_matches)
+            matches.sort(key=lambda rule: rule.order)
+        return matches
+
 
 def sanity_check(categories, orig_classifiers):
     cats = categories.keys()
@@ -65,3 +258,6 @@ class ProjectData:
             # with an underscore.
             classifier = self.orig_classifiers[section]
             self.classifiers[section] = Classifier(classifier)
+
+        for classifier in self.classifiers.values():
+            classifier.set_omit_patterns(self.meta["_filenames_try_omit"])
@@ -0,0 +1,268 @@
+import bisect
+import collections
+import dataclasses
+import datetime
+import os.path
+import pickle
+import re
+
+import commits_periodical.data
+import commits_periodical.utils
+
+QUERY_FILENAME = "query.gitindex"
+
+# Increase this whenever CommitRecord or SAVED_FIELDS change, to discard old
+# indexes
+QUERY_FORMAT = 2
+
+# The attributes of a QueryIndex which are saved
+SAVED_FIELDS = (
+    "segments",
+    "records",
+    "by_author",
+    "by_path",
+    "by_cat",
+    "sorted_paths",
+    "by_date",
+)
+
+
+@dataclasses.dataclass
+class CommitRecord:
+    report: str
+    author: str
+    authored_date: int
+    summary: str
+    message: str
+    modified_files: list[str]
+    category: str
+    # The classifier section and pattern, or "" if not auto-classified
+    section: str
+    pattern: str
+
+
+def get_path_prefixes(filename):
+    """Get each directory prefix of the filename, and the filename itself."""
+    parts = filename.split("/")
+    return ["/".join(parts[: i + 1]) for i in range(len(parts))]
+
+
+def _to_timestamp(date_str):
+    dt = datetime.datetime.strptime(date_str, "%Y-%m-%d")
+    return int(dt.replace(tzinfo=datetime.timezone.utc).timestamp())
+
+
+class QueryIndex:
+    """Commit records for every report, with secondary indexes by author,
+    path prefix, category, and date.  Each report's records are only
+    rebuilt when its TOML or .gitcache file changes.
+    """
+
+    def __init__(self, project_dirname):
+        self.filename = os.path.join(project_dirname, QUERY_FILENAME)
+        # report name -> (stamps, {githash: CommitRecord})
+        self.segments = {}
+        self.records = {}
+        self.by_author = {}
+        self.by_path = {}
+        self.by_cat = {}
+        self.sorted_paths = []
+        self.by_date = []
+        # The stamp of the file when it was last read or written
+        self.stamp = None
+        self._reload()
+
+    def _reload(self):
+        """Read the file, if it has changed since it was last read."""
+        if not os.path.exists(self.filename):
+            return
+        stamp = commits_periodical.utils.file_stamp(self.filename)
+        if stamp == self.stamp:
+            return
+        with open(self.filename, "rb") as fp:
+            data = pickle.load(fp)
+        if data.get("format") == QUERY_FORMAT:
+            for field in SAVED_FIELDS:
+                setattr(self, field, data[field])
+        self.stamp = stamp
+
+    def save(self):
+        data = {field: getattr(self, field) for field in SAVED_FIELDS}
+        data["format"] = QUERY_FORMAT
+        with commits_periodical.utils.atomic_write(self.filename, "wb") as fp:
+            pickle.dump(data, fp)
+        self.stamp = commits_periodical.utils.file_stamp(self.filename)
+
+    def _load_segment(self, name, report_filename, cache_filename):
+        doc = commits_periodical.data.Report(report_filename)
+        with open(cache_filename, "rb") as fp:
+            gitcommits = pickle.load(fp)
+
+        records = {}
+        for githash, entry in doc.get_entries():
+            gitcommit = gitcommits.get(githash)
+            if gitcommit is None:
+                continue
+            section, pattern = "", ""
+            if entry.has_auto_cat():
+                section, pattern = entry.get_auto_reasons()
+            records[githash] = CommitRecord(
+                report=name,
+                author=gitcommit.author,
+                authored_date=gitcommit.authored_date,
+                summary=gitcommit.summary,
+                message=gitcommit.message,
+                modified_files=gitcommit.modified_files,
+                category=entry.cat,
+                section=section,
+                pattern=pattern,
+            )
+        return records
+
+    def _rebuild_secondary(self):
+        self.records = {}
+        by_author = collections.defaultdict(list)
+        by_path = collections.defaultdict(list)
+        by_cat = collections.defaultdict(list)
+        by_date = []
+        for name in sorted(self.segments):
+            _, records = self.segments[name]
+            self.records.update(records)
+            for githash, record in records.items():
+                by_author[record.author].append(githash)
+                by_cat[record.category].append(githash)
+                by_date.append((record.authored_date, githash))
+                prefixes = set()
+                for filename in record.modified_files:
+                    prefixes.update(get_path_prefixes(filename))
+                for prefix in prefixes:
+                    by_path[prefix].append(githash)
+        self.by_author = dict(by_author)
+        self.by_path = dict(by_path)
+        self.by_cat = dict(by_cat)
+        self.sorted_paths = sorted(self.by_path)
+        self.by_date = sorted(by_date)
+
+    def update(self, index):
+        """Bring the records up to date with the reports on disk."""
+        # Another command may have updated the index since it was read
+        with commits_periodical.utils.lock_cache(self.filename):
+            self._reload()
+            self._update(index)
+
+    def _update(self, index):
+        changed = False
+        for name in list(self.segments):
+            if name not in index.sorted_main_names:
+                del self.segments[name]
+                changed = True
+
+        for name in index.sorted_main_names:
+            report_filename = index.get_filename(name)
+            cache_filename = report_filename.replace(".toml", ".gitcache")
+            if not os.path.exists(cache_filename):
+                continue
+            stamps = (
+                commits_periodical.utils.file_stamp(report_filename),
+                commits_periodical.utils.file_stamp(cache_filename),
+            )
+            if name in self.segments and self.segments[name][0] == stamps:
+                continue
+
+            records = self._load_segment(name, report_filename, cache_filename)
+            self.segments[name] = (stamps, records)
+            changed = True
+
+        if changed:
+            self._rebuild_secondary()
+            self.save()
+
+    def get_all(self):
+        return set(self.records)
+
+    def get_by_author(self, text):
+        """Commits by authors whose names contain the text (ignoring case)."""
+        text = text.lower()
+        githashes = set()
+        for author, hashes in self.by_author.items():
+            if text in author.lower():
+                githashes.update(hashes)
+        return githashes
+
+    def get_by_path(self, prefix):
+        """Commits which modify a file beginning with the prefix."""
+        prefix = prefix.rstrip("/")
+        githashes = set()
+        i = bisect.bisect_left(self.sorted_paths, prefix)
+        while i < len(self.sorted_paths):
+            path = self.sorted_paths[i]
+            if not path.startswith(prefix):
+                break
+            githashes.update(self.by_path[path])
+            i += 1
+        return githashes
+
+    def get_by_category(self, cat):
+        return set(self.by_cat.get(cat, []))
+
+    def get_by_dates(self, since=None, until=None):
+        """Commits authored from the 'since' date to the end of the 'until'
+        date (both YYYY-MM-DD).
+        """
+        lo = 0
+        hi = len(self.by_date)
+        if since:
+            lo = bisect.bisect_left(self.by_date, (_to_timestamp(since),))
+        if until:
+            end = _to_timestamp(until) + 24 * 60 * 60
+            hi = bisect.bisect_left(self.by_date, (end,))
+        return {githash for _, githash in self.by_date[lo:hi]}
+
+    def get_matching(self, pattern, githashes=None):
+        """Commits whose message contains the regex pattern."""
+        regex = re.compile(pattern, re.MULTILINE)
+        if githashes is None:
+            githashes = self.records
+        return {h for h in githashes if regex.search(self.records[h].message)}
+
+    def query(self, terms):
+        """Get commits matching all of the terms, in report order."""
+        githashes = None
+        grep = []
+        for term in terms:
+            key, _, value = term.partition(":")
+            match key:
+                case "author":
+                    found = self.get_by_author(value)
+                case "path":
+                    found = self.get_by_path(value)
+                case "cat":
+                    found = self.get_by_category(value)
+                case "unclassified":
+                    found = self.get_by_category("unknown")
+                case "since":
+                    found = self.get_by_dates(since=value)
+                case "until":
+                    found = self.get_by_dates(until=value)
+                case "grep":
+                    # Do these last, on the fewest commits
+                    grep.append(value)
+                    continue
+                case _:
+                    raise ValueError(f"Query term not recognized: {term}")
+            if githashes is None:
+                githashes = found
+            else:
+                githashes &= found
+
+        for pattern in grep:
+            githashes = self.get_matching(pattern, githashes)
+
+        if githashes is None:
+            githashes = self.get_all()
+
+        def sort_key(githash):
+            record = self.records[githash]
+            return (record.report, record.authored_date)
+
+        return sorted(githashes, key=sort_key)
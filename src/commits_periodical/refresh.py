@@ -0,0 +1,124 @@
+import contextlib
+import queue
+import threading
+
+import commits_periodical.classify
+import commits_periodical.update
+
+# Save the cache after this many new commits
+BATCH_SIZE = 500
+
+# Maximum number of commits read from git but not yet classified
+QUEUE_SIZE = 1000
+
+# Seconds between checks of whether the reader should stop
+PUT_TIMEOUT = 0.1
+
+
+def read_commits(repo, githashes, commits_queue, stop):
+    """Read commits from git, and send them to the queue (followed by None).
+    If anything goes wrong, send the exception instead.  Stops early if the
+    stop event is set.
+    """
+
+    def put(item):
+        # Don't wait forever for a consumer which has stopped
+        while not stop.is_set():
+            try:
+                commits_queue.put(item, timeout=PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        for githash in githashes:
+            if not put(repo.read_commit(githash)):
+                return
+        put(None)
+    except Exception as err:
+        put(err)
+
+
+def get_streamed_commits(repo, githashes):
+    """Generator which reads commits from git in a separate thread."""
+    commits_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    stop = threading.Event()
+    reader = threading.Thread(
+        target=read_commits,
+        args=(repo, githashes, commits_queue, stop),
+        daemon=True,
+    )
+    reader.start()
+    try:
+        while True:
+            item = commits_queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Also stop the reader if we're finished early (or failed)
+        stop.set()
+        reader.join()
+
+
+def refresh_period(repo, index, index_entry, doc, project, debug):
+    """Update the report with new commits from git and classify it, while
+    the new commits are still being read from git.  Returns the number of
+    new commits.
+    """
+    if index_entry.get("ongoing"):
+        commits_periodical.update.update_ref(repo, index, index_entry)
+
+    print(f"Refreshing {doc.filename}")
+    start_after = index_entry["start_after"]
+    end_including = index_entry["end_including"]
+    githashes = repo.get_uncached_githashes(start_after, end_including)
+    print(f"Reading {len(githashes)} new commits from git")
+
+    doc.backup_auto()
+    doc.clear_automatic_annotations()
+
+    # Classify the commits we already have, while git starts up
+    pipeline = commits_periodical.classify.ClassifyPipeline(repo, doc, project)
+    for githash in doc.get_hashes():
+        pipeline.add(githash)
+
+    # Commits which were cached by 'update-commits' but aren't in the report
+    existing = [h for h in repo.get_githashes() if h not in doc.entries]
+
+    num_added = 0
+    for githash in existing:
+        doc.add_commit(githash)
+        pipeline.add(githash)
+        num_added += 1
+
+    # Closing the generator (even if classifying fails) stops the reader
+    streamed = get_streamed_commits(repo, githashes)
+    with contextlib.closing(streamed):
+        for gitcommit in streamed:
+            repo.add_commit(gitcommit)
+            doc.add_commit(gitcommit.githash)
+            pipeline.add(gitcommit.githash)
+            num_added += 1
+            if num_added % BATCH_SIZE == 0:
+                # The report is only saved once it's fully classified, but
+                # the commits read from git so far needn't be read again
+                repo.save()
+                print(f"Added {num_added} commits so far")
+
+    repo.set_cached_range(start_after, end_including)
+    repo.save()
+    pipeline.print_classified()
+    if debug:
+        commits_periodical.classify.check_auto_changes(repo, doc)
+
+    # group and highlighted
+    pipeline.finish()
+
+    doc.clear_backup_auto()
+    doc.save()
+    print(f"Added {num_added} commits")
+    return num_added
@@ -0,0 +1,293 @@
+import collections
+import sys
+
+import commits_periodical.project_data
+
+# The regex parser isn't public, and moved in Python 3.11.  If it can't be
+# found, the cost of patterns isn't checked.
+try:
+    if sys.version_info >= (3, 11):
+        import re._constants as sre_constants
+        import re._parser as sre_parse
+    else:
+        import sre_constants
+        import sre_parse
+except ImportError:
+    sre_constants = sre_parse = None
+
+# Number of patterns to show in the profile
+MAX_ROWS = 20
+
+
+class RegexProfile:
+    """Cumulative matching time and number of calls for each pattern."""
+
+    def __init__(self):
+        self.seconds = collections.Counter()
+        self.calls = collections.Counter()
+
+    def record(self, pattern, seconds):
+        self.seconds[pattern] += seconds
+        self.calls[pattern] += 1
+
+    def print_profile(self):
+        total = sum(self.seconds.values())
+        print(f"Regex profile: {total:.3f} s in {self.calls.total()} calls")
+        print("  total ms     calls  us/call  pattern")
+        for pattern, seconds in self.seconds.most_common(MAX_ROWS):
+            calls = self.calls[pattern]
+            per_call = 1e6 * seconds / calls
+            ms = 1000 * seconds
+            print(f"  {ms:8.2f}  {calls:8}  {per_call:7.2f}  {pattern}")
+
+
+# Sentinel for a set of characters which could be anything
+ANY_CHAR = None
+
+if sre_constants:
+    REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+    MAXREPEAT = sre_constants.MAXREPEAT
+    # Added in Python 3.11
+    ATOMIC_GROUP = getattr(sre_constants, "ATOMIC_GROUP", None)
+    POSSESSIVE_REPEAT = getattr(sre_constants, "POSSESSIVE_REPEAT", None)
+
+
+def _union(chars, other):
+    if chars is ANY_CHAR or other is ANY_CHAR:
+        return ANY_CHAR
+    return chars | other
+
+
+def _overlaps(chars, other):
+    if chars == set() or other == set():
+        return False
+    if chars is ANY_CHAR or other is ANY_CHAR:
+        return True
+    return bool(chars & other)
+
+
+def _get_in_chars(items):
+    """Get the characters matched by a [...] class, or ANY_CHAR."""
+    chars = set()
+    for op, av in items:
+        if op == sre_constants.LITERAL:
+            chars.add(av)
+        elif op == sre_constants.RANGE and av[1] - av[0] < 256:
+            chars.update(range(av[0], av[1] + 1))
+        else:
+            # Categories (e.g. \w) and negated classes
+            return ANY_CHAR
+    return chars
+
+
+def _get_item_first(op, av):
+    """Get the characters which the item could begin with."""
+    match op:
+        case sre_constants.LITERAL:
+            return {av}
+        case sre_constants.IN:
+            return _get_in_chars(av)
+        case sre_constants.AT | sre_constants.ASSERT | sre_constants.ASSERT_NOT:
+            return set()
+        case sre_constants.BRANCH:
+            chars = set()
+            for alternative in av[1]:
+                chars = _union(chars, _get_first(alternative))
+            return chars
+        case sre_constants.SUBPATTERN:
+            return _get_first(av[-1])
+        case _ if op == ATOMIC_GROUP:
+            return _get_first(av)
+        case _ if op in REPEATS or op == POSSESSIVE_REPEAT:
+            return _get_first(av[2])
+    return ANY_CHAR
+
+
+def _is_item_nullable(op, av):
+    """Can the item match an empty string?"""
+    match op:
+        case sre_constants.AT | sre_constants.ASSERT | sre_constants.ASSERT_NOT:
+            return True
+        case sre_constants.BRANCH:
+            return any(_is_nullable(alternative) for alternative in av[1])
+        case sre_constants.SUBPATTERN:
+            return _is_nullable(av[-1])
+        case _ if op == ATOMIC_GROUP:
+            return _is_nullable(av)
+        case _ if op in REPEATS or op == POSSESSIVE_REPEAT:
+            return av[0] == 0 or _is_nullable(av[2])
+    return False
+
+
+def _get_first(subpattern):
+    chars = set()
+    for op, av in subpattern:
+        chars = _union(chars, _get_item_first(op, av))
+        if not _is_item_nullable(op, av):
+            break
+    return chars
+
+
+def _is_nullable(subpattern):
+    return all(_is_item_nullable(op, av) for op, av in subpattern)
+
+
+def _get_follow(rest, follow):
+    """Get the characters which could follow an item, given the items after
+    it and what follows them.
+    """
+    chars = _get_first(rest)
+    if _is_nullable(rest):
+        chars = _union(chars, follow)
+    return chars
+
+
+def _get_repeat_follows(subpattern, follow):
+    """For each unbounded (backtracking) repeat in the subpattern, get the
+    characters which its body could begin with, and the characters which
+    could follow it (ending with 'follow').
+    """
+    items = list(subpattern)
+    repeats = []
+    for i, (op, av) in enumerate(items):
+        after = _get_follow(items[i + 1 :], follow)
+        if op in REPEATS:
+            first = _get_first(av[2])
+            if av[1] == MAXREPEAT:
+                repeats.append((first, after))
+            # The body can be followed by another iteration
+            repeats.extend(_get_repeat_follows(av[2], _union(first, after)))
+        elif op == sre_constants.SUBPATTERN:
+            repeats.extend(_get_repeat_follows(av[-1], after))
+        elif op == sre_constants.BRANCH:
+            for alternative in av[1]:
+                repeats.extend(_get_repeat_follows(alternative, after))
+    return repeats
+
+
+def _get_branch_firsts(subpattern, follow):
+    """For each branch in the subpattern (outside of repeats), get the
+    characters which each alternative could begin with.  An alternative
+    which can be empty begins with whatever follows it (ending with
+    'follow').
+    """
+    items = list(subpattern)
+    branches = []
+    for i, (op, av) in enumerate(items):
+        after = _get_follow(items[i + 1 :], follow)
+        if op == sre_constants.BRANCH:
+            firsts = []
+            for alternative in av[1]:
+                chars = _get_first(alternative)
+                if _is_nullable(alternative):
+                    chars = _union(chars, after)
+                firsts.append(chars)
+            branches.append(firsts)
+        elif op == sre_constants.SUBPATTERN:
+            branches.extend(_get_branch_firsts(av[-1], after))
+    return branches
+
+
+def find_backtracking(subpattern, problems):
+    """Add descriptions of unbounded repeats which can match the same text
+    in more than one way, so that a failing match takes exponential time.
+    """
+    for op, av in subpattern:
+        if op in REPEATS and av[1] == MAXREPEAT:
+            body = av[2]
+            first = _get_first(body)
+            # e.g. (a+)*, (\w+\s?)* or (.*,)*: an inner repeat can take the
+            # text which would otherwise follow it, wherever it is in the body
+            for chars, after in _get_repeat_follows(body, first):
+                if _overlaps(chars, after):
+                    problems.append("nested quantifiers")
+            # e.g. (a|aa)*: the alternatives can begin the same way, and
+            # the next iteration follows them
+            for firsts in _get_branch_firsts(body, first):
+                for i, chars in enumerate(firsts):
+                    if any(_overlaps(chars, o) for o in firsts[i + 1 :]):
+                        problems.append("overlapping alternatives")
+                        break
+
+        # Look inside groups and repeats
+        match op:
+            case sre_constants.BRANCH:
+                for alternative in av[1]:
+                    find_backtracking(alternative, problems)
+            case sre_constants.SUBPATTERN:
+                find_backtracking(av[-1], problems)
+            case _ if op == ATOMIC_GROUP:
+                find_backtracking(av, problems)
+            case sre_constants.ASSERT | sre_constants.ASSERT_NOT:
+                find_backtracking(av[1], problems)
+            case _ if op in REPEATS or op == POSSESSIVE_REPEAT:
+                find_backtracking(av[2], problems)
+
+
+def find_search_backtracking(subpattern, problems):
+    """Add a description if the subpattern has more than one unbounded
+    repeat which could match the same characters.  Each of them can
+    backtrack over the text which the others took, and re.search() tries
+    this from every position, so that a failing search takes polynomial
+    time (e.g. .*a.*b).
+    """
+    firsts = [chars for chars, _ in _get_repeat_follows(subpattern, set())]
+    for i, chars in enumerate(firsts):
+        if any(_overlaps(chars, o) for o in firsts[i + 1 :]):
+            problems.append("overlapping repeats when searching")
+            return
+
+
+def get_pattern_funcs(project):
+    """Get each pattern, along with how it's applied."""
+    default_func = commits_periodical.project_data.DEFAULT_RE_FUNC
+    pattern_funcs = set()
+    for pattern in project.meta["_filenames_try_omit"]:
+        pattern_funcs.add((pattern, default_func))
+    for classifier in project.classifiers.values():
+        use_func = classifier.get_metadata("_re_func", default_func)
+        for pattern in classifier.get_metadata("_filenames_try_omit", []):
+            pattern_funcs.add((pattern, use_func))
+        for _, patterns in classifier.items():
+            for pattern in patterns:
+                pattern_funcs.add((pattern, use_func))
+    return sorted(pattern_funcs)
+
+
+def get_cost_problem(pattern, use_func):
+    """Get a description of how the pattern backtracks when applied with
+    re.match() or re.search(), or None.
+    """
+    problems = []
+    subpattern = sre_parse.parse(pattern)
+    find_backtracking(subpattern, problems)
+    if use_func == "search":
+        find_search_backtracking(subpattern, problems)
+    if not problems:
+        return None
+    return ", ".join(sorted(set(problems)))
+
+
+def check_regex_cost(project):
+    """Find patterns whose matching time can grow exponentially (or, for
+    patterns applied with re.search(), polynomially) with the length of the
+    input, due to backtracking.  This looks at the structure of each
+    pattern (rather than timing it), so it always gives the same answer.
+    """
+    if sre_parse is None:
+        print("Regex parser not found; not checking the cost of patterns")
+        return True
+
+    problems = []
+    for pattern, use_func in get_pattern_funcs(project):
+        problem = get_cost_problem(pattern, use_func)
+        if problem:
+            problems.append((pattern, use_func, problem))
+
+    if not problems:
+        return True
+
+    print("Patterns which can backtrack excessively:")
+    for pattern, use_func, problem in problems:
+        print(f"  {use_func:6} {pattern}\n    {problem}")
+    return False
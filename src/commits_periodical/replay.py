@@ -0,0 +1,216 @@
+import contextlib
+import dataclasses
+import io
+import json
+import os
+import os.path
+import pickle
+import shutil
+import sys
+import tempfile
+import traceback
+
+import commits_periodical.archive
+import commits_periodical.classify
+import commits_periodical.data
+import commits_periodical.generate
+import commits_periodical.gitlayer
+import commits_periodical.metrics
+import commits_periodical.project_data
+import commits_periodical.update
+import commits_periodical.utils
+
+FIXTURES_DIRNAME = "fixtures"
+GOLDEN_DIRNAME = "golden"
+
+
+# The project's files which are replayed, besides the reports
+PROJECT_FILENAMES = ("categories.toml", "classify.toml", "index.toml")
+
+
+def record_fixtures(project_dirname, index, fixtures_dirname):
+    """Save the project's TOML files, and the cached commits of every report
+    as JSON, so that the archive can be replayed as it is now, without a
+    git repository.
+    """
+    for name in index.sorted_main_names:
+        cache_filename = index.get_filename(name).replace(".toml", ".gitcache")
+        if not os.path.exists(cache_filename):
+            print(f"No cached commits for {name}; run 'update' on it first")
+            sys.exit(1)
+
+    shutil.rmtree(fixtures_dirname, ignore_errors=True)
+    os.makedirs(fixtures_dirname)
+    for filename in PROJECT_FILENAMES:
+        shutil.copy(os.path.join(project_dirname, filename), fixtures_dirname)
+    for name in index.sorted_main_names:
+        filename = index.get_filename(name)
+        shutil.copy(filename, fixtures_dirname)
+        with open(filename.replace(".toml", ".gitcache"), "rb") as fp:
+            gitcommits = pickle.load(fp)
+        data = [dataclasses.asdict(c) for c in gitcommits.values()]
+        filename = os.path.join(fixtures_dirname, f"{name}.json")
+        with commits_periodical.utils.atomic_write(filename) as fp:
+            json.dump(data, fp, indent=1)
+    print(f"Recorded commits for {len(index.sorted_main_names)} reports")
+
+
+def make_workdir(tmp_dirname, project_dirname, fixtures_dirname):
+    """Copy the recorded TOML files into the temporary directory, and turn
+    the recorded commits into caches.  Returns the new project directory.
+    """
+    basename = os.path.basename(os.path.normpath(project_dirname))
+    work_dirname = os.path.join(tmp_dirname, "projects", basename)
+    os.makedirs(work_dirname)
+    os.makedirs(os.path.join(tmp_dirname, "out", basename))
+    for filename in os.listdir(fixtures_dirname):
+        if filename.endswith(".toml"):
+            shutil.copy(os.path.join(fixtures_dirname, filename), work_dirname)
+            continue
+
+        filename = os.path.join(fixtures_dirname, filename)
+        with open(filename, encoding="utf8") as fp:
+            data = json.load(fp)
+        gitcommits = {
+            d["githash"]: commits_periodical.gitlayer.CachedCommit(**d)
+            for d in data
+        }
+        name = os.path.basename(filename).removesuffix(".json")
+        cache_filename = os.path.join(work_dirname, f"{name}.gitcache")
+        with open(cache_filename, "wb") as fp:
+            pickle.dump(gitcommits, fp)
+    return work_dirname
+
+
+def replay_archive(work_dirname):
+    """Classify every report, then generate the release and debug HTML of
+    every report.  Returns the contents of each output file, by name; if a
+    report can't be classified or a page can't be generated, the error takes
+    the place of its contents.
+    """
+    index = commits_periodical.data.Index(work_dirname)
+    project = commits_periodical.project_data.ProjectData(work_dirname)
+    archive = commits_periodical.archive.ArchiveIndex(work_dirname)
+
+    outputs = {}
+    for name in index.sorted_main_names:
+        filename = index.get_filename(name)
+        cache_filename = filename.replace(".toml", ".gitcache")
+        repo = commits_periodical.gitlayer.CachedRepo(None, cache_filename)
+        doc = commits_periodical.data.Report(filename, read_only=False)
+        try:
+            with commits_periodical.metrics.phase("classify"):
+                commits_periodical.classify.classify_period(
+                    repo, doc, project, False
+                )
+            with commits_periodical.metrics.phase("archive"):
+                commits_periodical.update.update_archive(
+                    repo, doc, archive, name
+                )
+        except Exception:
+            error = traceback.format_exc(limit=-1)
+            outputs[f"{name}.toml.error"] = error.encode("utf8")
+
+    for name in index.get_names():
+        index_entry = index.get_index_entry(name)
+        repo, doc = commits_periodical.data.load_report(index, name)
+        for debug in (False, True):
+            # There's no release HTML for an ongoing report
+            if index_entry.get("ongoing") and not debug:
+                continue
+            try:
+                with commits_periodical.metrics.phase("generate"):
+                    commits_periodical.generate.generate_period(
+                        repo,
+                        doc,
+                        project,
+                        index_entry,
+                        debug,
+                        work_dirname,
+                        True,
+                        name,
+                        archive,
+                    )
+            except Exception:
+                page = f"{name}-debug" if debug else name
+                error = traceback.format_exc(limit=-1)
+                outputs[f"{page}.html.error"] = error.encode("utf8")
+
+    out_dirname = work_dirname.replace("projects/", "out/")
+    for name in index.sorted_main_names:
+        with open(index.get_filename(name), "rb") as fp:
+            outputs[f"{name}.toml"] = fp.read()
+    for filename in os.listdir(out_dirname):
+        with open(os.path.join(out_dirname, filename), "rb") as fp:
+            outputs[filename] = fp.read()
+    return outputs
+
+
+def print_timings():
+    print("Timings:")
+    for name, seconds in commits_periodical.metrics.current.phases.items():
+        print(f"  {seconds:8.3f} s  {name}")
+
+
+def compare_golden(outputs, golden_dirname):
+    """Return a list of problems with the outputs, compared to the golden
+    files.
+    """
+    problems = []
+    golden_filenames = set(os.listdir(golden_dirname))
+    for filename in sorted(golden_filenames - set(outputs)):
+        problems.append(f"Not generated: {filename}")
+    for filename, content in sorted(outputs.items()):
+        if filename not in golden_filenames:
+            problems.append(f"Not in the golden files: {filename}")
+            continue
+        with open(os.path.join(golden_dirname, filename), "rb") as fp:
+            if fp.read() != content:
+                problems.append(f"Differs: {filename}")
+    return problems
+
+
+def replay(action, dirname, project_dirname, index):
+    """Record the archive's commits and its golden output, or check that
+    replaying the archive still gives the same output.
+    """
+    fixtures_dirname = os.path.join(dirname, FIXTURES_DIRNAME)
+    golden_dirname = os.path.join(dirname, GOLDEN_DIRNAME)
+    if action == "record":
+        record_fixtures(project_dirname, index, fixtures_dirname)
+    elif not os.path.exists(os.path.join(fixtures_dirname, "index.toml")):
+        print(f"No fixtures in {fixtures_dirname}; run 'replay record' first")
+        sys.exit(1)
+
+    # Replay the reports as they were recorded, not as they are now
+    index = commits_periodical.data.Index(fixtures_dirname)
+    with tempfile.TemporaryDirectory() as tmp_dirname:
+        work_dirname = make_workdir(
+            tmp_dirname, project_dirname, fixtures_dirname
+        )
+        # Only show our own summary
+        with contextlib.redirect_stdout(io.StringIO()):
+            outputs = replay_archive(work_dirname)
+    print(f"Replayed {len(index.sorted_main_names)} reports")
+    print_timings()
+    for filename in sorted(outputs):
+        if filename.endswith(".error"):
+            print(f"Error in {filename.removesuffix('.error')}:")
+            print(outputs[filename].decode("utf8"), end="")
+
+    if action == "record":
+        shutil.rmtree(golden_dirname, ignore_errors=True)
+        os.makedirs(golden_dirname)
+        for filename, content in outputs.items():
+            with open(os.path.join(golden_dirname, filename), "wb") as fp:
+                fp.write(content)
+        print(f"Recorded {len(outputs)} golden files in {golden_dirname}")
+        return
+
+    problems = compare_golden(outputs, golden_dirname)
+    if problems:
+        print("Problem found:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print(f"All {len(outputs)} files match the golden files")
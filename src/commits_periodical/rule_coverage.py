@@ -0,0 +1,114 @@
+import collections
+import os.path
+
+import commits_periodical.classify
+import commits_periodical.data
+import commits_periodical.gitlayer
+
+
+def load_archive(index):
+    """Load the cached commits of every report."""
+    repo = commits_periodical.gitlayer.CachedRepo(None, None)
+    for name in index.sorted_main_names:
+        cache_filename = index.get_filename(name).replace(".toml", ".gitcache")
+        if os.path.exists(cache_filename):
+            repo.add_cache(cache_filename)
+    return repo
+
+
+def get_credited(name, classifier, examine):
+    """Get the (cat, pattern) pairs which this section would use to classify
+    the commit, if no earlier section had classified it.
+    """
+    examine_part = classifier.get_metadata("_acts_on")
+    if examine_part == "filenames":
+        # Use a throw-away entry, so that we get the same patterns as a
+        # real classification
+        entry = commits_periodical.data.ReportEntry((None, {}))
+        commits_periodical.classify.apply_filenames(
+            entry, name, classifier, examine
+        )
+        if not entry.has_auto_cat():
+            return []
+        _, patterns = entry.get_auto_reasons()
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        return [(entry.get_auto_cat(), pattern) for pattern in patterns]
+
+    # Every matching pattern in a text section sets the category
+    return [
+        (rule.cat, rule.pattern)
+        for rule in classifier.find_matching_rules(examine)
+    ]
+
+
+def check_coverage(project, index):
+    """Run the classifier over every commit in the archive, and report how
+    often each pattern is used.
+    """
+    repo = load_archive(index)
+    if repo.gitcommits is None:
+        print("No cached commits in the archive")
+        return
+
+    # (section, cat, pattern) -> number of commits
+    hits = collections.Counter()
+    shadowed = collections.Counter()
+    # (section, cat, pattern) -> Counter of earlier sections which won
+    shadowed_by = collections.defaultdict(collections.Counter)
+
+    num_commits = 0
+    for githash in repo.get_githashes():
+        gitcommit = repo.get_commit(githash)
+        num_commits += 1
+        winner = None
+        for name, classifier in project.classifiers.items():
+            examine_part = classifier.get_metadata("_acts_on")
+            examine = commits_periodical.classify.get_examine(
+                gitcommit, examine_part
+            )
+            credited = get_credited(name, classifier, examine)
+            for cat, pattern in credited:
+                if winner is None:
+                    hits[(name, cat, pattern)] += 1
+                else:
+                    shadowed[(name, cat, pattern)] += 1
+                    shadowed_by[(name, cat, pattern)][winner] += 1
+            if credited and winner is None:
+                winner = name
+
+    print(f"Rule coverage over {num_commits} commits in the archive:")
+    never = []
+    always_shadowed = []
+    for name, classifier in project.classifiers.items():
+        print(f"\n[{name}]")
+        for cat, patterns in classifier.items():
+            for pattern in patterns:
+                key = (name, cat, pattern)
+                print(
+                    f"  {hits[key]:6} hits {shadowed[key]:6} shadowed"
+                    f"  {cat:12} {pattern}"
+                )
+                if hits[key]:
+                    continue
+                if shadowed[key]:
+                    always_shadowed.append(key)
+                else:
+                    never.append(key)
+
+    print("\nPatterns which never matched:")
+    if not never:
+        print("  (None)")
+    for name, cat, pattern in never:
+        print(f"  {name:26} {cat:12} {pattern}")
+
+    print("\nPatterns which are always shadowed by an earlier section:")
+    if not always_shadowed:
+        print("  (None)")
+    for key in always_shadowed:
+        name, cat, pattern = key
+        earlier = ", ".join(
+            f"{section} ({num})"
+            for section, num in shadowed_by[key].most_common()
+        )
+        print(f"  {name:26} {cat:12} {pattern}\n    by: {earlier}")
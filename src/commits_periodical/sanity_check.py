@@ -1,5 +1,7 @@
 import sys
 
+import commits_periodical.regex_cost
+
 
 def sanity_check_files_categories(texts):
     """Conflicting filenames in 'plain' filenames section."""
@@ -30,6 +32,10 @@ def check_section(order, section, section_name):
 
 
 def check(project):
+    if not commits_periodical.regex_cost.check_regex_cost(project):
+        print("Problem found")
+        sys.exit(1)
+
     order = {key: i for i, key in enumerate(project.categories)}
     order["_acts_on"] = -2
     order["_re_func"] = -1
@@ -0,0 +1,137 @@
+import json
+import os
+import os.path
+import pickle
+import re
+
+import commits_periodical.gitlayer
+import commits_periodical.html_templates
+import commits_periodical.utils
+
+SEARCH_FILENAME = "search.gitindex"
+
+# Terms are split into shards by their first PREFIX_LENGTH characters
+PREFIX_LENGTH = 2
+
+split_into_terms = re.compile(r"[a-z0-9_]{2,}")
+
+
+def get_terms(gitcommit):
+    """Get the search terms for a commit."""
+    text = "\n".join(
+        [
+            gitcommit.summary,
+            gitcommit.message,
+            gitcommit.author,
+            "\n".join(gitcommit.modified_files),
+        ]
+    )
+    return set(split_into_terms.findall(text.lower()))
+
+
+def index_report(cache_filename):
+    """Get the documents and postings (grouped by term prefix) for a single
+    report.
+    """
+    repo = commits_periodical.gitlayer.CachedRepo(None, cache_filename)
+    repo.add_cache(cache_filename)
+
+    docs = []
+    postings = {}
+    for i, githash in enumerate(repo.get_githashes()):
+        gitcommit = repo.get_commit(githash)
+        docs.append([githash, gitcommit.summary])
+        for term in get_terms(gitcommit):
+            prefix = term[:PREFIX_LENGTH]
+            postings.setdefault(prefix, {}).setdefault(term, []).append(i)
+    return docs, postings
+
+
+def _write_text_if_changed(filename, text):
+    """Write the text, unless the file already contains it."""
+    if os.path.exists(filename):
+        with open(filename, encoding="utf8") as fp:
+            if fp.read() == text:
+                return
+    commits_periodical.utils.write_text(filename, text)
+
+
+def _write_if_changed(filename, data):
+    """Write the data as JSON, unless the file already contains it."""
+    out = json.dumps(data, separators=(",", ":"), sort_keys=True)
+    _write_text_if_changed(filename, out)
+
+
+def generate_search(project_dirname, index):
+    """Update the static search index over every commit in every report.
+    Only reports whose commit cache has changed are re-indexed, and only
+    the shards containing their terms are rewritten.
+    """
+    filename = os.path.join(project_dirname, SEARCH_FILENAME)
+    # Other commands may be generating at the same time
+    with commits_periodical.utils.lock_cache(filename):
+        _update_search(project_dirname, index, filename)
+
+
+def _update_search(project_dirname, index, filename):
+    html_dirname = project_dirname.replace("projects", "out")
+    out_dirname = os.path.join(html_dirname, "search")
+    docs_dirname = os.path.join(out_dirname, "docs")
+    os.makedirs(docs_dirname, exist_ok=True)
+
+    # Load the previous postings for each report, unless the output has
+    # been removed
+    reports = {}
+    if os.path.exists(filename) and os.path.exists(
+        os.path.join(html_dirname, "search.html")
+    ):
+        with open(filename, "rb") as fp:
+            reports = pickle.load(fp)
+
+    changed_prefixes = set()
+    for name in list(reports.keys()):
+        if name not in index.sorted_main_names:
+            changed_prefixes.update(reports[name]["postings"].keys())
+            del reports[name]
+            os.remove(os.path.join(docs_dirname, f"{name}.json"))
+
+    num_indexed = 0
+    for name in index.sorted_main_names:
+        cache_filename = index.get_filename(name).replace(".toml", ".gitcache")
+        if not os.path.exists(cache_filename):
+            continue
+        stamp = commits_periodical.utils.file_stamp(cache_filename)
+        if name in reports and reports[name]["stamp"] == stamp:
+            continue
+
+        docs, postings = index_report(cache_filename)
+        if name in reports:
+            changed_prefixes.update(reports[name]["postings"].keys())
+        changed_prefixes.update(postings.keys())
+        reports[name] = {"stamp": stamp, "docs": docs, "postings": postings}
+        _write_if_changed(os.path.join(docs_dirname, f"{name}.json"), docs)
+        num_indexed += 1
+
+    # The index pages link to this even if there's nothing to search yet
+    templates = commits_periodical.html_templates.HtmlTemplates()
+    filename_out = os.path.join(html_dirname, "search.html")
+    _write_text_if_changed(filename_out, templates.search)
+
+    if not changed_prefixes:
+        return
+    print(f"Indexed {num_indexed} reports for searching")
+
+    # Rewrite the shards for any prefixes which have changed
+    for prefix in changed_prefixes:
+        shard = {}
+        for name, report in reports.items():
+            for term, positions in report["postings"].get(prefix, {}).items():
+                shard.setdefault(term, {})[name] = positions
+        shard_filename = os.path.join(out_dirname, f"{prefix}.json")
+        if shard:
+            _write_if_changed(shard_filename, shard)
+        elif os.path.exists(shard_filename):
+            os.remove(shard_filename)
+
+    with commits_periodical.utils.atomic_write(filename, "wb") as fp:
+        pickle.dump(reports, fp)
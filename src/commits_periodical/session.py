@@ -0,0 +1,263 @@
+import cmd
+import os.path
+import re
+import time
+
+import commits_periodical.archive
+import commits_periodical.classify
+import commits_periodical.data
+import commits_periodical.generate
+import commits_periodical.html_templates
+import commits_periodical.investigate
+import commits_periodical.model
+import commits_periodical.project_data
+import commits_periodical.query
+import commits_periodical.rule_coverage
+import commits_periodical.utils
+
+# Files which are re-read (if they've changed) before each command
+PROJECT_FILENAMES = ("categories.toml", "classify.toml")
+
+
+class Session(cmd.Cmd):
+    """Interactive investigation, with the project, the archive, and any
+    reports loaded once.
+    """
+
+    intro = "Investigating; type 'help' for commands, or 'quit' to finish."
+
+    def __init__(self, project_dirname, index, name, repo, doc):
+        super().__init__()
+        self.project_dirname = project_dirname
+        self.index = index
+        self.archive = commits_periodical.archive.ArchiveIndex(project_dirname)
+        self.templates = commits_periodical.html_templates.HtmlTemplates()
+        self.project = None
+        self.project_stamps = None
+        self.query_index = None
+        # Report name -> (repo, doc)
+        self.reports = {name: (repo, doc)}
+        self.name = name
+        self.start = None
+        self.reload_project()
+
+    # Loading
+
+    def get_project_stamps(self):
+        return [
+            commits_periodical.utils.file_stamp(
+                os.path.join(self.project_dirname, filename)
+            )
+            for filename in PROJECT_FILENAMES
+        ]
+
+    def reload_project(self):
+        """Re-read the classifiers if they've changed since the last time."""
+        try:
+            stamps = self.get_project_stamps()
+            if stamps == self.project_stamps:
+                return
+            project = commits_periodical.project_data.ProjectData(
+                self.project_dirname
+            )
+        except (ValueError, KeyError, re.error, OSError) as err:
+            if self.project is None:
+                raise
+            # Keep the previous classifiers until the files are fixed
+            print(f"Not reloading the classifiers: {err}")
+            return
+        if self.project is not None:
+            print("Reloaded the classifiers")
+        self.project = project
+        self.project_stamps = stamps
+
+    def get_query_index(self):
+        if self.query_index is None:
+            self.query_index = commits_periodical.query.QueryIndex(
+                self.project_dirname
+            )
+            self.query_index.update(self.index)
+        return self.query_index
+
+    def get_report(self):
+        return self.reports[self.name]
+
+    def set_prompt(self):
+        self.prompt = f"({self.name}) "
+
+    # cmd.Cmd hooks
+
+    def preloop(self):
+        self.set_prompt()
+
+    def precmd(self, line):
+        self.start = time.perf_counter()
+        return line
+
+    def postcmd(self, stop, line):
+        if line and not stop:
+            print(f"({time.perf_counter() - self.start:.3f} s)")
+        return stop
+
+    def onecmd(self, line):
+        # Hold the lock while each command runs, but not while waiting for
+        # input
+        lock = commits_periodical.utils.lock_project(
+            self.project_dirname, False
+        )
+        # Don't let a mistake end the session
+        try:
+            self.reload_project()
+            return super().onecmd(line)
+        except Exception as err:
+            print(f"{type(err).__name__}: {err}")
+            return False
+        finally:
+            lock.close()
+
+    def emptyline(self):
+        return False
+
+    # Commands
+
+    def do_report(self, arg):
+        """report NAME: switch to another report (loaded once)."""
+        name = arg.strip()
+        if not name:
+            print(f"Current report: {self.name}")
+            return
+        if name not in self.reports:
+            if name not in self.index.get_names():
+                print(f"Report not in the index: {name}")
+                return
+            self.reports[name] = commits_periodical.data.load_report(
+                self.index, name
+            )
+        self.name = name
+        self.set_prompt()
+
+    def do_query(self, arg):
+        """query TERMS: search the archive; see 'investigate query'."""
+        try:
+            commits_periodical.investigate.print_query(
+                self.get_query_index(), arg.split()
+            )
+        except (ValueError, re.error) as err:
+            print(err)
+
+    def do_disputed(self, arg):
+        """disputed: show the commits whose category was changed manually."""
+        repo, doc = self.get_report()
+        commits_periodical.investigate.check_disputed(repo, doc)
+
+    def do_section(self, arg):
+        """section NAME: re-run one classifier section over the report, and
+        show which commits it would now classify differently.
+        """
+        name = arg.strip()
+        if name not in self.project.classifiers:
+            sections = ", ".join(self.project.classifiers)
+            print(f"Section not recognized; choose from: {sections}")
+            return
+        classifier = self.project.classifiers[name]
+        examine_part = classifier.get_metadata("_acts_on")
+        repo, doc = self.get_report()
+
+        num_matched = 0
+        num_shadowed = 0
+        changes = []
+        for githash, entry in doc.get_entries():
+            old_cat = None
+            if entry.has_auto_cat():
+                section, _ = entry.get_auto_reasons()
+                if section < name:
+                    # An earlier section classified it
+                    num_shadowed += 1
+                    continue
+                if section == name:
+                    old_cat = entry.get_auto_cat()
+            gitcommit = repo.get_commit(githash)
+            examine = commits_periodical.classify.get_examine(
+                gitcommit, examine_part
+            )
+            credited = commits_periodical.rule_coverage.get_credited(
+                name, classifier, examine
+            )
+            new_cat = credited[0][0] if credited else None
+            if new_cat:
+                num_matched += 1
+            if new_cat != old_cat:
+                change = f"{entry.cat} -> {new_cat or 'later sections'}"
+                changes.append((githash, change, gitcommit.summary))
+
+        print(
+            f"{name} matches {num_matched} commits "
+            f"({num_shadowed} were classified by earlier sections)"
+        )
+        for githash, change, summary in changes:
+            print(f"  {githash[:12]}  {change}  {summary}")
+        print(f"{len(changes)} commits would change")
+
+    def do_classify(self, arg):
+        """classify: classify the report again with the current classifiers
+        (in memory only; the report isn't saved).
+        """
+        repo, doc = self.get_report()
+        old_cats = {h: e.cat for h, e in doc.get_entries()}
+        doc.clear_automatic_annotations()
+        pipeline = commits_periodical.classify.ClassifyPipeline(
+            repo, doc, self.project
+        )
+        for githash in doc.get_hashes():
+            pipeline.add(githash)
+        pipeline.finish()
+        pipeline.print_classified()
+
+        num_changed = 0
+        for githash, entry in doc.get_entries():
+            old_cat = old_cats[githash]
+            if entry.cat != old_cat:
+                summary = repo.get_commit(githash).summary
+                print(f"  {githash[:12]}  {old_cat} -> {entry.cat}  {summary}")
+                num_changed += 1
+        print(f"{num_changed} commits changed category")
+
+    def do_preview(self, arg):
+        """preview CATEGORY: write the debug HTML of one category in the
+        report (as classified in this session).
+        """
+        cat = arg.strip()
+        repo, doc = self.get_report()
+        index_entry = self.index.get_index_entry(self.name)
+        model = commits_periodical.model.build_model(
+            repo, doc, self.project, index_entry, self.name, self.archive, True
+        )
+        section = model.get_section(cat)
+        if section is None or not section.is_shown():
+            cats = ", ".join(s.cat for s in model.sections if s.is_shown())
+            print(f"Category not shown; choose from: {cats}")
+            return
+        body = commits_periodical.generate.make_section(
+            self.templates, section, True, None, None
+        )
+        title = f"{self.name} preview: {section.title}"
+        out = self.templates.html_begin % (title, title)
+        out += body
+        out += self.templates.HTML_END
+
+        out_dirname = self.project_dirname.replace("projects/", "out/")
+        filename = os.path.join(out_dirname, f"{self.name}-preview.html")
+        commits_periodical.utils.write_text(filename, out)
+        print(f"Wrote {section.num} commits to {filename}")
+
+    def do_quit(self, arg):
+        """quit: end the session."""
+        return True
+
+    def do_EOF(self, arg):
+        print()
+        return True
+
+
+def run_session(project_dirname, index, name, repo, doc):
+    Session(project_dirname, index, name, repo, doc).cmdloop()
@@ -0,0 +1,56 @@
+import collections
+import os
+import os.path
+
+import commits_periodical.utils
+
+# Number of commits (or groups) in each shard, by default
+DEFAULT_SHARD_SIZE = 50
+
+
+class Shards:
+    """Commit bodies which are written to separate files, and only fetched
+    when a reader opens them.  Shards are split by category and then into
+    groups of a fixed number of items, so a shard only changes if one of its
+    own items changes.
+    """
+
+    def __init__(self, filename_base, size):
+        self.dirname = f"{filename_base}-shards"
+        self.url_prefix = os.path.basename(self.dirname)
+        self.size = size
+        self.contents = collections.defaultdict(str)
+
+    def add(self, cat, num, details):
+        """Move the body of the rendered <details> into a shard, and return
+        the <details> without its body.
+        """
+        head_end = details.index("</summary>") + len("</summary>")
+        body_end = details.rindex("</details>")
+        head = details[:head_end]
+        body = details[head_end:body_end]
+
+        shard_name = f"{cat}-{num // self.size:03d}.html"
+        item = f"{cat}-{num}"
+        self.contents[shard_name] += f'<div data-item="{item}">{body}</div>\n'
+
+        url = f"{self.url_prefix}/{shard_name}"
+        attrs = f' data-shard="{url}" data-item="{item}"'
+        head = head.replace("<details", f"<details{attrs}", 1)
+        return f"{head}\n</details>\n"
+
+    def save(self):
+        os.makedirs(self.dirname, exist_ok=True)
+        for shard_name, content in self.contents.items():
+            filename = os.path.join(self.dirname, shard_name)
+            # Don't touch shards which haven't changed
+            if os.path.exists(filename):
+                with open(filename, encoding="utf8") as fp:
+                    if fp.read() == content:
+                        continue
+            commits_periodical.utils.write_text(filename, content)
+
+        # Remove any shards left over from a previous (larger) report
+        for shard_name in os.listdir(self.dirname):
+            if shard_name not in self.contents:
+                os.remove(os.path.join(self.dirname, shard_name))
@@ -0,0 +1,200 @@
+import array
+import collections
+import itertools
+import operator
+
+import commits_periodical.query
+
+# Number of reports in each moving average, by default
+DEFAULT_WINDOW = 4
+
+# Number of rows to show in each table
+MAX_ROWS = 15
+
+# Minimum change in share (in percentage points) to count as drifting
+DRIFT_THRESHOLD = 1.0
+
+
+class Column:
+    """A column of values, stored as small integer codes."""
+
+    def __init__(self):
+        self.codes = array.array("i")
+        self.labels = []
+        self._lookup = {}
+
+    def append(self, value):
+        code = self._lookup.get(value)
+        if code is None:
+            code = len(self.labels)
+            self._lookup[value] = code
+            self.labels.append(value)
+        self.codes.append(code)
+
+
+class CommitTable:
+    """One row per commit across every report, stored as parallel columns of
+    integer codes so that counts can be computed without per-commit Python
+    loops.
+    """
+
+    def __init__(self, query_index, names):
+        self.weeks = [name for name in names if name in query_index.segments]
+        self.week = array.array("i")
+        self.cat = Column()
+        self.author = Column()
+        self.section = Column()
+        self.pattern = Column()
+        for i, name in enumerate(self.weeks):
+            _, records = query_index.segments[name]
+            self.week.extend(itertools.repeat(i, len(records)))
+            for record in records.values():
+                self.cat.append(record.category)
+                self.author.append(record.author)
+                self.section.append(record.section)
+                pattern = record.pattern
+                # Filename classifiers can record several patterns
+                if isinstance(pattern, list):
+                    pattern = ", ".join(pattern)
+                self.pattern.append((record.section, pattern))
+
+    def count(self, column):
+        """Get a week x value matrix of the number of commits."""
+        num_cols = len(column.labels)
+        # Flatten each (week, value) pair into a single integer, and count
+        # them all at once
+        keys = map(
+            operator.add,
+            map(operator.mul, self.week, itertools.repeat(num_cols)),
+            column.codes,
+        )
+        counter = collections.Counter(keys)
+        flat = [0] * (len(self.weeks) * num_cols)
+        for key, num in counter.items():
+            flat[key] = num
+        return [
+            flat[i * num_cols : (i + 1) * num_cols]
+            for i in range(len(self.weeks))
+        ]
+
+    def totals(self):
+        """Get the total number of commits in each week."""
+        counter = collections.Counter(self.week)
+        return [counter[i] for i in range(len(self.weeks))]
+
+
+def window_sums(matrix, start, end):
+    """Sum the rows of the matrix from start to end."""
+    return [sum(col) for col in zip(*matrix[start:end])]
+
+
+def moving_averages(values, window):
+    """Get the moving average of the values, for each full window."""
+    sums = list(itertools.accumulate(values, initial=0))
+    return [
+        (sums[i] - sums[i - window]) / window for i in range(window, len(sums))
+    ]
+
+
+def get_shares(matrix, totals, window):
+    """Get the share (in percent) of each column in the latest window, and in
+    the window before that.
+    """
+    num = len(matrix)
+    recent = window_sums(matrix, num - window, num)
+    prev = window_sums(matrix, max(0, num - 2 * window), num - window)
+    recent_total = sum(totals[num - window :]) or 1
+    prev_total = sum(totals[max(0, num - 2 * window) : num - window]) or 1
+    recent_share = [100 * n / recent_total for n in recent]
+    prev_share = [100 * n / prev_total for n in prev]
+    return recent_share, prev_share
+
+
+def print_shares(title, labels, matrix, totals, window):
+    """Print the moving averages and change in share of each column."""
+    recent_share, prev_share = get_shares(matrix, totals, window)
+    columns = list(zip(*matrix))
+    order = sorted(
+        range(len(labels)), key=lambda c: recent_share[c], reverse=True
+    )
+
+    print(f"\n{title:24} latest  avg now  avg prev   share  change")
+    for c in order[:MAX_ROWS]:
+        averages = moving_averages(columns[c], window)
+        avg_prev = averages[-window - 1] if len(averages) > window else 0
+        change = recent_share[c] - prev_share[c]
+        print(
+            f"{str(labels[c])[:24]:24} {columns[c][-1]:6}  {averages[-1]:7.1f}"
+            f"  {avg_prev:8.1f}  {recent_share[c]:5.1f}%  {change:+6.1f}"
+        )
+
+
+def print_drifting(title, labels, matrix, totals, window):
+    """Print the columns whose share has changed the most."""
+    recent_share, prev_share = get_shares(matrix, totals, window)
+    changes = [r - p for r, p in zip(recent_share, prev_share)]
+    drifting = [
+        c for c in range(len(labels)) if abs(changes[c]) >= DRIFT_THRESHOLD
+    ]
+    drifting.sort(key=lambda c: abs(changes[c]), reverse=True)
+
+    print(f"\n{title} (hit rate, previous -> latest {window} reports):")
+    if not drifting:
+        print("  (Nothing is drifting)")
+    for c in drifting[:MAX_ROWS]:
+        label = labels[c]
+        if isinstance(label, tuple):
+            label = "  ".join(label)
+        label = label.strip() or "(none)"
+        print(
+            f"  {prev_share[c]:5.1f}% -> {recent_share[c]:5.1f}%"
+            f"  ({changes[c]:+5.1f})  {label}"
+        )
+
+
+def trends(project_dirname, index, terms):
+    window = DEFAULT_WINDOW
+    for term in terms:
+        key, _, value = term.partition(":")
+        if key != "window" or not value.isdigit() or int(value) < 1:
+            print(f"Trends option not recognized: {term}")
+            exit(1)
+        window = int(value)
+
+    query_index = commits_periodical.query.QueryIndex(project_dirname)
+    query_index.update(index)
+    table = CommitTable(query_index, index.sorted_main_names)
+    if len(table.weeks) < 2 * window:
+        print(f"Need at least {2 * window} reports for trends")
+        exit(1)
+
+    totals = table.totals()
+    print(
+        f"Trends over {len(table.weeks)} reports ({table.weeks[0]} to "
+        f"{table.weeks[-1]}), moving average of {window} reports"
+    )
+    averages = moving_averages(totals, window)
+    print(f"Commits per report: latest {totals[-1]}, ", end="")
+    print(f"average {averages[-1]:.1f}")
+
+    print_shares(
+        "Category", table.cat.labels, table.count(table.cat), totals, window
+    )
+    print_shares(
+        "Author", table.author.labels, table.count(table.author), totals, window
+    )
+
+    print_drifting(
+        "Drifting classifier sections",
+        table.section.labels,
+        table.count(table.section),
+        totals,
+        window,
+    )
+    print_drifting(
+        "Drifting classifier patterns",
+        table.pattern.labels,
+        table.count(table.pattern),
+        totals,
+        window,
+    )
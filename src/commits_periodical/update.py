@@ -1,4 +1,7 @@
 import datetime
+import os.path
+
+import commits_periodical.data
 
 
 def update_ref(repo, index, index_entry):
@@ -51,6 +54,42 @@ def update_period(repo, index_entry, doc):
     print(f"Added {num_added} commits")
 
 
+def update_archive(repo, doc, archive, report_name):
+    """Add any commits in the report which aren't yet in the archive index."""
+    new_hashes = [
+        h for h in doc.get_hashes() if archive.get_report(h) != report_name
+    ]
+    if not new_hashes:
+        return
+
+    gitcommits = [repo.get_commit(h) for h in new_hashes]
+    num_added = archive.add_commits(report_name, gitcommits)
+    archive.save()
+
+    print(f"Indexed {num_added} commits in the archive")
+
+
+def rebuild_archive(index, archive):
+    """Rebuild the archive index from the cached commits of every report,
+    oldest first (so that fixes can find the commits they fix).  Reports
+    without a cache are skipped.
+    """
+    archive.clear()
+    num_reports = 0
+    for name in index.sorted_main_names:
+        filename = index.get_filename(name)
+        cache_filename = filename.replace(".toml", ".gitcache")
+        if not os.path.exists(filename) or not os.path.exists(cache_filename):
+            continue
+        repo, doc = commits_periodical.data.load_report(index, name)
+        gitcommits = [repo.get_commit(h) for h in doc.get_hashes()]
+        archive.add_commits(name, gitcommits)
+        num_reports += 1
+    archive.save()
+
+    print(f"Indexed {len(archive.entries)} commits from {num_reports} reports")
+
+
 def _add_week(date_str):
     dt = datetime.datetime.strptime(date_str, "%Y-%m-%d")
     dt = dt + datetime.timedelta(days=7)
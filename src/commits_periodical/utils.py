@@ -1,10 +1,24 @@
+import contextlib
+import fcntl
+import os
 import re
+import sys
+import tempfile
 import tomllib
 
+import commits_periodical.metrics
+
 LINK_PROBLEM_REPORT = "https://bugs.freebsd.org/bugzilla/show_bug.cgi?id=%s"
 
 LINK_COMMIT = "https://cgit.freebsd.org/src/commit/?id=%s"
 
+LOCK_FILENAME = ".lock"
+
+# The umask can only be read by setting it, which would race with other
+# threads, so read it once (before any threads start)
+UMASK = os.umask(0)
+os.umask(UMASK)
+
 
 def read_toml(filename):
     """Read a toml file (read-only)."""
@@ -13,6 +27,70 @@ def read_toml(filename):
     return doc
 
 
+def file_stamp(filename):
+    """Get something which changes whenever the file changes."""
+    st = os.stat(filename)
+    return (st.st_mtime_ns, st.st_size)
+
+
+@contextlib.contextmanager
+def atomic_write(filename, mode="w"):
+    """Open a temporary file for writing, and rename it to the filename once
+    it's complete.  Readers (and crashes) never see a partial file.
+    """
+    dirname = os.path.dirname(os.path.abspath(filename))
+    basename = os.path.basename(filename)
+    fd, tmp_filename = tempfile.mkstemp(dir=dirname, prefix=f".{basename}.")
+    try:
+        encoding = None if "b" in mode else "utf8"
+        with os.fdopen(fd, mode, encoding=encoding) as fp:
+            yield fp
+            fp.flush()
+            os.fsync(fp.fileno())
+        # mkstemp() only allows the owner to read the file
+        os.chmod(tmp_filename, 0o666 & ~UMASK)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.unlink(tmp_filename)
+        raise
+    commits_periodical.metrics.count("bytes_written", os.path.getsize(filename))
+
+
+def write_text(filename, text):
+    """Write an output file (non-atomically)."""
+    with open(filename, "w", encoding="utf8") as fp:
+        fp.write(text)
+    commits_periodical.metrics.count("bytes_written", len(text.encode()))
+
+
+def lock_project(project_dirname, exclusive):
+    """Take an advisory lock on the project, which is held until the returned
+    file is closed (or the process exits).  Commands which modify the reports
+    need an exclusive lock; others can share the lock.
+    """
+    filename = os.path.join(project_dirname, LOCK_FILENAME)
+    operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+    fp = open(filename, "a")
+    try:
+        fcntl.flock(fp, operation | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print(f"Waiting for the lock on {project_dirname}", file=sys.stderr)
+        fcntl.flock(fp, operation)
+    return fp
+
+
+@contextlib.contextmanager
+def lock_cache(filename):
+    """Hold an exclusive lock on a cache which commands sharing the project
+    lock may update at the same time.  While holding it, read the cache
+    again and merge in any new entries before writing it, so that neither
+    command loses the other's entries.
+    """
+    with open(f"{filename}.lock", "a") as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        yield
+
+
 def get_summary_prefix(commit):
     """Get the commit summary, but only up to the first colon."""
     out = commit.summary
@@ -22,7 +100,9 @@ def get_summary_prefix(commit):
 
 
 def commit_text_display(text, nostrip=False):
-    """Format a git commit message for display."""
+    """Format a git commit message for display.  Changing this changes the
+    cached commit HTML; increase fragments.FRAGMENT_FORMAT along with it.
+    """
     out = ""
     # Strip the summary as well
     if nostrip:
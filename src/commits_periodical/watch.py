@@ -0,0 +1,57 @@
+import time
+import traceback
+
+import commits_periodical.gitlayer
+
+# Seconds between checks of git's HEAD
+DEFAULT_INTERVAL = 60
+
+
+def get_affected_names(index, name):
+    """Get the report, and the derived reports which include it."""
+    names = [name]
+    for other in index.get_names():
+        index_entry = index.get_index_entry(other)
+        if not index_entry.is_derived():
+            continue
+        # The spans may be TOML dates rather than strings
+        spans = [str(span) for span in index_entry["include_spans"]]
+        if name in spans:
+            names.append(other)
+    return names
+
+
+def update_ongoing(project):
+    """Add any new commits to the latest report and classify them, then
+    generate the debug HTML of that report and the derived reports which
+    include it.
+    """
+    project.update()
+    project.annotate()
+    index = project.get_index()
+    names = get_affected_names(index, index.get_latest_name())
+    project.render(names, debug=True)
+
+
+def watch(project, interval):
+    """Check git's HEAD every interval seconds, and update the ongoing
+    report whenever it changes.  The project stays loaded between checks,
+    and the lock is only held while updating.
+    """
+    print(f"Watching {project.git_dirname} every {interval} s")
+    last_head = None
+    try:
+        while True:
+            # Reading the ref doesn't start git.  If it can't be read that
+            # way, 'update' asks git each time.
+            head = commits_periodical.gitlayer.read_ref(project.git_dirname)
+            if head is None or head != last_head:
+                try:
+                    update_ongoing(project)
+                    last_head = head
+                except Exception:
+                    # Keep watching; the next commit may fix it
+                    print(traceback.format_exc(), end="")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching")
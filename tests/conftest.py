@@ -0,0 +1,178 @@
+import datetime
+import os
+import os.path
+import pickle
+import shutil
+import subprocess
+
+import pytest
+
+import commits_periodical.gitlayer
+import commits_periodical.project_data
+
+REPO_DIRNAME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_DIRNAME = os.path.join(REPO_DIRNAME, "projects", "freebsd")
+
+# Easily told apart, and no short form of one is a prefix of another
+HASHES = [c * 40 for c in "123456789abcdef"]
+
+
+def make_commit(githash, summary, files, message="", author="Alice A"):
+    return commits_periodical.gitlayer.CachedCommit(
+        githash, author, summary, f"{summary}\n\n{message}", 1736150400, files
+    )
+
+
+# Commits of the first report in the 'project_dirname' fixture
+REPORT_COMMITS = [
+    make_commit(HASHES[0], "pf: fix states", ["sys/netpfil/pf/pf.c"]),
+    make_commit(HASHES[1], "Fix typo", ["usr.bin/grep/grep.1"]),
+    make_commit(
+        HASHES[2],
+        "tcp: add an option",
+        ["sys/netinet/tcp_input.c"],
+        "Relnotes: yes",
+    ),
+    make_commit(
+        HASHES[3],
+        'Revert "pf: fix states"',
+        ["sys/netpfil/pf/pf.c"],
+        f"This reverts commit {HASHES[0]}.",
+        "Bob B",
+    ),
+    make_commit(
+        HASHES[4],
+        "tcp: fix the option",
+        ["share/man/man4/tcp.4"],
+        f"Fixes:  {HASHES[2][:12]}",
+        "Bob B",
+    ),
+    # Classified once the test is omitted
+    make_commit(
+        HASHES[5], "sh: add a builtin", ["bin/sh/tests/t.sh", "bin/sh/main.c"]
+    ),
+    # Only classified by the summary
+    make_commit(HASHES[6], "bus: tidy", ["weird/thing.c"]),
+    make_commit(HASHES[7], "Something else", ["weird/thing.c"]),
+] + [
+    make_commit(h, "nvme: tidy", ["sys/dev/nvme/nvme.c"], author="Carol C")
+    for h in HASHES[8:11]
+]
+
+# Commits of the second (ongoing) report
+ONGOING_COMMITS = [
+    make_commit(HASHES[11], "ip6: fix", ["sys/netinet6/ip6_input.c"]),
+    make_commit(HASHES[12], "grep: fix", ["usr.bin/grep/grep.c"]),
+]
+
+
+def get_index_table(name, start_after, end_including):
+    date_end = datetime.date.fromisoformat(name) + datetime.timedelta(days=6)
+    return (
+        f"[{name}]\n"
+        f'display_date_start = "{name}"\n'
+        f'display_date_end = "{date_end}"\n'
+        f'start_after = "{start_after}"\n'
+        f'end_including = "{end_including}"\n'
+    )
+
+
+def write_project(root_dirname, reports):
+    """Write a project with the repository's classifiers, and the reports
+    (a list of name, commits) with their cached commits.  The last report
+    is ongoing.  Returns the project directory.
+    """
+    project_dirname = os.path.join(root_dirname, "projects", "freebsd")
+    os.makedirs(project_dirname)
+    os.makedirs(os.path.join(root_dirname, "out", "freebsd"))
+    for filename in ("categories.toml", "classify.toml"):
+        shutil.copy(os.path.join(PROJECT_DIRNAME, filename), project_dirname)
+
+    tables = []
+    start_after = "0" * 40
+    for name, gitcommits in reports:
+        end_including = gitcommits[-1].githash
+        tables.append(get_index_table(name, start_after, end_including))
+        start_after = end_including
+
+        filename = os.path.join(project_dirname, f"{name}.toml")
+        with open(filename, "w", encoding="utf8") as fp:
+            fp.write("".join(f"[{c.githash}]\n" for c in gitcommits))
+        with open(filename.replace(".toml", ".gitcache"), "wb") as fp:
+            pickle.dump({c.githash: c for c in gitcommits}, fp)
+    with open(os.path.join(project_dirname, "index.toml"), "w") as fp:
+        fp.write("\n".join(tables) + "ongoing = true\n")
+    return project_dirname
+
+
+def git(git_dirname, *args):
+    result = subprocess.run(
+        ["git", "-C", git_dirname, *args],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip()
+
+
+def add_git_commit(git_dirname, filename, summary):
+    """Commit a change to the file, and return the new hash."""
+    path = os.path.join(git_dirname, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a", encoding="utf8") as fp:
+        fp.write(f"{summary}\n")
+    git(git_dirname, "add", filename)
+    git(git_dirname, "commit", "-q", "-m", summary)
+    return git(git_dirname, "rev-parse", "HEAD")
+
+
+@pytest.fixture(scope="session")
+def project():
+    return commits_periodical.project_data.ProjectData(PROJECT_DIRNAME)
+
+
+@pytest.fixture
+def project_dirname(tmp_path):
+    """A project with the repository's classifiers, and two reports (the
+    second is ongoing).
+    """
+    return write_project(
+        str(tmp_path),
+        [("2025-01-06", REPORT_COMMITS), ("2025-01-13", ONGOING_COMMITS)],
+    )
+
+
+@pytest.fixture
+def git_project(tmp_path, monkeypatch):
+    """A git repository with a root commit and then two reports of three
+    commits each (the second is ongoing), and a project whose reports
+    haven't been updated.  Returns the project and git directories, and
+    every commit's hash.
+    """
+    for key in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{key}_NAME", "Alice A")
+        monkeypatch.setenv(f"GIT_{key}_EMAIL", "alice@example.com")
+        monkeypatch.setenv(f"GIT_{key}_DATE", "2025-01-06T12:00:00Z")
+    git_dirname = str(tmp_path / "git")
+    os.makedirs(git_dirname)
+    git(git_dirname, "init", "-q")
+    hashes = [add_git_commit(git_dirname, "README", "Initial commit")]
+    for filename, summary in [
+        ("sys/netinet/tcp.c", "tcp: 1"),
+        ("usr.bin/grep/grep.c", "grep: 2"),
+        ("sys/dev/nvme/nvme.c", "nvme: 3"),
+        ("share/man/man4/tcp.4", "tcp.4: 4"),
+        ("sys/netinet/ip.c", "ip: 5"),
+        ("lib/libc/gen/time.c", "libc: 6"),
+    ]:
+        hashes.append(add_git_commit(git_dirname, filename, summary))
+
+    project_dirname = write_project(str(tmp_path), [])
+    with open(os.path.join(project_dirname, "index.toml"), "w") as fp:
+        fp.write(
+            get_index_table("2025-01-06", hashes[0], hashes[3])
+            + "\n"
+            + get_index_table("2025-01-13", hashes[3], hashes[6])
+            + "ongoing = true\n"
+        )
+    return project_dirname, git_dirname, hashes
@@ -0,0 +1,51 @@
+import dataclasses
+import json
+import os
+
+import commits_periodical.aggregate
+import commits_periodical.utils
+
+aggregate_module = commits_periodical.aggregate
+
+
+def write_aggregate(report_filename, digest, stamp):
+    aggregate = aggregate_module.ReportAggregate(
+        digest=digest,
+        total_commits=1,
+        categories={"network": 1},
+        highlighted=[],
+        stats={},
+        stamp=stamp,
+    )
+    filename = aggregate_module.get_filename(report_filename)
+    with open(filename, "w", encoding="utf8") as fp:
+        json.dump(dataclasses.asdict(aggregate), fp)
+
+
+def test_load(tmp_path, monkeypatch):
+    report_filename = str(tmp_path / "2025-01-06.toml")
+    with open(report_filename, "w") as fp:
+        fp.write(f"[{'1' * 40}]\n")
+    digest = aggregate_module.get_digest(report_filename)
+    stamp = list(commits_periodical.utils.file_stamp(report_filename))
+
+    # Written before stamps were recorded
+    write_aggregate(report_filename, digest, [])
+    assert aggregate_module.load(report_filename).total_commits == 1
+
+    # The report isn't read if its stamp hasn't changed
+    write_aggregate(report_filename, digest, stamp)
+    monkeypatch.setattr(aggregate_module, "get_digest", None)
+    assert aggregate_module.load(report_filename).total_commits == 1
+    monkeypatch.undo()
+
+    with open(report_filename, "a") as fp:
+        fp.write(f"[{'2' * 40}]\n")
+    assert aggregate_module.load(report_filename) is None
+
+    # Touched, but not changed
+    write_aggregate(report_filename, digest, stamp)
+    with open(report_filename, "w") as fp:
+        fp.write(f"[{'1' * 40}]\n")
+    os.utime(report_filename, ns=(1, 1))
+    assert aggregate_module.load(report_filename).total_commits == 1
@@ -0,0 +1,33 @@
+import commits_periodical.archive
+import commits_periodical.project
+
+import conftest
+
+HASHES = conftest.HASHES
+
+
+def test_resolve(tmp_path):
+    archive = commits_periodical.archive.ArchiveIndex(str(tmp_path))
+    archive.entries = {
+        "abc1" + "0" * 36: commits_periodical.archive.ArchiveEntry(),
+        "abc2" + "0" * 36: commits_periodical.archive.ArchiveEntry(),
+    }
+    assert archive.resolve("abc1") == "abc1" + "0" * 36
+    assert archive.resolve("abc2" + "0" * 36) == "abc2" + "0" * 36
+    # Ambiguous, or not in the archive
+    assert archive.resolve("abc") is None
+    assert archive.resolve("abd") is None
+
+
+def test_rebuild_archive(project_dirname):
+    project = commits_periodical.project.Project(project_dirname)
+    project.rebuild_archive()
+
+    archive = commits_periodical.archive.ArchiveIndex(project_dirname)
+    assert archive.get_report(HASHES[0]) == "2025-01-06"
+    assert archive.get_report(HASHES[12]) == "2025-01-13"
+    # The fix refers to a short hash
+    assert archive.get(HASHES[4]).fixes == [HASHES[2]]
+    assert archive.get(HASHES[2]).fixed_by == [HASHES[4]]
+    assert archive.get(HASHES[3]).reverts == [HASHES[0]]
+    assert archive.get(HASHES[0]).reverted_by == [HASHES[3]]
@@ -0,0 +1,38 @@
+import os
+import os.path
+import pickle
+
+import commits_periodical.archive
+import commits_periodical.project
+
+
+def read_caches(project_dirname):
+    caches = {}
+    for filename in sorted(os.listdir(project_dirname)):
+        if filename.endswith(".gitcache"):
+            with open(os.path.join(project_dirname, filename), "rb") as fp:
+                caches[filename] = pickle.load(fp)
+    return caches
+
+
+def test_backfill(git_project):
+    project_dirname, git_dirname, hashes = git_project
+    project = commits_periodical.project.Project(project_dirname, git_dirname)
+    for name in ("2025-01-06", "2025-01-13"):
+        project.update(name, commits_only=True)
+    caches = read_caches(project_dirname)
+    assert list(caches["2025-01-06.gitcache"]) == hashes[1:4]
+    assert list(caches["2025-01-13.gitcache"]) == hashes[4:]
+    archive_filename = os.path.join(
+        project_dirname, commits_periodical.archive.ARCHIVE_FILENAME
+    )
+    with open(archive_filename, "rb") as fp:
+        archive_entries = pickle.load(fp)
+
+    for filename in caches:
+        os.remove(os.path.join(project_dirname, filename))
+    os.remove(archive_filename)
+    project.backfill(jobs=2)
+    assert read_caches(project_dirname) == caches
+    with open(archive_filename, "rb") as fp:
+        assert pickle.load(fp) == archive_entries
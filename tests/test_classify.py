@@ -0,0 +1,190 @@
+import pickle
+
+import commits_periodical.classify
+import commits_periodical.data
+import commits_periodical.gitlayer
+
+import conftest
+
+re_func = commits_periodical.classify.re_func
+
+
+# Classifying as it was done before the single pass over each commit: each
+# classifier section is applied to every commit in turn, and every pattern
+# is a regex applied with re_func().
+
+
+def old_apply_text(entry, name, classifier, examine):
+    for cat, patterns in classifier.items():
+        for pattern in patterns:
+            if re_func(pattern, examine, 0, classifier):
+                entry.set_auto_cat(cat, name, pattern)
+
+
+def old_match_filenames(entry, name, classifier, examine):
+    for cat, patterns in classifier.items():
+        keep_patterns = set()
+        matches_cat = list(examine)
+        for pattern in patterns:
+            for f in list(matches_cat):
+                if re_func(pattern, f, 0, classifier):
+                    matches_cat.remove(f)
+                    keep_patterns.add(pattern)
+        # If there's any files left, it isn't a complete match
+        if matches_cat:
+            continue
+        print_patterns = commits_periodical.classify.get_print_patterns(
+            keep_patterns
+        )
+        entry.set_auto_cat(cat, name, print_patterns)
+
+
+def old_apply_filenames(entry, name, classifier, examine, meta):
+    if len(examine) == 0:
+        return
+    old_match_filenames(entry, name, classifier, examine)
+    if entry.has_auto_cat():
+        return
+
+    possible_omit = classifier.get_metadata(
+        "_filenames_try_omit", meta["_filenames_try_omit"]
+    )
+    new_examine = [
+        f
+        for f in examine
+        if not any(re_func(omit, f, 0, classifier) for omit in possible_omit)
+    ]
+    if len(new_examine) == 0 or new_examine == examine:
+        return
+    old_match_filenames(entry, name, classifier, new_examine)
+
+
+class NoPipeline:
+    """Nothing is classified by a later section before reverts are found."""
+
+    def unclassify(self, githash):
+        pass
+
+
+def old_classify(repo, doc, project):
+    for name, classifier in project.classifiers.items():
+        examine_part = classifier.get_metadata("_acts_on")
+        for githash in doc.get_hashes():
+            entry = doc.get_entry(githash)
+            if entry.has_auto_cat():
+                continue
+            examine = commits_periodical.classify.get_examine(
+                repo.get_commit(githash), examine_part
+            )
+            if name == "00-reverts":
+                commits_periodical.classify.apply_revert(
+                    repo, doc, name, classifier, githash, examine, NoPipeline()
+                )
+            elif examine_part == "filenames":
+                old_apply_filenames(
+                    entry, name, classifier, examine, project.meta
+                )
+            else:
+                old_apply_text(entry, name, classifier, examine)
+
+
+def get_auto_cats(doc):
+    return {
+        githash: (
+            entry.ann.get("ac"),
+            entry.ann.get("ac_section"),
+            entry.ann.get("ac_pattern"),
+        )
+        for githash, entry in doc.get_entries()
+    }
+
+
+def load_report(project_dirname, name):
+    filename = f"{project_dirname}/{name}.toml"
+    repo = commits_periodical.gitlayer.CachedRepo(
+        None, filename.replace(".toml", ".gitcache")
+    )
+    doc = commits_periodical.data.Report(filename, read_only=False)
+    return repo, doc
+
+
+def test_pipeline(project, project_dirname):
+    for name in ("2025-01-06", "2025-01-13"):
+        repo, old_doc = load_report(project_dirname, name)
+        old_classify(repo, old_doc, project)
+
+        repo, doc = load_report(project_dirname, name)
+        pipeline = commits_periodical.classify.ClassifyPipeline(
+            repo, doc, project
+        )
+        for githash in doc.get_hashes():
+            pipeline.add(githash)
+        assert get_auto_cats(doc) == get_auto_cats(old_doc)
+
+
+def test_classify_report(project, project_dirname):
+    name = "2025-01-06"
+    repo, doc = load_report(project_dirname, name)
+    commits_periodical.classify.classify_period(repo, doc, project, False)
+
+    repo, doc = load_report(project_dirname, name)
+    entries = [doc.get_entry(c.githash) for c in conftest.REPORT_COMMITS]
+    assert [e.cat for e in entries] == [
+        "reverts",
+        "style",
+        "network",
+        "reverts",
+        "network",
+        "userland",
+        "hardware",
+        "unknown",
+        "hardware",
+        "hardware",
+        "hardware",
+    ]
+    # The revert pair, the fix and what it fixes, and the nvme commits
+    assert entries[0].groupname() == entries[3].groupname()
+    assert entries[2].groupname() == entries[4].groupname()
+    assert entries[4].get_auto_cat() == "doc"
+    assert len({e.groupname() for e in entries[8:11]}) == 1
+    assert not entries[1].has_group()
+    assert [e.is_highlighted() for e in entries] == [
+        i == 2 for i in range(len(entries))
+    ]
+
+
+def test_incremental(project, project_dirname):
+    name = "2025-01-06"
+    repo, doc = load_report(project_dirname, name)
+    commits_periodical.classify.classify_period(repo, doc, project, False)
+
+    # Add a commit to the classified report
+    gitcommit = conftest.make_commit(
+        conftest.HASHES[13], "nvme: tidy", ["sys/dev/nvme/nvme.c"]
+    )
+    cache_filename = doc.filename.replace(".toml", ".gitcache")
+    with open(cache_filename, "rb") as fp:
+        gitcommits = pickle.load(fp)
+    gitcommits[gitcommit.githash] = gitcommit
+    with open(cache_filename, "wb") as fp:
+        pickle.dump(gitcommits, fp)
+    with open(doc.filename, "a", encoding="utf8") as fp:
+        fp.write(f"\n[{gitcommit.githash}]\n")
+    with open(doc.filename, encoding="utf8") as fp:
+        before = fp.read()
+
+    # Classifying only the new commit gives the same report as classifying
+    # every commit
+    repo, doc = load_report(project_dirname, name)
+    commits_periodical.classify.classify_period(repo, doc, project, False)
+    with open(doc.filename, encoding="utf8") as fp:
+        full = fp.read()
+    with open(doc.filename, "w", encoding="utf8") as fp:
+        fp.write(before)
+    repo, doc = load_report(project_dirname, name)
+    commits_periodical.classify.classify_period(
+        repo, doc, project, False, incremental=True
+    )
+    with open(doc.filename, encoding="utf8") as fp:
+        assert fp.read() == full
+    assert doc.get_entry(gitcommit.githash).cat == "hardware"
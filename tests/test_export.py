@@ -0,0 +1,27 @@
+import json
+import os.path
+
+import commits_periodical.data
+import commits_periodical.export
+
+import conftest
+
+
+def test_export(project_dirname, tmp_path):
+    index = commits_periodical.data.Index(project_dirname)
+    out_dirname = str(tmp_path / "export")
+    commits_periodical.export.export(project_dirname, index, out_dirname, 2)
+
+    with open(os.path.join(out_dirname, "commits.jsonl")) as fp:
+        records = [json.loads(line) for line in fp]
+    commits = conftest.REPORT_COMMITS + conftest.ONGOING_COMMITS
+    assert [r["githash"] for r in records] == [c.githash for c in commits]
+    assert records[0]["report"] == "2025-01-06"
+    assert records[-1]["report"] == "2025-01-13"
+
+    for field in commits_periodical.export.FIELDS:
+        filename = os.path.join(out_dirname, "fields", f"{field}.jsonl")
+        with open(filename) as fp:
+            values = [json.loads(line) for line in fp]
+        assert values == [r[field] for r in records]
+    assert sorted(os.listdir(out_dirname)) == ["commits.jsonl", "fields"]
@@ -0,0 +1,39 @@
+import os
+
+import commits_periodical.fragments
+
+FragmentCache = commits_periodical.fragments.FragmentCache
+
+
+def test_hits_dont_rewrite(tmp_path):
+    cache = FragmentCache(str(tmp_path))
+    cache.put("a", ("url", "aaaa"))
+    cache.put("b", ("url", "bbbb"))
+    cache.save()
+    stamp = os.stat(cache.filename).st_ino
+
+    cache = FragmentCache(str(tmp_path))
+    assert cache.get("a") == ("url", "aaaa")
+    assert cache.get("c") is None
+    cache.save()
+    assert os.stat(cache.filename).st_ino == stamp
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # The order of the hits is saved along with the next put
+    cache.put("c", ("url", "cccc"))
+    cache.save()
+    assert list(FragmentCache(str(tmp_path)).fragments) == ["b", "a", "c"]
+
+
+def test_evict(tmp_path):
+    cache = FragmentCache(str(tmp_path), max_bytes=16)
+    for key in "abc":
+        cache.put(key, ("url", key * 4))
+    cache.save()
+    assert list(FragmentCache(str(tmp_path)).fragments) == ["b", "c"]
+
+    # Evicting when loading (with a smaller limit) rewrites the cache
+    cache = FragmentCache(str(tmp_path), max_bytes=8)
+    assert cache.modified
+    cache.save()
+    assert list(FragmentCache(str(tmp_path)).fragments) == ["c"]
@@ -0,0 +1,58 @@
+import os.path
+import threading
+
+import commits_periodical.project
+
+import conftest
+
+
+def test_generate_shares_lock(project_dirname):
+    project = commits_periodical.project.Project(project_dirname)
+    other = commits_periodical.project.Project(project_dirname)
+    project.annotate(["2025-01-06"])
+
+    # The other generate would wait for the lock if either took it
+    # exclusively
+    with project._locked("generate"):
+        thread = threading.Thread(
+            target=other.render, args=(["2025-01-06"],), daemon=True
+        )
+        thread.start()
+        thread.join(timeout=30)
+        assert not thread.is_alive()
+    project.render(["2025-01-06"])
+
+
+def test_investigate_query(project_dirname, monkeypatch, capsys):
+    project = commits_periodical.project.Project(project_dirname)
+
+    # A query is over the whole archive, not the report
+    def get_report(index, name):
+        raise AssertionError("Loaded the report")
+
+    monkeypatch.setattr(project, "get_report", get_report)
+    project.investigate(["query", "author:Bob B"])
+    assert "2 matching commits" in capsys.readouterr().out
+
+
+def test_reload_when_changed(project_dirname):
+    project = commits_periodical.project.Project(project_dirname)
+    index = project.get_index()
+    data = project.get_project_data()
+    repo, doc = project.get_report(index, "2025-01-06")
+    assert project.get_index() is index
+    assert project.get_project_data() is data
+    assert project.get_report(index, "2025-01-06") == (repo, doc)
+    assert doc.get_entry(conftest.HASHES[1]).cat == "unknown"
+
+    # Classifying rewrites the report, but not its cached commits
+    project.annotate(["2025-01-06"])
+    new_repo, new_doc = project.get_report(index, "2025-01-06")
+    assert new_repo is repo
+    assert new_doc is not doc
+    assert new_doc.get_entry(conftest.HASHES[1]).cat == "style"
+
+    with open(os.path.join(project_dirname, "index.toml"), "a") as fp:
+        fp.write("\n")
+    assert project.get_index() is not index
+    assert project.get_project_data() is data
@@ -0,0 +1,107 @@
+import pytest
+
+import commits_periodical.classify
+import commits_periodical.project_data
+import commits_periodical.regex_cost
+
+Rule = commits_periodical.project_data.Rule
+re_func = commits_periodical.classify.re_func
+
+PATTERNS = [
+    "sys/dev/",
+    "[tT]ypo",
+    "pf:",
+    r"\.[1-9]$",
+    ".*fix",
+    "foo.*",
+    r"sys/.*\.c",
+    "a|b",
+    "",
+]
+
+STRINGS = [
+    "sys/dev/nvme/nvme.c",
+    "Fix typo",
+    "Typo fix",
+    "pf: fix states",
+    "pfsync: fix",
+    "share/man/man4/tcp.4",
+    "usr.bin/grep/grep.1.orig",
+    "foo",
+    "xfoo",
+    "b",
+    "",
+    "line one\nfix on line two",
+]
+
+
+@pytest.mark.parametrize(
+    "pattern, use_func, multiline, kind, literals",
+    [
+        ("sys/dev/", "match", False, "prefix", ("sys/dev/",)),
+        ("foo.*", "match", False, "prefix", ("foo",)),
+        ("[tT]ypo", "search", False, "substring", ("typo", "Typo")),
+        (".*fix", "match", False, "substring", ("fix",)),
+        # With 'match', '.*' can't cross a newline
+        (".*fix", "match", True, "regex", ()),
+        (r"\.[1-9]$", "search", False, "regex", ()),
+        ("a|b", "match", False, "regex", ()),
+        ("", "match", False, "regex", ()),
+    ],
+)
+def test_lower_pattern(pattern, use_func, multiline, kind, literals):
+    assert commits_periodical.project_data.lower_pattern(
+        pattern, use_func, multiline
+    ) == (kind, literals)
+
+
+@pytest.mark.parametrize("use_func", ["match", "search"])
+@pytest.mark.parametrize("multiline", [False, True])
+def test_rule(use_func, multiline):
+    for pattern in PATTERNS:
+        rule = Rule.compile("cat", pattern, 0, use_func, multiline)
+        for string in STRINGS:
+            if not multiline and "\n" in string:
+                continue
+            expected = bool(re_func(pattern, string, 0, use_func))
+            assert bool(rule.test(string)) == expected, (pattern, string)
+
+
+def test_get_rule_test(monkeypatch):
+    rule = Rule.compile("cat", "[tT]ypo", 0, "search", False)
+    assert commits_periodical.classify.get_rule_test(rule) is rule.test
+
+    profile = commits_periodical.regex_cost.RegexProfile()
+    monkeypatch.setattr(commits_periodical.classify, "regex_profile", profile)
+    test = commits_periodical.classify.get_rule_test(rule)
+    assert [bool(test(s)) for s in STRINGS[:3]] == [False, True, True]
+    assert profile.calls["[tT]ypo"] == 3
+
+
+def test_find_matching_rules(project):
+    # Rules looked up by their "prefix:" come between other rules
+    mixed = commits_periodical.project_data.Classifier(
+        {
+            "_acts_on": "summary",
+            "kernel": ["pf", "sys:"],
+            "network": ["pf:", ".*fix", "p"],
+        }
+    )
+    assert "pf" in mixed.prefix_lookup
+    # Summaries are a single line
+    strings = [s for s in STRINGS if "\n" not in s]
+    strings += ["pf: fix", "sys: fix", "pfsync: fix", "pf:", "fix"]
+    classifiers = [mixed, project.classifiers["05-summary-prefix"]]
+    for classifier in classifiers:
+        for string in strings:
+            expected = [
+                (cat, pattern)
+                for cat, patterns in classifier.items()
+                for pattern in patterns
+                if re_func(pattern, string, 0, classifier)
+            ]
+            found = [
+                (rule.cat, rule.pattern)
+                for rule in classifier.find_matching_rules(string)
+            ]
+            assert found == expected, string
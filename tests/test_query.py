@@ -0,0 +1,20 @@
+import commits_periodical.data
+import commits_periodical.query
+
+import conftest
+
+
+def test_query_index(project_dirname):
+    index = commits_periodical.data.Index(project_dirname)
+    query_index = commits_periodical.query.QueryIndex(project_dirname)
+    query_index.update(index)
+    bob = [c.githash for c in conftest.REPORT_COMMITS[3:5]]
+    assert sorted(query_index.query(["author:Bob B"])) == bob
+
+    # A new index reads the saved records, without the reports
+    query_index = commits_periodical.query.QueryIndex(project_dirname)
+    assert sorted(query_index.query(["author:Bob B"])) == bob
+    assert sorted(query_index.query(["path:usr.bin/grep"])) == [
+        conftest.HASHES[1],
+        conftest.HASHES[12],
+    ]
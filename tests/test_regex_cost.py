@@ -0,0 +1,43 @@
+import pytest
+
+import commits_periodical.regex_cost
+
+get_cost_problem = commits_periodical.regex_cost.get_cost_problem
+
+
+@pytest.mark.parametrize(
+    "pattern, use_func, problem",
+    [
+        (r"(a+)+$", "match", "nested quantifiers"),
+        (r"(\w+\s?)*$", "match", "nested quantifiers"),
+        (r"(a*)*b", "match", "nested quantifiers"),
+        # The inner repeat isn't at the end of the body
+        (r"(.*,)*x", "match", "nested quantifiers"),
+        (r"(a|aa)*b", "match", "overlapping alternatives"),
+        (r".*a.*b", "search", "overlapping repeats when searching"),
+    ],
+)
+def test_bad_patterns(pattern, use_func, problem):
+    assert get_cost_problem(pattern, use_func) == problem
+
+
+@pytest.mark.parametrize(
+    "pattern, use_func",
+    [
+        (r"[tT]ypo", "search"),
+        (r"sys/dev/", "match"),
+        (r".*\.[1-9]", "search"),
+        (r"[a-z]+_[0-9]+", "search"),
+        (r"(a+b)*", "match"),
+        (r"(ab|ac)", "match"),
+        # Only quadratic, since re.match() only tries the start
+        (r".*a.*b", "match"),
+    ],
+)
+def test_good_patterns(pattern, use_func):
+    assert get_cost_problem(pattern, use_func) is None
+
+
+def test_project_patterns(project, capsys):
+    assert commits_periodical.regex_cost.check_regex_cost(project)
+    assert capsys.readouterr().out == ""
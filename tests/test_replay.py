@@ -0,0 +1,49 @@
+import os.path
+
+import pytest
+
+import commits_periodical.data
+import commits_periodical.replay
+
+
+def replay(action, project_dirname, dirname):
+    index = commits_periodical.data.Index(project_dirname)
+    commits_periodical.replay.replay(action, dirname, project_dirname, index)
+
+
+def test_replay(project_dirname, tmp_path, capsys):
+    dirname = str(tmp_path / "replay")
+    replay("record", project_dirname, dirname)
+    replay("check", project_dirname, dirname)
+    assert "match the golden files" in capsys.readouterr().out
+
+    # Changes to the live project aren't replayed
+    with open(os.path.join(project_dirname, "2025-01-13.toml"), "a") as fp:
+        fp.write(f"[{'f' * 40}]\n")
+    with open(os.path.join(project_dirname, "classify.toml"), "a") as fp:
+        fp.write("[broken\n")
+    replay("check", project_dirname, dirname)
+
+    golden_filename = os.path.join(dirname, "golden", "2025-01-06.toml")
+    with open(golden_filename, "a") as fp:
+        fp.write("\n")
+    capsys.readouterr()
+    with pytest.raises(SystemExit):
+        replay("check", project_dirname, dirname)
+    assert "Differs: 2025-01-06.toml" in capsys.readouterr().out
+
+
+def test_replay_classify_error(project_dirname, tmp_path, capsys):
+    dirname = str(tmp_path / "replay")
+    replay("record", project_dirname, dirname)
+
+    # A commit which wasn't recorded
+    report_filename = os.path.join(dirname, "fixtures", "2025-01-06.toml")
+    with open(report_filename, "a") as fp:
+        fp.write(f"[{'e' * 40}]\n")
+    capsys.readouterr()
+    with pytest.raises(SystemExit):
+        replay("check", project_dirname, dirname)
+    out = capsys.readouterr().out
+    assert "Error in 2025-01-06.toml:" in out
+    assert "Not in the golden files: 2025-01-06.toml.error" in out
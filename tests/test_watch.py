@@ -0,0 +1,26 @@
+import os.path
+
+import commits_periodical.data
+import commits_periodical.project
+import commits_periodical.watch
+
+import conftest
+
+
+def test_update_ongoing(git_project):
+    project_dirname, git_dirname, hashes = git_project
+    project = commits_periodical.project.Project(project_dirname, git_dirname)
+    commits_periodical.watch.update_ongoing(project)
+    githash = conftest.add_git_commit(
+        git_dirname, "sys/netinet/udp.c", "udp: 7"
+    )
+    commits_periodical.watch.update_ongoing(project)
+
+    index = commits_periodical.data.Index(project_dirname)
+    entry = index.get_index_entry("2025-01-13")
+    assert entry["end_including"] == githash
+    doc = commits_periodical.data.Report(index.get_filename("2025-01-13"))
+    assert list(doc.get_hashes()) == hashes[4:] + [githash]
+    assert doc.get_entry(githash).cat == "network"
+    out_dirname = project_dirname.replace("projects", "out")
+    assert os.path.exists(os.path.join(out_dirname, "2025-01-13-debug.html"))